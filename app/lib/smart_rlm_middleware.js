@@ -14,6 +14,9 @@ const RLM_MODEL = process.env.RLM_MODEL || 'qwen3:4b';
 const RLM_CONFIDENCE_THRESHOLD = parseFloat(process.env.RLM_CONFIDENCE_THRESHOLD) || 0.90;
 const GH_OWNER = process.env.GH_OWNER;
 const GH_REPO = process.env.GH_REPO;
+// Se definido (ex: http://127.0.0.1:8765), usa o servidor persistente
+// rlm/smart_rlm_server.py em vez de disparar um workflow por mensagem
+const RLM_SERVER_URL = process.env.RLM_SERVER_URL;
 
 /**
  * Middleware SmartRLM
@@ -32,6 +35,12 @@ export async function applySmartRLM(userId, mensagem, historicoContexto = '') {
 
   try {
     console.log(`[SmartRLM] Processing message from user ${userId}: "${mensagem.substring(0, 50)}..."`);
+
+    if (RLM_SERVER_URL) {
+      const resultado = await chamarServidorRLM(mensagem, historicoContexto, 300);
+      console.log(`[SmartRLM] Modo: ${resultado.modo} | Confianca: ${(resultado.confianca * 100).toFixed(0)}% | Tempo: ${resultado.tempo_ms}ms`);
+      return resultado;
+    }
     
     // Salvar historico em arquivo temporario
     const historicoPath = await salvarHistoricoTemporario(userId, historicoContexto);
@@ -65,6 +74,31 @@ export async function applySmartRLM(userId, mensagem, historicoContexto = '') {
   }
 }
 
+/**
+ * Chamar o servidor SmartRLM persistente (sem spawn nem polling)
+ * RLM_MODEL e RLM_CONFIDENCE_THRESHOLD vao no pedido, como no workflow;
+ * o servidor os aplica so a este pedido (os dele continuam o padrao)
+ */
+async function chamarServidorRLM(tarefa, contexto, timeoutSec = 300) {
+  const response = await fetch(`${RLM_SERVER_URL}/chat`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({
+      tarefa,
+      contexto,
+      modelo: RLM_MODEL,
+      confianca: RLM_CONFIDENCE_THRESHOLD
+    }),
+    signal: AbortSignal.timeout(timeoutSec * 1000)
+  });
+
+  if (!response.ok) {
+    throw new Error(`SmartRLM server respondeu ${response.status}`);
+  }
+
+  return response.json();
+}
+
 /**
  * Salvar historico em arquivo temporario
  */
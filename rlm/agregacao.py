@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Agregacao hierarquica (tree reduction) dos resultados das sub-tarefas
+
+Se os resultados cabem no prompt de agregacao, nada muda: uma chamada so.
+Se nao cabem, em vez de cortar cada resultado (res[:limite]), junta-os em
+grupos consecutivos que cabem no orcamento de tokens, sintetiza cada grupo
+(todos os grupos de um nivel em paralelo) e repete com as sinteses ate
+caber. Cada grupo tem pelo menos 2 itens, entao cada nivel ao menos divide
+o numero de itens por 2: sao no maximo ~log2(n) niveis.
+
+Os itens sao (rotulo, texto, (primeiro, ultimo)), com os indices (base 1)
+dos resultados originais que o item cobre.
+"""
+
+# Formatacao de um item no prompt: "\n[i] rotulo\n    -> texto\n"
+_OVERHEAD_ITEM = 16
+
+MARCADOR_CORTE = ' [...]'
+
+
+def tamanho(item: tuple) -> int:
+    rotulo, texto, _ = item
+    return len(rotulo) + len(texto) + _OVERHEAD_ITEM
+
+
+def cortar(texto: str, limite: int) -> str:
+    """Corta o texto em `limite` chars, marcando o corte."""
+    if len(texto) <= limite:
+        return texto
+    return texto[:max(0, limite - len(MARCADOR_CORTE))] + MARCADOR_CORTE
+
+
+def agrupar_por_orcamento(itens: list, orcamento: int) -> list:
+    """
+    Grupos consecutivos com soma de tamanhos <= orcamento (um grupo so
+    fecha com 2+ itens; um item que sobra sozinho no fim passa direto).
+    """
+    grupos, atual, usado = [], [], 0
+    for item in itens:
+        t = tamanho(item)
+        if len(atual) >= 2 and usado + t > orcamento:
+            grupos.append(atual)
+            atual, usado = [], 0
+        atual.append(item)
+        usado += t
+    if atual:
+        grupos.append(atual)
+    return grupos
+
+
+def rotulo_grupo(grupo: list) -> str:
+    primeiro, ultimo = grupo[0][2][0], grupo[-1][2][1]
+    return f"Sintese dos resultados {primeiro}-{ultimo}"
+
+
+def reduzir_em_arvore(rotulos: list, textos: list, sintetizar, parallel_map,
+                      orcamento: int) -> tuple:
+    """
+    Reduz os resultados ate caberem em `orcamento` chars.
+
+    Args:
+        rotulos / textos: sub-tarefas e seus resultados (mesma ordem)
+        sintetizar(grupo) -> str: uma chamada ao LLM para um grupo de itens
+        parallel_map(fn, itens) -> list  (mantem a ordem)
+        orcamento: chars disponiveis para os itens no prompt
+
+    Returns:
+        (rotulos, textos) prontos para o prompt de agregacao final
+    """
+    # Metade do orcamento por item garante que quaisquer 2 itens cabem juntos
+    por_item = max(1, orcamento // 2)
+    itens = [
+        (rotulo, cortar(texto, por_item), (i, i))
+        for i, (rotulo, texto) in enumerate(zip(rotulos, textos), 1)
+    ]
+
+    def _reduzir(grupo):
+        if len(grupo) == 1:
+            return grupo[0]
+        return (rotulo_grupo(grupo), cortar(sintetizar(grupo), por_item), (grupo[0][2][0], grupo[-1][2][1]))
+
+    nivel = 0
+    while len(itens) > 1 and sum(tamanho(item) for item in itens) > orcamento:
+        nivel += 1
+        grupos = agrupar_por_orcamento(itens, orcamento)
+        print(f"[Agregacao] Nivel {nivel}: {len(itens)} resultado(s) -> {len(grupos)} grupo(s)")
+        itens = parallel_map(_reduzir, grupos)
+
+    return [item[0] for item in itens], [item[1] for item in itens]
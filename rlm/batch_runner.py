@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Processamento em lote (JSONL)
+
+Roda muitas tarefas num processo so, sem pagar o startup do interpretador
+e do cliente Ollama por tarefa. Cada linha de entrada e um pedido:
+
+    {"id": "u123", "tarefa": "Resuma o historico", "contexto_arquivo": "rlm/contextos/u123_historico.txt"}
+    {"tarefa": "Oi", "contexto": "texto direto"}
+
+e cada linha de saida e {"id": ..., "resposta": ..., ...} (ou "erro").
+
+- pool limitado de workers, e no maximo 2x workers pedidos lidos a frente
+  (a entrada pode ser um stdin sem fim)
+- pedidos iguais (tarefa + contexto) rodam uma vez so; prompts iguais entre
+  pedidos diferentes (ex: a mesma sub-tarefa) tambem, via Deduplicador
+- a propria saida e o checkpoint: com --retomar, ids ja gravados sao pulados
+"""
+
+import os
+import sys
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from contextlib import contextmanager, redirect_stdout
+
+from bm25_index import fingerprint
+from context_source import ContextSource
+
+
+# ============= CONFIGURACAO =============
+batch_workers_padrao = int(os.environ.get('RLM_BATCH_WORKERS', '2'))
+
+
+class Deduplicador:
+    """
+    Chamadas com a mesma chave rodam uma vez: quem chega durante a
+    execucao espera o resultado, quem chega depois reaproveita (LRU).
+    Erros nao ficam memorizados.
+    """
+
+    def __init__(self, max_itens: int = 4096):
+        self.max_itens = max_itens
+        self.reaproveitados = 0
+        self._futuros = OrderedDict()
+        self._lock = threading.Lock()
+
+    def executar(self, chave: str, fn):
+        with self._lock:
+            futuro = self._futuros.get(chave)
+            dono = futuro is None
+            if dono:
+                futuro = Future()
+                self._futuros[chave] = futuro
+                while len(self._futuros) > self.max_itens:
+                    self._futuros.popitem(last=False)
+            else:
+                self._futuros.move_to_end(chave)
+                self.reaproveitados += 1
+
+        if not dono:
+            return futuro.result()
+
+        try:
+            resultado = fn()
+        except BaseException as e:
+            with self._lock:
+                if self._futuros.get(chave) is futuro:
+                    del self._futuros[chave]
+            futuro.set_exception(e)
+            raise
+        futuro.set_result(resultado)
+        return resultado
+
+
+# ============= ENTRADA / CHECKPOINT =============
+
+def ler_pedidos(origem: str):
+    """Gera (id, pedido) de um arquivo JSONL ou de '-' (stdin)."""
+    f = sys.stdin if origem == '-' else open(origem, 'r', encoding='utf-8')
+    try:
+        for n, linha in enumerate(f, 1):
+            linha = linha.strip()
+            if not linha:
+                continue
+            try:
+                pedido = json.loads(linha)
+            except ValueError as e:
+                print(f"[Batch] Linha {n} ignorada (JSON invalido): {e}", file=sys.stderr)
+                continue
+            if isinstance(pedido, str):
+                pedido = {'tarefa': pedido}
+            yield str(pedido.get('id', n)), pedido
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def chave_pedido(pedido: dict) -> str:
+    """Pedidos com a mesma tarefa e o mesmo contexto tem a mesma chave."""
+    if pedido.get('contexto_arquivo'):
+        contexto = 'arquivo:' + os.path.abspath(pedido['contexto_arquivo'])
+    else:
+        contexto = fingerprint(pedido.get('contexto') or '')
+    bruto = json.dumps([pedido.get('tarefa', ''), contexto], ensure_ascii=False)
+    return hashlib.sha256(bruto.encode('utf-8')).hexdigest()
+
+
+@contextmanager
+def abrir_contexto(pedido: dict):
+    """Contexto do pedido: texto direto ou arquivo (mmap)."""
+    if pedido.get('contexto_arquivo'):
+        # Historico com entradas ainda no segmento .log: compacta antes do mmap
+        from context_manager import compactar_pendente
+        compactar_pendente(pedido['contexto_arquivo'])
+        with ContextSource(pedido['contexto_arquivo']) as contexto:
+            yield contexto
+    else:
+        yield pedido.get('contexto') or ''
+
+
+def ids_concluidos(saida: str) -> set:
+    """
+    Ids ja gravados na saida (checkpoint). Se o processo morreu no meio de
+    uma linha, corta a linha incompleta para o append continuar valido.
+    """
+    ids = set()
+    if not os.path.exists(saida):
+        return ids
+    with open(saida, 'rb+') as f:
+        valido = 0
+        for linha in f:
+            if not linha.endswith(b'\n'):
+                break
+            valido += len(linha)
+            try:
+                ids.add(str(json.loads(linha)['id']))
+            except (ValueError, KeyError):
+                pass
+        f.truncate(valido)
+    return ids
+
+
+# ============= EXECUCAO =============
+
+def executar_lote(pedidos, processar, workers: int, pular=(), stats: dict = None):
+    """
+    Roda processar(pedido) -> dict para cada (id, pedido), com no maximo
+    `workers` em paralelo. Gera (id, resultado) conforme terminam (fora de
+    ordem). Pedidos com a mesma chave_pedido compartilham a execucao.
+    """
+    stats = stats if stats is not None else {}
+    for campo in ('concluidos', 'duplicados', 'pulados', 'erros'):
+        stats.setdefault(campo, 0)
+
+    workers = max(1, workers)
+    por_chave = {}
+    pendentes = []
+
+    def _separar(pendentes):
+        prontos = [(i, f) for i, f in pendentes if f.done()]
+        return prontos, [(i, f) for i, f in pendentes if not f.done()]
+
+    def _resultado(futuro):
+        try:
+            return futuro.result()
+        except Exception as e:
+            stats['erros'] += 1
+            return {'erro': f"{type(e).__name__}: {e}"}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for id_, pedido in pedidos:
+            if id_ in pular:
+                stats['pulados'] += 1
+                continue
+
+            chave = chave_pedido(pedido)
+            futuro = por_chave.get(chave)
+            if futuro is None:
+                futuro = executor.submit(processar, pedido)
+                por_chave[chave] = futuro
+            else:
+                stats['duplicados'] += 1
+            pendentes.append((id_, futuro))
+
+            # Nao le a entrada muito a frente do que esta rodando
+            rodando = {f for _, f in pendentes if not f.done()}
+            if len(rodando) >= 2 * workers:
+                wait(rodando, return_when=FIRST_COMPLETED)
+
+            prontos, pendentes = _separar(pendentes)
+            for id_pronto, f in prontos:
+                stats['concluidos'] += 1
+                yield id_pronto, _resultado(f)
+
+        while pendentes:
+            wait({f for _, f in pendentes}, return_when=FIRST_COMPLETED)
+            prontos, pendentes = _separar(pendentes)
+            for id_pronto, f in prontos:
+                stats['concluidos'] += 1
+                yield id_pronto, _resultado(f)
+
+
+def processar_jsonl(rlm, entrada: str, saida: str = '-', workers: int = None,
+                    retomar: bool = False) -> dict:
+    """
+    Modo --batch-jsonl dos CLIs: le pedidos de `entrada`, grava uma linha
+    JSONL por resultado em `saida` (flush a cada linha). Os logs do
+    pipeline vao para stderr para nao misturar com o JSONL.
+    """
+    pular = ids_concluidos(saida) if retomar and saida != '-' else set()
+    destino = sys.stdout if saida == '-' else open(saida, 'a' if retomar else 'w', encoding='utf-8')
+    stats = {}
+
+    try:
+        with redirect_stdout(sys.stderr):
+            resultados = rlm.chat_completion_batch_stream(
+                ler_pedidos(entrada), max_workers=workers, pular=pular, stats=stats
+            )
+            for id_, resultado in resultados:
+                destino.write(json.dumps({'id': id_, **resultado}, ensure_ascii=False) + '\n')
+                destino.flush()
+    finally:
+        if destino is not sys.stdout:
+            destino.close()
+
+    print(
+        f"[Batch] {stats.get('concluidos', 0)} concluido(s), {stats.get('duplicados', 0)} duplicado(s), "
+        f"{stats.get('pulados', 0)} pulado(s) pelo checkpoint, {stats.get('erros', 0)} erro(s), "
+        f"{stats.get('prompts_reaproveitados', 0)} prompt(s) reaproveitado(s)",
+        file=sys.stderr
+    )
+    return stats
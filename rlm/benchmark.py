@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark offline do RLM (sem GPU, sem Ollama)
+
+Sobe um Fake Ollama numa thread (latencia por token, custo de prompt eval,
+taxa de falha e roteiro de respostas configuraveis) e roda cenarios
+repetiveis sobre OllamaRLM, SmartRLM e ContextoManager:
+
+    pergunta_curta         SmartRLM, fast path
+    pergunta_complexa      SmartRLM, fast path incerto -> pipeline completo
+    especulativo           pergunta_complexa com fast path e split em paralelo
+    contexto_grande        OllamaRLM recursivo sobre um log de 2 MB (mmap)
+    lote                   SmartRLM.chat_completion_batch com pedidos repetidos
+    usuarios_concorrentes  8 threads usando a mesma instancia de SmartRLM
+    historico              ContextoManager: append + carregar ultimas N
+
+Para cada cenario: p50/p95/p99 de latencia, throughput, chamadas ao LLM,
+falhas e pico de memoria Python (tracemalloc). O resultado e comparado com
+a baseline em rlm/benchmarks/baseline.json usando os limites gravados nela;
+qualquer regressao sai com codigo 1 (para usar no CI).
+
+Uso:
+    python rlm/benchmark.py                         # roda e compara
+    python rlm/benchmark.py --salvar-baseline       # grava nova baseline
+    python rlm/benchmark.py --cenarios lote,historico --repeticoes 5
+"""
+
+import io
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from datetime import datetime
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+
+from ollama import Client
+
+import fake_ollama
+import rlm_ollama
+import smart_rlm
+from rlm_ollama import OllamaRLM
+from smart_rlm import SmartRLM
+from context_manager import ContextoManager
+from context_source import ContextSource
+
+
+# ============= CONFIGURACAO =============
+baseline_padrao = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'baseline.json')
+
+# Quanto cada metrica pode piorar em relacao a baseline. `folga` e uma
+# diferenca absoluta abaixo da qual nao conta como regressao (ruido).
+LIMITES_PADRAO = {
+    'p95_ms': {'max': 1.30, 'folga': 5.0},
+    'p99_ms': {'max': 1.50, 'folga': 10.0},
+    'throughput_ops_s': {'min': 0.75},
+    'chamadas_llm': {'max': 1.0, 'folga': 0},
+    'pico_memoria_mb': {'max': 1.50, 'folga': 1.0},
+}
+
+PERGUNTA_CURTA = "Quanto e dois mais dois?"
+PERGUNTA_COMPLEXA = "Quais servicos tiveram as requisicoes mais lentas e por que isso aconteceu?"
+
+
+class Ambiente:
+    """Fake Ollama + diretorio temporario compartilhados pelos cenarios."""
+
+    def __init__(self, args):
+        self.repeticoes = args.repeticoes
+        self.server = fake_ollama.criar_servidor(
+            latencia_token=args.latencia_token,
+            latencia_prompt=args.latencia_prompt,
+            slots=4,
+            taxa_falha=args.taxa_falha,
+            seed=args.seed,
+            responder=fake_ollama.carregar_roteiro(args.roteiro) if args.roteiro else None,
+        )
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+        cliente = Client(host=host)
+        rlm_ollama.cliente_ollama = cliente
+        smart_rlm.cliente_ollama = cliente
+
+        self._tmp = tempfile.TemporaryDirectory(prefix='rlm_bench_')
+        self.dir = self._tmp.name
+
+    def log_sintetico(self, nome: str, tamanho: int) -> str:
+        """Log deterministico de ~`tamanho` bytes no diretorio temporario."""
+        path = os.path.join(self.dir, nome)
+        if not os.path.exists(path):
+            rnd = random.Random(42)
+            with open(path, 'w', encoding='utf-8') as f:
+                escrito, i = 0, 0
+                while escrito < tamanho:
+                    linha = (f"2026-02-{rnd.randint(1, 28):02d} {rnd.choice(['INFO', 'WARN', 'ERROR'])} "
+                             f"servico-{rnd.randint(1, 9)} requisicao {i} em {rnd.randint(5, 900)}ms\n")
+                    f.write(linha)
+                    escrito += len(linha)
+                    i += 1
+        return path
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self._tmp.cleanup()
+
+
+# ============= CENARIOS =============
+# Cada cenario recebe o Ambiente e retorna a lista de latencias (s) por operacao.
+
+def _cronometrar(fn, *args):
+    inicio = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - inicio
+
+
+def cenario_pergunta_curta(amb: Ambiente) -> list:
+    rlm = SmartRLM(usar_cache=False, usar_roteador=False)
+    return [_cronometrar(rlm.chat_completion, PERGUNTA_CURTA, "") for _ in range(amb.repeticoes * 4)]
+
+
+def cenario_pergunta_complexa(amb: Ambiente) -> list:
+    rlm = SmartRLM(usar_cache=False, usar_roteador=False, max_concurrency=2)
+    with open(amb.log_sintetico('pequeno.log', 4000), 'r', encoding='utf-8') as f:
+        contexto = f.read()
+    return [_cronometrar(rlm.chat_completion, PERGUNTA_COMPLEXA, contexto) for _ in range(amb.repeticoes)]
+
+
+def cenario_especulativo(amb: Ambiente) -> list:
+    rlm = SmartRLM(usar_cache=False, usar_roteador=False, max_concurrency=2, especulativo=True)
+    with open(amb.log_sintetico('pequeno.log', 4000), 'r', encoding='utf-8') as f:
+        contexto = f.read()
+    return [_cronometrar(rlm.chat_completion, PERGUNTA_COMPLEXA, contexto) for _ in range(amb.repeticoes)]
+
+
+def cenario_contexto_grande(amb: Ambiente) -> list:
+    rlm = OllamaRLM(usar_cache=False, max_concurrency=4, recursivo=True)
+    latencias = []
+    with ContextSource(amb.log_sintetico('grande.log', 2 * 1024 * 1024)) as contexto:
+        for _ in range(max(1, amb.repeticoes // 5)):
+            latencias.append(_cronometrar(rlm.chat_completion, PERGUNTA_COMPLEXA, contexto))
+    return latencias
+
+
+def cenario_lote(amb: Ambiente) -> list:
+    rlm = SmartRLM(usar_cache=False, usar_roteador=False)
+    contexto = amb.log_sintetico('pequeno.log', 4000)
+    pedidos = [
+        {'tarefa': f"{PERGUNTA_COMPLEXA} Usuario {i % 10}", 'contexto_arquivo': contexto}
+        for i in range(amb.repeticoes * 3)
+    ]
+    resultados = rlm.chat_completion_batch(pedidos, max_workers=4)
+    return [r.get('tempo_ms', 0) / 1000 for r in resultados]
+
+
+def cenario_usuarios_concorrentes(amb: Ambiente) -> list:
+    rlm = SmartRLM(usar_cache=False, usar_roteador=False)
+    perguntas = [PERGUNTA_CURTA if i % 2 else f"{PERGUNTA_COMPLEXA} ({i})" for i in range(amb.repeticoes * 4)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        return list(executor.map(lambda p: _cronometrar(rlm.chat_completion, p, ""), perguntas))
+
+
+def cenario_historico(amb: Ambiente) -> list:
+    manager = ContextoManager(os.path.join(amb.dir, 'contextos'), compactar_bytes=16 * 1024)
+    latencias = []
+    for i in range(amb.repeticoes * 50):
+        user_id = f"usuario_{i % 10}"
+        latencias.append(_cronometrar(manager.append_historico, user_id, f"mensagem {i} " + "x" * 200))
+        if i % 10 == 0:
+            latencias.append(_cronometrar(manager.carregar_historico, user_id, 20))
+    return latencias
+
+
+CENARIOS = {
+    'pergunta_curta': cenario_pergunta_curta,
+    'pergunta_complexa': cenario_pergunta_complexa,
+    'especulativo': cenario_especulativo,
+    'contexto_grande': cenario_contexto_grande,
+    'lote': cenario_lote,
+    'usuarios_concorrentes': cenario_usuarios_concorrentes,
+    'historico': cenario_historico,
+}
+
+
+# ============= MEDICAO =============
+
+def percentil(valores: list, p: float) -> float:
+    """Percentil por nearest-rank."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def medir(nome: str, amb: Ambiente) -> dict:
+    chamadas = amb.server.generate_calls
+    falhas = amb.server.falhas
+
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        latencias = CENARIOS[nome](amb)
+    total = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'ops': len(latencias),
+        'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+        'p95_ms': round(percentil(latencias, 95) * 1000, 2),
+        'p99_ms': round(percentil(latencias, 99) * 1000, 2),
+        'throughput_ops_s': round(len(latencias) / total, 2) if total else 0.0,
+        'chamadas_llm': amb.server.generate_calls - chamadas,
+        'falhas_llm': amb.server.falhas - falhas,
+        'pico_memoria_mb': round(pico / 1e6, 2),
+    }
+
+
+def comparar(resultados: dict, baseline: dict) -> list:
+    """Lista de regressoes (texto) em relacao a baseline."""
+    limites = baseline.get('limites', LIMITES_PADRAO)
+    regressoes = []
+    for nome, atual in resultados.items():
+        anterior = baseline.get('cenarios', {}).get(nome)
+        if anterior is None:
+            continue
+        for metrica, limite in limites.items():
+            base, valor = anterior.get(metrica), atual.get(metrica)
+            if base is None or valor is None:
+                continue
+            folga = limite.get('folga', 0)
+            if 'max' in limite and valor > base * limite['max'] and valor - base > folga:
+                regressoes.append(f"{nome}.{metrica}: {valor} > {base} x {limite['max']}")
+            if 'min' in limite and valor < base * limite['min']:
+                regressoes.append(f"{nome}.{metrica}: {valor} < {base} x {limite['min']}")
+    return regressoes
+
+
+def imprimir_tabela(resultados: dict):
+    print(f"\n{'cenario':<24}{'ops':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'ops/s':>9}{'LLM':>7}{'falhas':>8}{'pico MB':>9}")
+    print("-" * 93)
+    for nome, r in resultados.items():
+        print(f"{nome:<24}{r['ops']:>6}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['throughput_ops_s']:>9}{r['chamadas_llm']:>7}{r['falhas_llm']:>8}{r['pico_memoria_mb']:>9}")
+    print()
+
+
+# ============= CLI =============
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark offline do RLM com Fake Ollama"
+    )
+    parser.add_argument("--cenarios", default=",".join(CENARIOS), help="Lista separada por virgula")
+    parser.add_argument("--repeticoes", type=int, default=10, help="Escala do numero de operacoes por cenario")
+    parser.add_argument("--latencia-token", type=float, default=0.002, help="Segundos por token gerado")
+    parser.add_argument("--latencia-prompt", type=float, default=0.00002, help="Segundos por token de prompt avaliado")
+    parser.add_argument("--taxa-falha", type=float, default=0.0, help="Fracao de generates com HTTP 500")
+    parser.add_argument("--roteiro", default=None, help="JSON com regras de resposta [{contem, resposta}]")
+    parser.add_argument("--seed", type=int, default=0, help="Seed das falhas simuladas")
+    parser.add_argument("--baseline", default=baseline_padrao, help="Arquivo da baseline")
+    parser.add_argument("--salvar-baseline", action="store_true", help="Grava o resultado como nova baseline")
+    parser.add_argument("--json", action="store_true", help="Imprime o resultado em JSON")
+    args = parser.parse_args()
+
+    nomes = [n.strip() for n in args.cenarios.split(",") if n.strip()]
+    desconhecidos = [n for n in nomes if n not in CENARIOS]
+    if desconhecidos:
+        parser.error(f"cenario(s) desconhecido(s): {', '.join(desconhecidos)}")
+
+    amb = Ambiente(args)
+    resultados = {}
+    try:
+        for nome in nomes:
+            print(f"[Bench] {nome}...", file=sys.stderr)
+            resultados[nome] = medir(nome, amb)
+    finally:
+        amb.close()
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+    else:
+        imprimir_tabela(resultados)
+
+    config = {
+        'repeticoes': args.repeticoes,
+        'latencia_token': args.latencia_token,
+        'latencia_prompt': args.latencia_prompt,
+        'taxa_falha': args.taxa_falha,
+    }
+
+    if args.salvar_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                'gerado_em': datetime.now().isoformat(timespec='seconds'),
+                'config': config,
+                'limites': LIMITES_PADRAO,
+                'cenarios': resultados,
+            }, f, indent=2)
+            f.write('\n')
+        print(f"✓ Baseline salva: {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"[!] Sem baseline em {args.baseline} (use --salvar-baseline)")
+        sys.exit(0)
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('config') != config:
+        print(f"[!] Config diferente da baseline ({baseline.get('config')}); comparando mesmo assim")
+
+    regressoes = comparar(resultados, baseline)
+    if regressoes:
+        print("❌ Regressoes em relacao a baseline:")
+        for r in regressoes:
+            print(f"   {r}")
+        sys.exit(1)
+    print("✓ Sem regressoes em relacao a baseline")
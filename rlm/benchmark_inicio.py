@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de startup das CLIs (tempo de import com -X importtime)
+
+O middleware chama as CLIs uma vez por pedido em containers de vida
+curta; o startup pesa tanto quanto a resposta em pedidos curtos. Para cada
+alvo, roda um processo Python novo N vezes e mede:
+
+    import_ms   tempo de import do modulo (soma do -X importtime)
+    total_ms    wall time do processo (interpretador + import + execucao)
+
+Falha (codigo 1, para o CI) se a mediana do import passar do orcamento
+ou se um modulo pesado (ollama, httpx, pydantic) for carregado no
+startup: eles so devem entrar na primeira chamada ao Ollama.
+
+Uso:
+    python rlm/benchmark_inicio.py                      # orcamento padrao
+    python rlm/benchmark_inicio.py --orcamento-ms 100 --repeticoes 10
+    python rlm/benchmark_inicio.py --detalhar 15        # imports mais caros
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+
+# ============= CONFIGURACAO =============
+orcamento_padrao = float(os.environ.get('RLM_IMPORT_BUDGET_MS', '150'))
+
+DIR_RLM = os.path.dirname(os.path.abspath(__file__))
+
+# Nome -> (argumentos do python, modulo cujo import e medido)
+ALVOS = {
+    'import smart_rlm': (['-c', 'import smart_rlm'], 'smart_rlm'),
+    'import rlm_ollama': (['-c', 'import rlm_ollama'], 'rlm_ollama'),
+    'smart_rlm.py --help': (['smart_rlm.py', '--help'], '__main__'),
+    'cli.py smart --help': (['cli.py', 'smart', '--help'], '__main__'),
+}
+
+# Nao podem aparecer no startup (so na primeira chamada ao Ollama)
+PROIBIDOS = ('ollama', 'httpx', 'pydantic')
+
+
+def ler_importtime(stderr: str) -> list:
+    """Linhas do -X importtime -> [(modulo, proprio_us, acumulado_us, nivel)]."""
+    imports = []
+    for linha in stderr.splitlines():
+        if not linha.startswith('import time:') or 'self [us]' in linha:
+            continue
+        proprio, acumulado, nome = linha[len('import time:'):].split('|', 2)
+        nivel = (len(nome) - len(nome.lstrip())) // 2
+        imports.append((nome.strip(), int(proprio), int(acumulado), nivel))
+    return imports
+
+
+def medir(argv: list, modulo: str, repeticoes: int) -> dict:
+    """Roda o alvo `repeticoes` vezes num processo novo."""
+    imports_ms, totais_ms, ultimo = [], [], []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', *argv],
+            cwd=DIR_RLM, capture_output=True, text=True
+        )
+        totais_ms.append((time.perf_counter() - inicio) * 1000)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{' '.join(argv)} saiu com {proc.returncode}: {proc.stderr[-500:]}")
+        ultimo = ler_importtime(proc.stderr)
+        # Modulos do projeto no topo (nivel 0) + o proprio alvo
+        if modulo == '__main__':
+            imports_ms.append(sum(acum for nome, _, acum, nivel in ultimo
+                                  if nivel == 0 and nome not in _BASE) / 1000)
+        else:
+            imports_ms.append(next(acum for nome, _, acum, _n in ultimo if nome == modulo) / 1000)
+    carregados = {nome for nome, _, _, _ in ultimo}
+    return {
+        'import_ms': statistics.median(imports_ms),
+        'total_ms': statistics.median(totais_ms),
+        'proibidos': sorted(p for p in PROIBIDOS if p in carregados),
+        'imports': ultimo,
+    }
+
+
+# Modulos que o interpretador carrega antes de qualquer codigo do projeto
+_BASE = set()
+
+
+def _carregar_base():
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'pass'],
+                          cwd=DIR_RLM, capture_output=True, text=True)
+    _BASE.update(nome for nome, _, _, nivel in ler_importtime(proc.stderr) if nivel == 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de startup das CLIs do RLM")
+    parser.add_argument("--orcamento-ms", type=float, default=orcamento_padrao,
+                        help="Import maximo por alvo em ms (padrao: RLM_IMPORT_BUDGET_MS ou 150)")
+    parser.add_argument("--repeticoes", type=int, default=5, help="Processos por alvo (mediana)")
+    parser.add_argument("--detalhar", type=int, default=0, help="Mostra os N imports mais caros de cada alvo")
+    args = parser.parse_args()
+
+    _carregar_base()
+    falhas = []
+    print(f"{'alvo':<24}{'import ms':>12}{'total ms':>12}")
+    print('-' * 48)
+    for nome, (argv, modulo) in ALVOS.items():
+        r = medir(argv, modulo, args.repeticoes)
+        print(f"{nome:<24}{r['import_ms']:>12.1f}{r['total_ms']:>12.1f}")
+        if r['import_ms'] > args.orcamento_ms:
+            falhas.append(f"{nome}: import {r['import_ms']:.1f}ms > orcamento {args.orcamento_ms:.0f}ms")
+        if r['proibidos']:
+            falhas.append(f"{nome}: importa {', '.join(r['proibidos'])} no startup")
+        if args.detalhar:
+            caros = sorted(r['imports'], key=lambda i: i[1], reverse=True)[:args.detalhar]
+            for modulo_caro, proprio, _, _ in caros:
+                print(f"    {modulo_caro:<36}{proprio / 1000:>8.1f}ms")
+
+    print()
+    if falhas:
+        print("❌ Startup acima do orcamento:")
+        for falha in falhas:
+            print(f"   - {falha}")
+        sys.exit(1)
+    print(f"✓ Startup dentro do orcamento ({args.orcamento_ms:.0f}ms de import por alvo)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Indice BM25 sobre trechos do contexto
+
+Divide o contexto em trechos, monta um indice invertido em memoria e
+devolve, para cada sub-tarefa, so os trechos mais relevantes dentro de
+um orcamento de caracteres. Prompt menor = prompt eval mais rapido.
+
+Os indices ficam em cache por fingerprint do contexto (LRU em memoria +
+JSON em disco), entao perguntas repetidas sobre o mesmo historico de
+rlm/contextos/ nao re-indexam.
+
+Contextos maiores que RLM_BM25_MEMORIA_MAX_MB (tipicamente um
+ContextSource via mmap) nao passam pelo indice em memoria: as postings
+vao para um SQLite em disco em lotes de LOTE_TRECHOS trechos e a busca
+le so as listas dos termos da consulta, entao o RSS fica limitado como
+no resto do pipeline.
+"""
+
+import os
+import re
+import json
+import math
+import hashlib
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+from map_reduce import cortar_em_linha
+
+
+# ============= CONFIGURACAO =============
+bm25_cache_dir_padrao = os.environ.get('RLM_BM25_CACHE_DIR', 'rlm/cache/bm25')
+bm25_max_memoria = 8
+# Acima disso (chars) o indice e construido e consultado em SQLite
+bm25_memoria_max_chars = int(float(os.environ.get('RLM_BM25_MEMORIA_MAX_MB', '16')) * 1024 * 1024)
+# Trechos tokenizados por lote gravado no indice em disco
+LOTE_TRECHOS = 512
+
+K1 = 1.5
+B = 0.75
+
+_RE_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenizar(texto: str) -> list:
+    """Minusculas, sem acentos, so palavras com 2+ caracteres."""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in _RE_TOKEN.findall(texto) if len(t) > 1]
+
+
+def fingerprint(texto) -> str:
+    """Hash do conteudo do contexto (str ou ContextSource)."""
+    if not isinstance(texto, str):
+        return texto.fingerprint()
+    return hashlib.sha1(texto.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def _fatiar(texto, chunk_chars: int):
+    """(inicio, fim) dos trechos, cortados em fim de linha."""
+    inicio = 0
+    while inicio < len(texto):
+        fim = cortar_em_linha(texto, inicio, inicio + chunk_chars)
+        yield inicio, fim
+        inicio = fim
+
+
+class BM25Index:
+    """
+    Indice invertido BM25 sobre trechos (inicio, fim) de um texto.
+    O texto em si nao fica no indice; so offsets e estatisticas.
+    """
+
+    def __init__(self, trechos: list, postings: dict, tamanhos: list):
+        self.trechos = trechos      # [(inicio, fim), ...]
+        self.postings = postings    # termo -> [[trecho_id, tf], ...]
+        self.tamanhos = tamanhos    # tokens por trecho
+        self.media = (sum(tamanhos) / len(tamanhos)) if tamanhos else 0.0
+
+    @classmethod
+    def construir(cls, texto: str, chunk_chars: int) -> 'BM25Index':
+        trechos = list(_fatiar(texto, chunk_chars))
+        postings = {}
+        tamanhos = []
+        for i, (ini, fim) in enumerate(trechos):
+            termos = tokenizar(texto[ini:fim])
+            tamanhos.append(len(termos))
+            for termo, tf in Counter(termos).items():
+                postings.setdefault(termo, []).append([i, tf])
+
+        return cls(trechos, postings, tamanhos)
+
+    def __len__(self) -> int:
+        return len(self.trechos)
+
+    def _lista(self, termo: str) -> list:
+        """[(trecho_id, tf, tokens do trecho)] do termo."""
+        return [(i, tf, self.tamanhos[i]) for i, tf in self.postings.get(termo, ())]
+
+    def _trecho(self, i: int) -> tuple:
+        return self.trechos[i]
+
+    def pontuar(self, consulta: str) -> dict:
+        """Retorna {trecho_id: score} para os trechos com algum termo da consulta."""
+        n = len(self)
+        scores = {}
+        for termo in set(tokenizar(consulta)):
+            lista = self._lista(termo)
+            if not lista:
+                continue
+            idf = math.log(1 + (n - len(lista) + 0.5) / (len(lista) + 0.5))
+            for i, tf, tamanho in lista:
+                norm = K1 * (1 - B + B * tamanho / (self.media or 1))
+                scores[i] = scores.get(i, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+        return scores
+
+    def buscar(self, consulta: str, k: int, orcamento_chars: int) -> list:
+        """
+        Top-k trechos para a consulta, respeitando o orcamento de caracteres.
+        Retorna [(inicio, fim)] na ordem original do texto.
+        """
+        scores = self.pontuar(consulta)
+        escolhidos = []
+        usado = 0
+        for i in sorted(scores, key=scores.get, reverse=True):
+            inicio, fim = self._trecho(i)
+            if usado + (fim - inicio) > orcamento_chars:
+                continue
+            escolhidos.append((inicio, fim))
+            usado += fim - inicio
+            if len(escolhidos) >= k:
+                break
+        return sorted(escolhidos)
+
+    def to_dict(self) -> dict:
+        return {'trechos': self.trechos, 'postings': self.postings, 'tamanhos': self.tamanhos}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'BM25Index':
+        return cls([tuple(t) for t in data['trechos']], data['postings'], data['tamanhos'])
+
+
+class BM25Disco(BM25Index):
+    """
+    O mesmo indice num SQLite: construido em lotes de LOTE_TRECHOS
+    trechos (so o lote fica em memoria) e consultado termo a termo, sem
+    carregar as postings. Para contextos grandes.
+    """
+
+    def __init__(self, path: str):
+        import sqlite3  # so para contextos grandes (startup das CLIs)
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        n, total = self._db.execute("SELECT COUNT(*), SUM(tamanho) FROM trechos").fetchone()
+        self._n = n
+        self.media = (total / n) if n else 0.0
+
+    @classmethod
+    def construir(cls, texto, chunk_chars: int, path: str) -> 'BM25Disco':
+        import sqlite3
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        db = sqlite3.connect(tmp)
+        try:
+            db.execute("PRAGMA journal_mode=OFF")
+            db.execute("PRAGMA synchronous=OFF")
+            db.execute("CREATE TABLE trechos (id INTEGER PRIMARY KEY, inicio INTEGER, fim INTEGER, tamanho INTEGER)")
+            db.execute("CREATE TABLE postings (termo TEXT, trecho INTEGER, tf INTEGER)")
+            trechos, postings = [], []
+            for i, (ini, fim) in enumerate(_fatiar(texto, chunk_chars)):
+                termos = tokenizar(texto[ini:fim])
+                trechos.append((i, ini, fim, len(termos)))
+                postings.extend((termo, i, tf) for termo, tf in Counter(termos).items())
+                if len(trechos) >= LOTE_TRECHOS:
+                    db.executemany("INSERT INTO trechos VALUES (?, ?, ?, ?)", trechos)
+                    db.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+                    trechos, postings = [], []
+            db.executemany("INSERT INTO trechos VALUES (?, ?, ?, ?)", trechos)
+            db.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+            db.execute("CREATE INDEX idx_postings_termo ON postings(termo)")
+            db.commit()
+        finally:
+            db.close()
+        os.replace(tmp, path)
+        return cls(path)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _lista(self, termo: str) -> list:
+        with self._lock:
+            return self._db.execute(
+                "SELECT p.trecho, p.tf, t.tamanho FROM postings p JOIN trechos t ON t.id = p.trecho "
+                "WHERE p.termo = ?", (termo,)
+            ).fetchall()
+
+    def _trecho(self, i: int) -> tuple:
+        with self._lock:
+            return self._db.execute("SELECT inicio, fim FROM trechos WHERE id = ?", (i,)).fetchone()
+
+
+# ============= CACHE DE INDICES =============
+
+_indices = OrderedDict()
+_indices_lock = threading.Lock()
+
+
+def _indice_em_disco(texto, chunk_chars: int, arquivo: Path) -> BM25Disco:
+    """Indice SQLite do contexto grande (abre o do cache ou constroi)."""
+    if arquivo.exists():
+        try:
+            return BM25Disco(str(arquivo))
+        except Exception as e:
+            print(f"[BM25] Cache invalido, re-indexando: {e}")
+    arquivo.parent.mkdir(parents=True, exist_ok=True)
+    indice = BM25Disco.construir(texto, chunk_chars, str(arquivo))
+    print(f"[BM25] Indexados {len(indice)} trechos (em disco: {arquivo})")
+    return indice
+
+
+def indice_para(texto: str, chunk_chars: int, cache_dir: str = None) -> BM25Index:
+    """
+    Indice BM25 do texto, reaproveitando o cache (memoria, depois disco)
+    quando o mesmo contexto ja foi indexado com o mesmo chunk_chars.
+    Contexto maior que bm25_memoria_max_chars usa o indice em SQLite.
+    """
+    chave = f"{fingerprint(texto)}_{chunk_chars}"
+
+    with _indices_lock:
+        if chave in _indices:
+            _indices.move_to_end(chave)
+            return _indices[chave]
+
+    cache_dir = cache_dir or bm25_cache_dir_padrao
+    if len(texto) > bm25_memoria_max_chars:
+        indice = _indice_em_disco(texto, chunk_chars, Path(cache_dir) / f"{chave}.sqlite3")
+        with _indices_lock:
+            _indices[chave] = indice
+            while len(_indices) > bm25_max_memoria:
+                _indices.popitem(last=False)
+        return indice
+
+    arquivo = Path(cache_dir) / f"{chave}.json"
+    indice = None
+    if arquivo.exists():
+        try:
+            with open(arquivo, 'r', encoding='utf-8') as f:
+                indice = BM25Index.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[BM25] Cache invalido, re-indexando: {e}")
+
+    if indice is None:
+        indice = BM25Index.construir(texto, chunk_chars)
+        print(f"[BM25] Indexados {len(indice.trechos)} trechos ({len(indice.postings)} termos)")
+        try:
+            arquivo.parent.mkdir(parents=True, exist_ok=True)
+            tmp = arquivo.with_suffix('.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(indice.to_dict(), f)
+            os.replace(tmp, arquivo)
+        except OSError as e:
+            print(f"[BM25] Nao foi possivel gravar o cache: {e}")
+
+    with _indices_lock:
+        _indices[chave] = indice
+        while len(_indices) > bm25_max_memoria:
+            _indices.popitem(last=False)
+    return indice
+
+
+def selecionar_contexto(consulta: str, texto: str, k: int, orcamento_chars: int) -> str:
+    """
+    Os trechos mais relevantes para a consulta, juntos com '...' entre eles.
+    Se o texto ja cabe no orcamento ou nada casa, cai no inicio do texto.
+    """
+    if len(texto) <= orcamento_chars:
+        return texto[:]
+
+    indice = indice_para(texto, max(200, orcamento_chars // max(1, k)))
+    trechos = indice.buscar(consulta, k, orcamento_chars)
+    if not trechos:
+        return texto[:orcamento_chars]
+    return "\n...\n".join(texto[inicio:fim].strip('\n') for inicio, fim in trechos)
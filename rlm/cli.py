@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Entrada comum das CLIs do RLM (rlm_ollama.py e smart_rlm.py)
+
+O parser fica aqui, so com stdlib: --help e argumentos invalidos respondem
+sem importar o pipeline, e o modulo do RLM so e importado depois do parse.
+Os modulos tambem nao carregam ollama/httpx no import (ver ollama_pool.py);
+o orcamento de startup e medido por benchmark_inicio.py.
+
+Uso:
+    python rlm/cli.py smart --tarefa "..."    # = python rlm/smart_rlm.py
+    python rlm/cli.py rlm --tarefa "..."      # = python rlm/rlm_ollama.py
+"""
+
+import sys
+import argparse
+
+
+PROGRAMAS = {
+    'rlm': {
+        'modulo': 'rlm_ollama',
+        'descricao': "RLM Generico via Ollama - Processa tarefas complexas",
+        'tarefa': "Instrucao principal para o RLM",
+        'contexto': "Texto de contexto ou caminho para arquivo",
+        'modelo': "Modelo Ollama a usar",
+        'verbose': "Modo verboso com mais detalhes",
+    },
+    'smart': {
+        'modulo': 'smart_rlm',
+        'descricao': "Smart RLM com Early Exit - RLM Default com skip inteligente",
+        'tarefa': "Instrucao principal",
+        'contexto': "Texto ou caminho de arquivo",
+        'modelo': "Modelo Ollama",
+        'verbose': "Modo verboso",
+    },
+}
+
+
+def adicionar_argumentos(parser: argparse.ArgumentParser, programa: str):
+    """Flags da CLI `programa` ('rlm' ou 'smart')."""
+    textos = PROGRAMAS[programa]
+    smart = programa == 'smart'
+
+    parser.add_argument("--tarefa", type=str, default=None, help=textos['tarefa'])
+    parser.add_argument("--contexto", type=str, default="", help=textos['contexto'])
+    parser.add_argument("--modelo", type=str, default="qwen3:4b", help=textos['modelo'])
+    if smart:
+        parser.add_argument(
+            "--confianca",
+            type=float,
+            default=0.90,
+            help="Threshold de confianca para early exit (0.0-1.0)"
+        )
+    parser.add_argument(
+        "--concorrencia",
+        type=int,
+        default=None,
+        help="Max. de sub-tarefas simultaneas (padrao: RLM_MAX_CONCURRENCY ou 1)"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Escreve os tokens da resposta no stdout conforme chegam"
+    )
+    parser.add_argument(
+        "--recursivo",
+        action="store_true",
+        help="Map-reduce recursivo sobre o contexto inteiro (usa max_depth)"
+    )
+    parser.add_argument(
+        "--repl",
+        action="store_true",
+        help="O modelo explora o contexto escrevendo Python num worker isolado (padrao: RLM_REPL)"
+    )
+    parser.add_argument(
+        "--bm25",
+        action="store_true",
+        help="Envia a cada sub-tarefa so os trechos mais relevantes (BM25)"
+    )
+    if smart:
+        parser.add_argument(
+            "--especulativo",
+            action="store_true",
+            help="Roda split + sub-tarefas junto com o fast path (padrao: RLM_SPECULATIVE)"
+        )
+        parser.add_argument(
+            "--sem-roteador",
+            action="store_true",
+            help="Sempre tenta o fast path e nao grava o log de rotas (RLM_ROUTER=0)"
+        )
+        parser.add_argument(
+            "--deadline-ms",
+            type=int,
+            default=None,
+            help="Prazo da resposta em ms; degrada em vez de estourar (padrao: RLM_DEADLINE_MS, 0 = sem prazo)"
+        )
+    parser.add_argument(
+        "--num-ctx",
+        type=int,
+        default=None,
+        help="Janela de contexto do modelo em tokens (padrao: RLM_NUM_CTX ou 4096)"
+    )
+    parser.add_argument(
+        "--keep-alive",
+        type=str,
+        default=None,
+        help="Tempo que o Ollama mantem o modelo carregado (padrao: RLM_KEEP_ALIVE ou 30m)"
+    )
+    parser.add_argument(
+        "--modelos",
+        type=str,
+        default=None,
+        help="Modelo por etapa, ex: fast=qwen3:0.6b,split=qwen3:0.6b (padrao: RLM_MODELS)"
+    )
+    parser.add_argument(
+        "--modelos-na-gpu",
+        type=int,
+        default=None,
+        help="Modelos que cabem juntos na GPU; evita trocas nas etapas leves (padrao: RLM_MAX_LOADED_MODELS)"
+    )
+    parser.add_argument(
+        "--aquecer",
+        action="store_true",
+        help="Pre-carrega os modelos configurados antes de comecar (padrao: RLM_WARMUP)"
+    )
+    parser.add_argument(
+        "--batch-jsonl",
+        type=str,
+        default=None,
+        help="Arquivo JSONL de pedidos ({\"id\", \"tarefa\", \"contexto\" ou \"contexto_arquivo\"}) ou - para stdin"
+    )
+    parser.add_argument(
+        "--saida",
+        type=str,
+        default="-",
+        help="Com --batch-jsonl: arquivo JSONL de resultados (padrao: stdout)"
+    )
+    parser.add_argument(
+        "--retomar",
+        action="store_true",
+        help="Com --batch-jsonl: pula os ids que ja estao em --saida (checkpoint)"
+    )
+    parser.add_argument(
+        "--batch-workers",
+        type=int,
+        default=None,
+        help="Com --batch-jsonl: tarefas simultaneas (padrao: RLM_BATCH_WORKERS ou 2)"
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        default=None,
+        help="Grava um span JSONL por chamada ao Ollama (padrao: RLM_TRACE)"
+    )
+    parser.add_argument(
+        "--metricas",
+        type=str,
+        default=None,
+        help="Grava metricas Prometheus (texto) no fim da execucao (padrao: RLM_METRICS_FILE)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignora o cache de respostas (sempre chama o Ollama)"
+    )
+    parser.add_argument("--verbose", action="store_true", help=textos['verbose'])
+
+
+def validar(parser: argparse.ArgumentParser, args) -> dict:
+    """Erros de uso antes de carregar o pipeline. Retorna os modelos por etapa."""
+    from modelos import parse_modelos
+    try:
+        modelos = parse_modelos(args.modelos) if args.modelos else None
+    except ValueError as e:
+        parser.error(str(e))
+    if not args.tarefa and not args.batch_jsonl:
+        parser.error("informe --tarefa ou --batch-jsonl")
+    if getattr(args, 'deadline_ms', None) and args.stream:
+        parser.error("--deadline-ms ainda nao vale com --stream")
+    return modelos
+
+
+def main(programa: str, executar=None, argv: list = None):
+    """
+    Parse + validacao e depois executar(args, modelos). Sem `executar`,
+    importa o modulo do programa e usa o executar_cli dele.
+    """
+    parser = argparse.ArgumentParser(description=PROGRAMAS[programa]['descricao'])
+    adicionar_argumentos(parser, programa)
+    args = parser.parse_args(argv)
+    modelos = validar(parser, args)
+    if executar is None:
+        import importlib
+        executar = importlib.import_module(PROGRAMAS[programa]['modulo']).executar_cli
+    executar(args, modelos)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in PROGRAMAS:
+        print(f"uso: {sys.argv[0]} {{{','.join(PROGRAMAS)}}} [--help | argumentos]", file=sys.stderr)
+        sys.exit(2)
+    sys.argv[0] = f"{sys.argv[0]} {sys.argv[1]}"
+    main(sys.argv[1], argv=sys.argv[2:])
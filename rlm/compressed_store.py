@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Armazenamento comprimido com acesso por offset
+
+Grava o texto em blocos de ate 1 MB, cada um como um membro gzip (ou frame
+zstd) independente, e guarda os pontos de seek num arquivo .zidx:
+(offset comprimido, offset descomprimido, tamanho descomprimido).
+
+Membros gzip/frames zstd concatenados continuam sendo um arquivo valido
+(`zcat`/`zstdcat` leem normalmente), entao compactar um historico e so
+anexar novos membros no fim. Ler a partir de um offset descomprimido
+descomprime so os blocos dali para frente, nunca o arquivo inteiro.
+
+zstd usa o pacote opcional `zstandard`; sem ele, cai para gzip (stdlib).
+"""
+
+import os
+import gzip
+import bisect
+import struct
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+BLOCO = 1 << 20
+
+EXTENSOES = {'gzip': '.gz', 'zstd': '.zst'}
+
+# (offset comprimido, offset descomprimido, tamanho descomprimido)
+_PONTO = struct.Struct('<QQQ')
+
+
+def resolver_codec(nome: str):
+    """Normaliza o nome do codec ('gzip', 'zstd' ou None para texto puro)."""
+    nome = (nome or '').strip().lower()
+    if nome in ('', 'none', 'nenhuma', 'off', '0'):
+        return None
+    if nome not in EXTENSOES:
+        raise ValueError(f"Compressão desconhecida: {nome} (use gzip, zstd ou nenhuma)")
+    if nome == 'zstd' and zstandard is None:
+        print("[!] Pacote 'zstandard' não instalado, usando gzip")
+        return 'gzip'
+    return nome
+
+
+def codec_do_arquivo(path) -> str:
+    """Codec pelo sufixo do arquivo (None = texto puro)."""
+    nome = str(path)
+    for codec, ext in EXTENSOES.items():
+        if nome.endswith(ext):
+            return codec
+    return None
+
+
+def comprimir(codec: str, dados: bytes) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(dados)
+    return gzip.compress(dados, compresslevel=6)
+
+
+def descomprimir(codec: str, dados: bytes) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(dados)
+    return gzip.decompress(dados)
+
+
+def dividir(dados: bytes, tamanho: int = BLOCO):
+    """Fatia os bytes em blocos de ate `tamanho`."""
+    for inicio in range(0, len(dados), tamanho):
+        yield dados[inicio:inicio + tamanho]
+
+
+def escrever_blocos(f, codec: str, blocos, u_inicio: int = 0) -> list:
+    """
+    Escreve cada bloco como membro/frame independente no arquivo binario
+    `f` (na posicao atual). Retorna os pontos de seek novos.
+    """
+    pontos = []
+    for bloco in blocos:
+        if not bloco:
+            continue
+        c_off = f.tell()
+        f.write(comprimir(codec, bloco))
+        pontos.append((c_off, u_inicio, len(bloco)))
+        u_inicio += len(bloco)
+    return pontos
+
+
+def ler_pontos(zidx_path) -> list:
+    if not os.path.exists(zidx_path):
+        return []
+    with open(zidx_path, 'rb') as f:
+        dados = f.read()
+    return [_PONTO.unpack_from(dados, i) for i in range(0, len(dados) - _PONTO.size + 1, _PONTO.size)]
+
+
+def anexar_pontos(zidx_path, pontos: list):
+    with open(zidx_path, 'ab') as f:
+        for ponto in pontos:
+            f.write(_PONTO.pack(*ponto))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def tamanho_descomprimido(pontos: list) -> int:
+    if not pontos:
+        return 0
+    _, u_off, u_len = pontos[-1]
+    return u_off + u_len
+
+
+def ler_stream(path, codec: str, pontos: list, u_inicio: int = 0):
+    """
+    Gera os bytes descomprimidos a partir do offset `u_inicio`, um bloco
+    por vez (memoria limitada a BLOCO). Sem pontos de seek, descomprime o
+    arquivo em streaming desde o inicio.
+    """
+    if not pontos:
+        yield from _ler_sem_pontos(path, codec, u_inicio)
+        return
+
+    i = max(0, bisect.bisect_right([p[1] for p in pontos], u_inicio) - 1)
+    fim_arquivo = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        for j in range(i, len(pontos)):
+            c_off, u_off, _ = pontos[j]
+            c_fim = pontos[j + 1][0] if j + 1 < len(pontos) else fim_arquivo
+            f.seek(c_off)
+            dados = descomprimir(codec, f.read(c_fim - c_off))
+            if u_off < u_inicio:
+                dados = dados[u_inicio - u_off:]
+            yield dados
+
+
+def _ler_sem_pontos(path, codec: str, u_inicio: int):
+    with open(path, 'rb') as f:
+        if codec == 'zstd':
+            leitor = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+        else:
+            leitor = gzip.GzipFile(fileobj=f)
+        pular = u_inicio
+        while True:
+            dados = leitor.read(BLOCO)
+            if not dados:
+                break
+            if pular:
+                corte = min(pular, len(dados))
+                dados = dados[corte:]
+                pular -= corte
+            if dados:
+                yield dados
@@ -7,19 +7,247 @@ para uso com o RLM.
 """
 
 import os
+import re
 import json
+import struct
+import sqlite3
 import argparse
+import threading
 from datetime import datetime
 from pathlib import Path
 
+from compressed_store import (
+    EXTENSOES, BLOCO, resolver_codec, codec_do_arquivo, dividir, escrever_blocos,
+    ler_pontos, anexar_pontos, tamanho_descomprimido, ler_stream
+)
+
+
+# Segmento de append vira parte do historico quando passa deste tamanho
+compactar_bytes_padrao = int(os.environ.get('RLM_HISTORICO_COMPACTAR_BYTES', str(256 * 1024)))
+
+# Compressao de historicos e arquivos de contexto: gzip, zstd ou nenhuma
+compressao_padrao = os.environ.get('RLM_COMPRESSAO', '')
+
+# Offsets das entradas no .idx (uint64 little-endian)
+_OFFSET = struct.Struct('<Q')
+
+# <user>_historico.txt (ou .txt.gz / .txt.zst)
+_HISTORICO_ARQUIVO = re.compile(r'^(?P<user_id>.+)_historico\.txt(?:\.gz|\.zst)?$')
+
+
+def _escrever_atomico(filepath: Path, conteudo: str):
+    """Grava em arquivo temporario e troca com os.replace (nunca fica pela metade)."""
+    tmp = filepath.with_name(filepath.name + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(conteudo)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filepath)
+
 
 class ContextoManager:
-    """Gerencia arquivos de contexto para RLM."""
+    """
+    Gerencia arquivos de contexto para RLM.
+
+    Historico de um usuario:
+        <user>_historico.txt   texto compactado (o que o RLM le)
+                               (.txt.gz / .txt.zst com compressao)
+        <user>_historico.zidx  pontos de seek dos blocos comprimidos
+        <user>_historico.idx   offsets (uint64) de cada entrada no texto
+        <user>_historico.log   segmento append-only (JSONL) ainda nao compactado
+        <user>_metadata.json   metadados, sempre gravados de forma atomica
+
+    Catalogo (.catalogo.sqlite3): uma linha por usuario com tamanho, tipo
+    e timestamp, mantida por salvar/append/limpar. listar_contextos
+    consulta so o catalogo (sem glob nem stat por arquivo).
+    """
     
-    def __init__(self, base_dir: str = "rlm/contextos"):
+    def __init__(self, base_dir: str = "rlm/contextos", compactar_bytes: int = None,
+                 compressao: str = None):
         self.base_dir = Path(base_dir)
         self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.compactar_bytes = compactar_bytes or compactar_bytes_padrao
+        self.compressao = resolver_codec(compressao_padrao if compressao is None else compressao)
+        self._lock = threading.RLock()
+        self._catalogo = self._abrir_catalogo()
+
+    # ============= CATALOGO =============
+
+    def _abrir_catalogo(self) -> sqlite3.Connection:
+        catalogo_path = self.base_dir / ".catalogo.sqlite3"
+        novo = not catalogo_path.exists()
+        db = sqlite3.connect(catalogo_path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS contextos (
+                user_id TEXT PRIMARY KEY,
+                arquivo TEXT NOT NULL,
+                tamanho INTEGER NOT NULL DEFAULT 0,
+                tipo TEXT,
+                timestamp TEXT
+            )
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS idx_contextos_tipo ON contextos(tipo, arquivo)")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_contextos_timestamp ON contextos(timestamp)")
+        db.commit()
+        if novo:
+            # Primeira vez neste diretorio: importa o que ja existe
+            self._catalogo = db
+            self.reindexar_catalogo()
+        return db
+
+    def _catalogar(self, user_id: str, tamanho: int = None, delta: int = 0,
+                   tipo: str = None, timestamp: str = None):
+        """Insere/atualiza a linha do usuario (tamanho absoluto ou delta)."""
+        timestamp = timestamp or datetime.now().isoformat()
+        self._catalogo.execute("""
+            INSERT INTO contextos (user_id, arquivo, tamanho, tipo, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                arquivo = excluded.arquivo,
+                tamanho = COALESCE(?, contextos.tamanho + ?),
+                tipo = COALESCE(excluded.tipo, contextos.tipo),
+                timestamp = excluded.timestamp
+        """, (user_id, self._historico_path(user_id).name,
+              tamanho if tamanho is not None else delta, tipo, timestamp,
+              tamanho, delta))
+        self._catalogo.commit()
+
+    def reindexar_catalogo(self) -> int:
+        """
+        Reconstroi o catalogo a partir dos arquivos (glob + stat).
+        Caro; so para migrar diretorios antigos ou reparar o catalogo.
+        """
+        with self._lock:
+            self._catalogo.execute("DELETE FROM contextos")
+            usuarios = set()
+            for filepath in self.base_dir.glob("*_historico.*"):
+                if filepath.suffix in ('.txt', '.log', '.gz', '.zst'):
+                    usuarios.add(filepath.name.rsplit('_historico.', 1)[0])
+
+            for user_id in usuarios:
+                tamanho = self._base_tamanho(user_id)
+                tamanho += sum(
+                    len(self._renderizar(e).encode('utf-8'))
+                    for e in self._ler_segmento(user_id)
+                )
+                metadata = self._carregar_metadata(user_id)
+                self._catalogar(
+                    user_id,
+                    tamanho=tamanho,
+                    tipo=metadata.get('tipo'),
+                    timestamp=metadata.get('timestamp')
+                )
+            return len(usuarios)
+
+    def _historico_variantes(self, user_id: str) -> list:
+        base = self.base_dir / f"{user_id}_historico.txt"
+        return [base] + [base.with_name(base.name + ext) for ext in EXTENSOES.values()]
+
+    def _historico_path(self, user_id: str) -> Path:
+        """Arquivo do histórico (o que existir; senão, o do codec configurado)."""
+        for filepath in self._historico_variantes(user_id):
+            if filepath.exists():
+                return filepath
+        base = self.base_dir / f"{user_id}_historico.txt"
+        if self.compressao:
+            return base.with_name(base.name + EXTENSOES[self.compressao])
+        return base
+
+    def _zidx_path(self, user_id: str) -> Path:
+        return self.base_dir / f"{user_id}_historico.zidx"
+
+    def _idx_path(self, user_id: str) -> Path:
+        return self.base_dir / f"{user_id}_historico.idx"
+
+    def _log_path(self, user_id: str) -> Path:
+        return self.base_dir / f"{user_id}_historico.log"
+
+    def _journal_path(self, user_id: str) -> Path:
+        return self.base_dir / f"{user_id}_historico.compact"
+
+    def _meta_path(self, user_id: str) -> Path:
+        return self.base_dir / f"{user_id}_metadata.json"
+
+    def _carregar_metadata(self, user_id: str) -> dict:
+        meta_filepath = self._meta_path(user_id)
+        if not meta_filepath.exists():
+            return {}
+        with open(meta_filepath, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _salvar_metadata(self, user_id: str, metadata: dict):
+        _escrever_atomico(
+            self._meta_path(user_id),
+            json.dumps(metadata, indent=2, ensure_ascii=False)
+        )
     
+    # ============= TEXTO BASE (puro ou comprimido) =============
+
+    def _base_tamanho(self, user_id: str) -> int:
+        """Tamanho descomprimido do texto base."""
+        filepath = self._historico_path(user_id)
+        if not filepath.exists():
+            return 0
+        codec = codec_do_arquivo(filepath)
+        if codec is None:
+            return filepath.stat().st_size
+        pontos = ler_pontos(self._zidx_path(user_id))
+        if pontos:
+            return tamanho_descomprimido(pontos)
+        return sum(len(b) for b in ler_stream(filepath, codec, []))
+
+    def _base_ler(self, user_id: str, inicio: int = 0):
+        """Gera o texto base (bytes) a partir do offset descomprimido, bloco a bloco."""
+        filepath = self._historico_path(user_id)
+        if not filepath.exists():
+            return
+        codec = codec_do_arquivo(filepath)
+        if codec is not None:
+            yield from ler_stream(filepath, codec, ler_pontos(self._zidx_path(user_id)), inicio)
+            return
+        with open(filepath, 'rb') as f:
+            f.seek(inicio)
+            while True:
+                bloco = f.read(BLOCO)
+                if not bloco:
+                    break
+                yield bloco
+
+    def _base_escrever(self, user_id: str, blocos, codec: str) -> Path:
+        """
+        Regrava o texto base inteiro no formato `codec` (atômico) e remove
+        as outras variantes. `blocos` é um iterável de bytes.
+        """
+        base = self.base_dir / f"{user_id}_historico.txt"
+        filepath = base.with_name(base.name + EXTENSOES[codec]) if codec else base
+        tmp = filepath.with_name(filepath.name + '.tmp')
+        zidx_filepath = self._zidx_path(user_id)
+
+        with open(tmp, 'wb') as f:
+            if codec:
+                pontos = escrever_blocos(f, codec, blocos)
+            else:
+                for bloco in blocos:
+                    f.write(bloco)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if codec:
+            zidx_tmp = zidx_filepath.with_name(zidx_filepath.name + '.tmp')
+            if zidx_tmp.exists():
+                zidx_tmp.unlink()
+            anexar_pontos(zidx_tmp, pontos)
+            os.replace(zidx_tmp, zidx_filepath)
+        elif zidx_filepath.exists():
+            zidx_filepath.unlink()
+        os.replace(tmp, filepath)
+
+        for variante in self._historico_variantes(user_id):
+            if variante != filepath and variante.exists():
+                variante.unlink()
+        return filepath
+
     def salvar_historico(self, user_id: str, historico: str, metadata: dict = None) -> str:
         """
         Salva um histórico de usuário.
@@ -32,33 +260,232 @@ class ContextoManager:
         Returns:
             Caminho do arquivo salvo
         """
-        filename = f"{user_id}_historico.txt"
-        filepath = self.base_dir / filename
-        
-        # Salva o histórico
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(historico)
-        
-        # Salva metadata se fornecida
-        if metadata:
-            meta_filepath = self.base_dir / f"{user_id}_metadata.json"
-            metadata['timestamp'] = datetime.now().isoformat()
-            metadata['file_size'] = len(historico)
-            with open(meta_filepath, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, indent=2, ensure_ascii=False)
+        with self._lock:
+            # Salva o histórico (substitui tudo, inclusive o segmento pendente)
+            filepath = self._base_escrever(user_id, dividir(historico.encode('utf-8')), self.compressao)
+            with open(self._idx_path(user_id), 'wb') as f:
+                f.write(_OFFSET.pack(0))
+            for extra in (self._log_path(user_id), self._journal_path(user_id)):
+                if extra.exists():
+                    extra.unlink()
+            
+            # Salva metadata se fornecida
+            if metadata:
+                metadata['timestamp'] = datetime.now().isoformat()
+                metadata['file_size'] = len(historico)
+                self._salvar_metadata(user_id, metadata)
+
+            self._catalogar(
+                user_id,
+                tamanho=len(historico.encode('utf-8')),
+                tipo=(metadata or {}).get('tipo')
+            )
         
         print(f"✓ Histórico salvo: {filepath}")
         return str(filepath)
+
+    def append_historico(self, user_id: str, entry: str) -> str:
+        """
+        Adiciona uma entrada ao histórico sem reescrever o arquivo.
+
+        A entrada vai para o segmento append-only (<user>_historico.log);
+        quando o segmento passa de compactar_bytes ele é compactado no .txt.
+        Custo por mensagem: O(tamanho da entrada), não O(histórico).
+
+        Returns:
+            Caminho do segmento
+        """
+        log_filepath = self._log_path(user_id)
+        linha = json.dumps(
+            {'t': datetime.now().isoformat(), 'texto': entry},
+            ensure_ascii=False
+        ) + '\n'
+
+        with self._lock:
+            self._recuperar(user_id)
+            with open(log_filepath, 'a', encoding='utf-8') as f:
+                f.write(linha)
+                f.flush()
+                os.fsync(f.fileno())
+
+            renderizada = self._renderizar(entry)
+            metadata = self._carregar_metadata(user_id)
+            metadata['timestamp'] = datetime.now().isoformat()
+            metadata['file_size'] = metadata.get('file_size', 0) + len(renderizada)
+            self._salvar_metadata(user_id, metadata)
+            self._catalogar(
+                user_id,
+                delta=len(renderizada.encode('utf-8')),
+                tipo=metadata.get('tipo'),
+                timestamp=metadata['timestamp']
+            )
+
+            if log_filepath.stat().st_size >= self.compactar_bytes:
+                self.compactar_historico(user_id)
+
+        return str(log_filepath)
+
+    @staticmethod
+    def _renderizar(entry: str) -> str:
+        """Como uma entrada aparece no texto do histórico."""
+        return entry if entry.endswith('\n') else entry + '\n'
+
+    def _ler_segmento(self, user_id: str) -> list:
+        """Entradas pendentes do segmento (ignora linha final incompleta de um crash)."""
+        log_filepath = self._log_path(user_id)
+        if not log_filepath.exists():
+            return []
+        entradas = []
+        with open(log_filepath, 'r', encoding='utf-8') as f:
+            for linha in f:
+                try:
+                    entradas.append(json.loads(linha)['texto'])
+                except (ValueError, KeyError):
+                    break
+        return entradas
+
+    def _recuperar(self, user_id: str):
+        """
+        Desfaz uma compactação interrompida: se o journal existe e o
+        segmento ainda tem entradas, volta .txt/.idx/.zidx ao tamanho anterior.
+        """
+        journal = self._journal_path(user_id)
+        if not journal.exists():
+            return
+        with open(journal, 'r', encoding='utf-8') as f:
+            estado = json.load(f)
+        if self._ler_segmento(user_id):
+            for filepath, tamanho in ((self._historico_path(user_id), estado['txt']),
+                                      (self._idx_path(user_id), estado['idx']),
+                                      (self._zidx_path(user_id), estado.get('zidx', 0))):
+                if filepath.exists():
+                    with open(filepath, 'r+b') as f:
+                        f.truncate(tamanho)
+        journal.unlink()
+
+    def compactar_historico(self, user_id: str) -> int:
+        """
+        Move as entradas do segmento para o fim do .txt (append, sem
+        reescrever) e registra os offsets no .idx.
+
+        Returns:
+            Número de entradas compactadas
+        """
+        with self._lock:
+            self._recuperar(user_id)
+            entradas = self._ler_segmento(user_id)
+            if not entradas:
+                return 0
+
+            filepath = self._historico_path(user_id)
+            idx_filepath = self._idx_path(user_id)
+            zidx_filepath = self._zidx_path(user_id)
+            codec = codec_do_arquivo(filepath)
+            tamanhos = {
+                'txt': filepath.stat().st_size if filepath.exists() else 0,
+                'idx': idx_filepath.stat().st_size if idx_filepath.exists() else 0,
+                'zidx': zidx_filepath.stat().st_size if zidx_filepath.exists() else 0,
+            }
+
+            # Journal: permite desfazer se o processo morrer no meio
+            _escrever_atomico(self._journal_path(user_id), json.dumps(tamanhos))
+
+            offset = self._base_tamanho(user_id)
+            novo = bytearray()
+            if offset > 0 and b''.join(self._base_ler(user_id, offset - 1)) != b'\n':
+                novo += b'\n'
+            offsets = []
+            for entry in entradas:
+                offsets.append(offset + len(novo))
+                novo += self._renderizar(entry).encode('utf-8')
+
+            with open(idx_filepath, 'ab') as idx:
+                if tamanhos['idx'] == 0 and offset > 0:
+                    idx.write(_OFFSET.pack(0))  # histórico legado = 1 entrada
+                for inicio in offsets:
+                    idx.write(_OFFSET.pack(inicio))
+                idx.flush()
+                os.fsync(idx.fileno())
+
+            with open(filepath, 'ab') as txt:
+                if codec:
+                    pontos = escrever_blocos(txt, codec, [bytes(novo)], offset)
+                else:
+                    txt.write(novo)
+                txt.flush()
+                os.fsync(txt.fileno())
+            if codec:
+                anexar_pontos(zidx_filepath, pontos)
+
+            open(self._log_path(user_id), 'w').close()
+            self._journal_path(user_id).unlink()
+            return len(entradas)
     
-    def carregar_historico(self, user_id: str) -> str:
-        """Carrega um histórico de usuário."""
-        filepath = self.base_dir / f"{user_id}_historico.txt"
+    def carregar_historico(self, user_id: str, ultimas_n: int = None,
+                           ultimos_bytes: int = None) -> str:
+        """
+        Carrega um histórico de usuário (texto compactado + segmento pendente).
+
+        Args:
+            ultimas_n: só as últimas N entradas (usa o .idx, sem ler o arquivo todo)
+            ultimos_bytes: só os últimos N bytes do histórico (seek do fim)
+        """
+        filepath = self._historico_path(user_id)
         
+        with self._lock:
+            self._recuperar(user_id)
+            pendentes = [self._renderizar(e) for e in self._ler_segmento(user_id)]
+
+            if not filepath.exists() and not pendentes:
+                raise FileNotFoundError(f"Histórico não encontrado: {filepath}")
+
+            if ultimas_n is not None:
+                return self._ultimas_entradas(user_id, ultimas_n, pendentes)
+            if ultimos_bytes is not None:
+                return self._ultimos_bytes(user_id, ultimos_bytes, pendentes)
+
+            base = b''.join(self._base_ler(user_id)).decode('utf-8')
+            return self._juntar(base, pendentes)
+
+    @staticmethod
+    def _juntar(base: str, pendentes: list) -> str:
+        if pendentes and base and not base.endswith('\n'):
+            base += '\n'
+        return base + ''.join(pendentes)
+
+    def _ultimas_entradas(self, user_id: str, n: int, pendentes: list) -> str:
+        if n <= 0:
+            return ''
+        if len(pendentes) >= n:
+            return ''.join(pendentes[-n:])
+
+        filepath = self._historico_path(user_id)
         if not filepath.exists():
-            raise FileNotFoundError(f"Histórico não encontrado: {filepath}")
-        
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return f.read()
+            return ''.join(pendentes)
+
+        faltam = n - len(pendentes)
+        idx_filepath = self._idx_path(user_id)
+        inicio = 0
+        if idx_filepath.exists():
+            tamanho_idx = idx_filepath.stat().st_size
+            total = tamanho_idx // _OFFSET.size
+            if total > faltam:
+                with open(idx_filepath, 'rb') as f:
+                    f.seek((total - faltam) * _OFFSET.size)
+                    inicio = _OFFSET.unpack(f.read(_OFFSET.size))[0]
+
+        base = b''.join(self._base_ler(user_id, inicio)).decode('utf-8', errors='ignore')
+        return self._juntar(base, pendentes)
+
+    def _ultimos_bytes(self, user_id: str, n: int, pendentes: list) -> str:
+        cauda = ''.join(pendentes).encode('utf-8')
+        if len(cauda) >= n:
+            return cauda[len(cauda) - n:].decode('utf-8', errors='ignore')
+
+        faltam = n - len(cauda)
+        inicio = max(0, self._base_tamanho(user_id) - faltam)
+        base = b''.join(self._base_ler(user_id, inicio))
+        return self._juntar(base.decode('utf-8', errors='ignore'), pendentes)
     
     def salvar_contexto_arquivo(self, nome: str, conteudo: str) -> str:
         """
@@ -74,38 +501,135 @@ class ContextoManager:
         filepath = self.base_dir / nome
         filepath.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(conteudo)
+        if self.compressao:
+            filepath = filepath.with_name(filepath.name + EXTENSOES[self.compressao])
+            with open(filepath, 'wb') as f:
+                escrever_blocos(f, self.compressao, dividir(conteudo.encode('utf-8')))
+        else:
+            with open(filepath, 'w', encoding='utf-8') as f:
+                f.write(conteudo)
         
         print(f"✓ Contexto salvo: {filepath}")
         return str(filepath)
+
+    def carregar_contexto_arquivo(self, nome: str) -> str:
+        """Carrega um arquivo de contexto, descomprimindo se preciso."""
+        filepath = self.base_dir / nome
+        for ext in [''] + list(EXTENSOES.values()):
+            candidato = filepath.with_name(filepath.name + ext)
+            if candidato.exists():
+                codec = codec_do_arquivo(candidato)
+                if codec is None:
+                    with open(candidato, 'r', encoding='utf-8') as f:
+                        return f.read()
+                return b''.join(ler_stream(candidato, codec, [])).decode('utf-8')
+        raise FileNotFoundError(f"Contexto não encontrado: {filepath}")
+
+    def migrar_compressao(self, compressao: str) -> int:
+        """
+        Converte todos os históricos existentes para o formato pedido
+        (gzip, zstd ou nenhuma), no lugar, em streaming bloco a bloco.
+
+        Returns:
+            Número de históricos convertidos
+        """
+        codec = resolver_codec(compressao)
+        convertidos = 0
+        with self._lock:
+            usuarios = set()
+            for filepath in self.base_dir.glob("*_historico.*"):
+                if filepath.suffix in ('.txt', '.log', '.gz', '.zst'):
+                    usuarios.add(filepath.name.rsplit('_historico.', 1)[0])
+
+            for user_id in sorted(usuarios):
+                self.compactar_historico(user_id)
+                filepath = self._historico_path(user_id)
+                if not filepath.exists() or codec_do_arquivo(filepath) == codec:
+                    continue
+                antes = filepath.stat().st_size
+                novo = self._base_escrever(user_id, self._base_ler(user_id), codec)
+                self._catalogar(user_id, delta=0)
+                print(f"✓ {filepath.name} -> {novo.name} ({antes / 1024:.1f} KB -> {novo.stat().st_size / 1024:.1f} KB)")
+                convertidos += 1
+
+        self.compressao = codec
+        return convertidos
     
-    def listar_contextos(self) -> list:
-        """Lista todos os contextos disponíveis."""
-        if not self.base_dir.exists():
-            return []
-        
-        contextos = []
-        for filepath in sorted(self.base_dir.glob("*_historico.txt")):
-            size = filepath.stat().st_size
-            contextos.append({
-                'arquivo': filepath.name,
-                'tamanho': f"{size / 1024:.2f} KB",
-                'caminho': str(filepath)
-            })
-        
-        return contextos
+    def _filtros_catalogo(self, tipo: str = None, desde: str = None, ate: str = None) -> tuple:
+        condicoes, params = [], []
+        if tipo:
+            condicoes.append("tipo = ?")
+            params.append(tipo)
+        if desde:
+            condicoes.append("timestamp >= ?")
+            params.append(desde)
+        if ate:
+            condicoes.append("timestamp <= ?")
+            params.append(ate)
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        return where, params
+
+    def listar_contextos(self, limit: int = None, offset: int = 0, tipo: str = None,
+                         desde: str = None, ate: str = None) -> list:
+        """
+        Lista os contextos disponíveis (consulta o catálogo, não o disco).
+
+        Args:
+            limit / offset: paginação (ordem por nome de arquivo)
+            tipo: filtra por tipo (chat, log, ...)
+            desde / ate: filtra por timestamp ISO (ex: '2026-02-01')
+        """
+        where, params = self._filtros_catalogo(tipo, desde, ate)
+        sql = f"SELECT user_id, arquivo, tamanho, tipo, timestamp FROM contextos {where} ORDER BY arquivo"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        elif offset:
+            sql += " LIMIT -1 OFFSET ?"
+            params.append(offset)
+
+        with self._lock:
+            rows = self._catalogo.execute(sql, params).fetchall()
+
+        return [
+            {
+                'user_id': user_id,
+                'arquivo': arquivo,
+                'tamanho': f"{tamanho / 1024:.2f} KB",
+                'caminho': str(self.base_dir / arquivo),
+                'tipo': tipo_ctx,
+                'timestamp': timestamp
+            }
+            for user_id, arquivo, tamanho, tipo_ctx, timestamp in rows
+        ]
+
+    def total_contextos(self, tipo: str = None, desde: str = None, ate: str = None) -> dict:
+        """Quantidade e tamanho total (bytes) dos contextos, direto do catálogo."""
+        where, params = self._filtros_catalogo(tipo, desde, ate)
+        with self._lock:
+            quantidade, total = self._catalogo.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM contextos {where}", params
+            ).fetchone()
+        return {'quantidade': quantidade, 'bytes': total}
     
     def limpar_contexto(self, user_id: str) -> bool:
         """Remove um contexto de usuário."""
-        filepath = self.base_dir / f"{user_id}_historico.txt"
-        meta_filepath = self.base_dir / f"{user_id}_metadata.json"
+        arquivos = self._historico_variantes(user_id) + [
+            self._zidx_path(user_id),
+            self._meta_path(user_id),
+            self._idx_path(user_id),
+            self._log_path(user_id),
+            self._journal_path(user_id),
+        ]
         
         removidos = []
-        for f in [filepath, meta_filepath]:
-            if f.exists():
-                f.unlink()
-                removidos.append(f.name)
+        with self._lock:
+            for f in arquivos:
+                if f.exists():
+                    f.unlink()
+                    removidos.append(f.name)
+            self._catalogo.execute("DELETE FROM contextos WHERE user_id = ?", (user_id,))
+            self._catalogo.commit()
         
         if removidos:
             print(f"✓ Removidos: {', '.join(removidos)}")
@@ -115,6 +639,23 @@ class ContextoManager:
             return False
 
 
+def compactar_pendente(path: str) -> int:
+    """
+    Se `path` e o historico de um usuario (<user>_historico.txt) com
+    entradas pendentes no segmento .log, compacta antes de o arquivo ir
+    para o RLM (CLIs e lote leem o .txt direto, sem carregar_historico).
+    Outros arquivos passam sem custo. Returns: entradas compactadas.
+    """
+    filepath = Path(path)
+    nome = _HISTORICO_ARQUIVO.match(filepath.name)
+    if nome is None:
+        return 0
+    log_filepath = filepath.with_name(f"{nome.group('user_id')}_historico.log")
+    if not log_filepath.exists() or log_filepath.stat().st_size == 0:
+        return 0
+    return ContextoManager(str(filepath.parent)).compactar_historico(nome.group('user_id'))
+
+
 # ============= CLI =============
 
 if __name__ == "__main__":
@@ -122,6 +663,9 @@ if __name__ == "__main__":
         description="Gerenciador de Contextos para RLM"
     )
     
+    parser.add_argument("--compressao", choices=["gzip", "zstd", "nenhuma"],
+                        help="Formato dos históricos gravados (padrão: RLM_COMPRESSAO)")
+    
     subparsers = parser.add_subparsers(dest="comando", help="Comando a executar")
     
     # Comando: salvar
@@ -134,16 +678,39 @@ if __name__ == "__main__":
     load_parser = subparsers.add_parser("carregar", help="Carregar histórico de usuário")
     load_parser.add_argument("--user-id", required=True, help="ID do usuário")
     load_parser.add_argument("--saida", help="Arquivo para salvar o resultado")
+    load_parser.add_argument("--ultimas", type=int, help="Só as últimas N entradas")
+    load_parser.add_argument("--ultimos-bytes", type=int, help="Só os últimos N bytes")
+    
+    # Comando: adicionar
+    append_parser = subparsers.add_parser("adicionar", help="Adicionar entrada ao histórico (append)")
+    append_parser.add_argument("--user-id", required=True, help="ID do usuário")
+    append_parser.add_argument("--texto", required=True, help="Texto da entrada")
+    
+    # Comando: compactar
+    compact_parser = subparsers.add_parser("compactar", help="Compactar o segmento pendente no histórico")
+    compact_parser.add_argument("--user-id", required=True, help="ID do usuário")
     
     # Comando: listar
     list_parser = subparsers.add_parser("listar", help="Listar todos os contextos")
+    list_parser.add_argument("--limit", type=int, help="Máximo de contextos listados")
+    list_parser.add_argument("--offset", type=int, default=0, help="Pular os N primeiros")
+    list_parser.add_argument("--tipo", help="Filtrar por tipo (chat, log, etc)")
+    list_parser.add_argument("--desde", help="Só contextos atualizados desde (ISO, ex: 2026-02-01)")
+    
+    # Comando: reindexar
+    subparsers.add_parser("reindexar", help="Reconstruir o catálogo a partir dos arquivos")
+    
+    # Comando: migrar
+    migrate_parser = subparsers.add_parser("migrar", help="Converter históricos existentes de formato")
+    migrate_parser.add_argument("--para", required=True, choices=["gzip", "zstd", "nenhuma"],
+                                help="Formato de destino")
     
     # Comando: limpar
     clean_parser = subparsers.add_parser("limpar", help="Remover contexto de usuário")
     clean_parser.add_argument("--user-id", required=True, help="ID do usuário")
     
     args = parser.parse_args()
-    manager = ContextoManager()
+    manager = ContextoManager(compressao=args.compressao)
     
     try:
         if args.comando == "salvar":
@@ -157,7 +724,11 @@ if __name__ == "__main__":
                 manager.salvar_historico(args.user_id, conteudo, metadata)
         
         elif args.comando == "carregar":
-            historico = manager.carregar_historico(args.user_id)
+            historico = manager.carregar_historico(
+                args.user_id,
+                ultimas_n=args.ultimas,
+                ultimos_bytes=args.ultimos_bytes
+            )
             if args.saida:
                 with open(args.saida, 'w', encoding='utf-8') as f:
                     f.write(historico)
@@ -165,16 +736,41 @@ if __name__ == "__main__":
             else:
                 print(historico)
         
+        elif args.comando == "adicionar":
+            manager.append_historico(args.user_id, args.texto)
+            print(f"✓ Entrada adicionada ao histórico de {args.user_id}")
+        
+        elif args.comando == "compactar":
+            total = manager.compactar_historico(args.user_id)
+            print(f"✓ {total} entrada(s) compactada(s) para {args.user_id}")
+        
         elif args.comando == "listar":
-            contextos = manager.listar_contextos()
+            contextos = manager.listar_contextos(
+                limit=args.limit,
+                offset=args.offset,
+                tipo=args.tipo,
+                desde=args.desde
+            )
             if not contextos:
                 print("Nenhum contexto encontrado")
             else:
+                total = manager.total_contextos(tipo=args.tipo, desde=args.desde)
                 print(f"\n{'📋 CONTEXTOS DISPONÍVEIS':^60}")
                 print("-" * 60)
                 for ctx in contextos:
                     print(f"  {ctx['arquivo']:<40} {ctx['tamanho']:>15}")
-                print(f"{'-' * 60}\nTotal: {len(contextos)} arquivo(s)\n")
+                print(f"{'-' * 60}\nTotal: {total['quantidade']} arquivo(s), {total['bytes'] / 1024:.2f} KB")
+                if len(contextos) < total['quantidade']:
+                    print(f"Mostrando {args.offset + 1}-{args.offset + len(contextos)}")
+                print()
+        
+        elif args.comando == "reindexar":
+            total = manager.reindexar_catalogo()
+            print(f"✓ Catálogo reconstruído: {total} contexto(s)")
+        
+        elif args.comando == "migrar":
+            total = manager.migrar_compressao(args.para)
+            print(f"✓ {total} histórico(s) convertido(s) para {args.para}")
         
         elif args.comando == "limpar":
             manager.limpar_contexto(args.user_id)
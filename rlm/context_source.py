@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fonte de contexto mapeada em memoria (mmap)
+
+Substitui o f.read() dos CLIs: o arquivo nao e carregado inteiro numa
+string Python. O pipeline so usa len(), fatias e rfind(), e cada fatia
+le do page cache apenas os bytes pedidos. Permite rodar o RLM sobre logs
+de centenas de MB sem estourar o RSS.
+
+Offsets sao em bytes (UTF-8). Fatias que cortam um caractere multibyte
+no meio descartam os bytes incompletos da borda.
+
+Arquivos .gz/.zst sao descomprimidos em streaming para um arquivo
+temporario anonimo, que e mapeado no lugar do original.
+"""
+
+import os
+import mmap
+import hashlib
+
+from compressed_store import codec_do_arquivo, ler_stream
+
+
+class ContextSource:
+    """
+    Contexto lido sob demanda de um arquivo via mmap.
+
+    Se comporta como uma str somente-leitura no que o RLM precisa:
+        len(ctx), ctx[a:b], ctx.rfind('\\n', a, b), bool(ctx)
+    """
+
+    def __init__(self, path: str, descritor: int = None):
+        self.path = path
+        codec = None if descritor is not None else codec_do_arquivo(path)
+        if descritor is not None:
+            # Arquivo ja aberto (e descomprimido) por outro processo (repl_pool.py)
+            self._file = os.fdopen(descritor, 'rb')
+        elif codec is None:
+            self._file = open(path, 'rb')
+        else:
+            import tempfile  # so para contexto comprimido (startup das CLIs)
+            self._file = tempfile.TemporaryFile()
+            for bloco in ler_stream(path, codec, []):
+                self._file.write(bloco)
+            self._file.flush()
+        self._size = os.fstat(self._file.fileno()).st_size
+        # mmap nao aceita arquivo vazio
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._size else None
+        self._fingerprint = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def fileno(self) -> int:
+        """Descritor do arquivo mapeado (o descomprimido, se o original era .gz/.zst)."""
+        return self._file.fileno()
+
+    def __getitem__(self, item) -> str:
+        if not isinstance(item, slice):
+            raise TypeError("ContextSource so aceita fatias (ctx[a:b])")
+        inicio, fim, passo = item.indices(self._size)
+        if passo != 1:
+            raise ValueError("ContextSource nao aceita passo em fatias")
+        if self._mm is None or inicio >= fim:
+            return ''
+        return self._mm[inicio:fim].decode('utf-8', errors='ignore')
+
+    def rfind(self, sub: str, inicio: int = 0, fim: int = None) -> int:
+        if self._mm is None:
+            return -1
+        return self._mm.rfind(sub.encode('utf-8'), inicio, self._size if fim is None else fim)
+
+    def fingerprint(self) -> str:
+        """sha1 do conteudo, calculado em blocos (sem materializar o arquivo)."""
+        if self._fingerprint is None:
+            h = hashlib.sha1()
+            for inicio in range(0, self._size, 1 << 20):
+                h.update(self._mm[inicio:inicio + (1 << 20)])
+            self._fingerprint = h.hexdigest()
+        return self._fingerprint
+
+    def __str__(self) -> str:
+        # Materializa o arquivo inteiro; evitar em arquivos grandes
+        return self[:]
+
+    def __repr__(self) -> str:
+        return f"ContextSource({self.path!r}, {self._size} bytes)"
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
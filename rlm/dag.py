@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Escalonador das sub-tarefas em DAG
+
+O split pode dizer que uma sub-tarefa precisa da resposta de outras:
+
+    {"subtasks": [{"tarefa": "Liste os erros"},
+                  {"tarefa": "Agrupe os erros por causa", "depende_de": [1]}]}
+
+- o que nao depende de nada roda em paralelo (ate max_concorrencia)
+- uma sub-tarefa so comeca quando as de que depende terminaram, e recebe
+  as respostas delas
+- os nos chegam aos poucos (split em streaming): um no cujas dependencias
+  ja terminaram roda antes do plano acabar de chegar
+- no fim do plano, dependencia invalida (numero que nao existe) ou ciclo:
+  todas as dependencias sao ignoradas e o que falta roda como lista plana
+- caminho critico = maior cadeia de dependencias (em sub-tarefas): o
+  minimo de rodadas sequenciais, mesmo com concorrencia infinita
+"""
+
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+
+def tem_ciclo(dependencias: list) -> bool:
+    """Ordenacao topologica (Kahn): sobrou no = ciclo."""
+    n = len(dependencias)
+    faltam = [len(deps) for deps in dependencias]
+    filhos = [[] for _ in range(n)]
+    for no, deps in enumerate(dependencias):
+        for pai in deps:
+            filhos[pai].append(no)
+    prontos = [no for no in range(n) if not faltam[no]]
+    visitados = 0
+    while prontos:
+        no = prontos.pop()
+        visitados += 1
+        for filho in filhos[no]:
+            faltam[filho] -= 1
+            if not faltam[filho]:
+                prontos.append(filho)
+    return visitados < n
+
+
+def caminho_critico(dependencias: list) -> int:
+    """Maior cadeia de dependencias, em nos (DAG sem ciclo)."""
+    profundidade = {}
+
+    def _prof(no):
+        if no not in profundidade:
+            profundidade[no] = 1 + max((_prof(pai) for pai in dependencias[no]), default=0)
+        return profundidade[no]
+
+    return max((_prof(no) for no in range(len(dependencias))), default=0)
+
+
+class EscalonadorDAG:
+    """
+    Roda os nos conforme as dependencias ficam prontas, thread-safe.
+
+    Uso:
+        dag = EscalonadorDAG(executar, max_concorrencia=4)
+        try:
+            for deps in plano:               # pode vir de um stream
+                dag.adicionar(deps)
+            resultados = dag.fechar()        # espera tudo, na ordem
+        finally:
+            dag.encerrar()
+
+    executar(indice, entradas) -> resultado, com entradas = [(indice_pai,
+    resultado_pai), ...] das dependencias diretas.
+    """
+
+    def __init__(self, executar, max_concorrencia: int = 1):
+        self.executar = executar
+        self.dependencias = []
+        self.resultados = {}
+        self.plano_plano = False  # dependencias descartadas (ciclo/invalida)
+        self._iniciados = set()
+        self._erro = None
+        self._aberto = True
+        self._cond = threading.Condition()
+        self._contexto = contextvars.copy_context()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concorrencia))
+
+    def adicionar(self, depende=()) -> int:
+        """Acrescenta um no (dependencias = indices base 0). Retorna o indice."""
+        with self._cond:
+            indice = len(self.dependencias)
+            self.dependencias.append(tuple(sorted({d for d in depende if d != indice})))
+            self._despachar()
+            return indice
+
+    def fechar(self) -> list:
+        """Plano completo: valida, roda o que falta e retorna os resultados na ordem."""
+        with self._cond:
+            self._aberto = False
+            n = len(self.dependencias)
+            invalida = any(d < 0 or d >= n for deps in self.dependencias for d in deps)
+            if invalida or tem_ciclo(self.dependencias):
+                motivo = 'dependencia invalida' if invalida else 'ciclo'
+                print(f"[DAG] {motivo} no plano -> sub-tarefas como lista plana")
+                self.plano_plano = True
+                self.dependencias = [() for _ in self.dependencias]
+            self._despachar()
+            while len(self.resultados) < n and self._erro is None:
+                self._cond.wait()
+            if self._erro is not None:
+                raise self._erro
+            return [self.resultados[i] for i in range(n)]
+
+    def encerrar(self):
+        """Cancela o que nao comecou (ex: pedido cancelado) e libera as threads."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def relatorio(self) -> dict:
+        with self._cond:
+            return {
+                'subtarefas': len(self.dependencias),
+                'dependencias': sum(len(deps) for deps in self.dependencias),
+                'caminho_critico': caminho_critico(self.dependencias),
+                'plano_plano': self.plano_plano,
+            }
+
+    # ----- interno (com self._cond) -----
+
+    def _pronto(self, no: int) -> bool:
+        # Com o plano aberto, dependencia de no que ainda nao chegou espera
+        return all(pai in self.resultados for pai in self.dependencias[no])
+
+    def _despachar(self):
+        for no in range(len(self.dependencias)):
+            if no in self._iniciados or not self._pronto(no):
+                continue
+            self._iniciados.add(no)
+            entradas = [(pai, self.resultados[pai]) for pai in self.dependencias[no]]
+            # Copia por no: um Context nao pode rodar em duas threads ao mesmo tempo
+            futuro = self._executor.submit(self._contexto.copy().run, self.executar, no, entradas)
+            futuro.add_done_callback(lambda f, no=no: self._terminou(no, f))
+
+    def _terminou(self, no: int, futuro):
+        with self._cond:
+            if futuro.cancelled():
+                return
+            erro = futuro.exception()
+            if erro is not None:
+                self._erro = self._erro or erro
+            else:
+                self.resultados[no] = futuro.result()
+                try:
+                    self._despachar()
+                except RuntimeError:
+                    pass  # executor encerrado (pedido cancelado)
+            self._cond.notify_all()
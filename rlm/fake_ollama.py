@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fake Ollama - Servidor HTTP local que imita a API do Ollama
+
+Implementa so o que o RLM usa (/api/generate com e sem stream e
+/api/tags), com respostas deterministicas. Serve para rodar o
+smart_rlm_server e os CLIs sem GPU nem modelo baixado.
+
+Simula o KV cache do Ollama: cada slot lembra o ultimo prompt, e so a
+parte do prompt depois do maior prefixo em comum com algum slot conta
+como prompt eval (prompt_eval_count / prompt_eval_duration).
+
+Com --latencia-carga e --modelos-na-gpu, trocar de modelo custa uma carga
+(load_duration), como numa GPU que nao comporta todos os modelos.
+
+Falhas (--taxa-falha, HTTP 500 deterministico por seed) e roteiros de
+resposta (--roteiro arquivo.json) servem para o benchmark (rlm/benchmark.py).
+
+Uso:
+    python rlm/fake_ollama.py --porta 11435
+    OLLAMA_HOST=http://127.0.0.1:11435 python rlm/smart_rlm.py --tarefa "Oi"
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# ============= RESPOSTAS =============
+
+def resposta_padrao(prompt: str) -> str:
+    """
+    Resposta deterministica baseada no tipo de prompt do RLM.
+    - split: JSON com 2 sub-tarefas
+    - fast path: [UNCERTAIN] quando a pergunta parece complexa
+    - resto: eco curto do prompt
+    """
+    if '"subtasks"' in prompt:
+        return '{"subtasks": ["Identifique os pontos principais", "Resuma as conclusoes"]}'
+    if 'RAPIDAMENTE' in prompt:
+        pergunta = prompt.split('PERGUNTA:', 1)[-1].split('\n', 1)[0].strip()
+        if len(pergunta.split()) > 6:
+            return '[UNCERTAIN] Preciso analisar mais.'
+        return f'Resposta rapida: {pergunta}'
+    return f'Resposta fake para {len(prompt)} chars de prompt.'
+
+
+def carregar_roteiro(path: str):
+    """
+    Responder a partir de um roteiro JSON: lista de regras
+        [{"contem": "trecho do prompt", "resposta": "texto"}, ...]
+    aplicadas em ordem; sem regra que case, usa resposta_padrao.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        regras = json.load(f)
+
+    def responder(prompt: str) -> str:
+        for regra in regras:
+            if regra.get('contem', '') in prompt:
+                return regra['resposta']
+        return resposta_padrao(prompt)
+
+    return responder
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Handler HTTP com o subconjunto da API do Ollama usado pelo RLM."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path in ('/', '/api/version'):
+            self._send_json(200, {'version': '0.0.0-fake'})
+        elif self.path == '/api/tags':
+            self._send_json(200, {'models': [{'name': 'qwen3:4b'}]})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/api/generate':
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        tamanho = int(self.headers.get('Content-Length', 0))
+        req = json.loads(self.rfile.read(tamanho) or b'{}')
+        prompt = req.get('prompt', '')
+        model = req.get('model', '')
+
+        with self.server.lock:
+            self.server.generate_calls += 1
+            avaliados = self.server.avaliar_prompt(prompt)
+            carga = self.server.gpu(model)
+            falhou = self.server.sorteio.random() < self.server.taxa_falha
+            if falhou:
+                self.server.falhas += 1
+
+        if falhou:
+            self._send_json(500, {'error': 'falha simulada'})
+            return
+
+        time.sleep(carga + self.server.latencia_prompt * avaliados)
+
+        if not prompt:
+            # Prompt vazio = so carregar o modelo (aquecimento)
+            self._send_json(200, {'model': model, 'response': '', 'done': True,
+                                  'load_duration': int(carga * 1e9)})
+            return
+
+        texto = self.server.responder(prompt)
+        tokens = texto.split(' ')
+        tokens = [t + ' ' for t in tokens[:-1]] + tokens[-1:]
+        done_reason = 'stop'
+        num_predict = (req.get('options') or {}).get('num_predict')
+        if num_predict and 0 < num_predict < len(tokens):
+            tokens = tokens[:num_predict]
+            texto = ''.join(tokens)
+            done_reason = 'length'
+
+        comum = {
+            'model': model,
+            'done_reason': done_reason,
+            'prompt_eval_count': avaliados,
+            'prompt_eval_duration': int(self.server.latencia_prompt * avaliados * 1e9),
+            'eval_count': len(tokens),
+            'eval_duration': int(self.server.latencia_token * len(tokens) * 1e9),
+            'load_duration': int(carga * 1e9),
+        }
+
+        if not req.get('stream', True):
+            time.sleep(self.server.latencia_token * len(tokens))
+            self._send_json(200, {**comum, 'response': texto, 'done': True})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for token in tokens:
+                time.sleep(self.server.latencia_token)
+                self._write_chunk({'model': model, 'response': token, 'done': False})
+            self._write_chunk({**comum, 'response': '', 'done': True})
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # cliente fechou o stream (ex: fast path incerto)
+
+    def _write_chunk(self, payload: dict):
+        linha = (json.dumps(payload) + '\n').encode('utf-8')
+        self.wfile.write(f'{len(linha):x}\r\n'.encode('ascii') + linha + b'\r\n')
+        self.wfile.flush()
+
+
+class KVCacheSimulado:
+    """Slots com o ultimo prompt de cada um (como OLLAMA_NUM_PARALLEL)."""
+
+    def __init__(self, slots: int):
+        self.slots = [''] * max(1, slots)
+
+    def __call__(self, prompt: str) -> int:
+        """Tokens (~4 chars) que precisam ser avaliados para este prompt."""
+        comuns = [len(os.path.commonprefix([prompt, anterior])) for anterior in self.slots]
+        melhor = max(range(len(self.slots)), key=comuns.__getitem__)
+        if comuns[melhor] == 0:
+            melhor = 0  # sem prefixo util: substitui o slot mais antigo
+        reaproveitado = comuns[melhor]
+        self.slots.pop(melhor)
+        self.slots.append(prompt)
+        return (len(prompt) - reaproveitado) // 4
+
+
+class GPUSimulada:
+    """Modelos carregados, LRU (como OLLAMA_MAX_LOADED_MODELS; 0 = sem limite)."""
+
+    def __init__(self, capacidade: int, latencia_carga: float):
+        self.capacidade = capacidade
+        self.latencia_carga = latencia_carga
+        self.residentes = OrderedDict()
+        self.cargas = 0
+
+    def __call__(self, modelo: str) -> float:
+        """Segundos de carga para atender este modelo agora."""
+        if modelo in self.residentes:
+            self.residentes.move_to_end(modelo)
+            return 0.0
+        self.residentes[modelo] = True
+        while self.capacidade and len(self.residentes) > self.capacidade:
+            self.residentes.popitem(last=False)
+        self.cargas += 1
+        return self.latencia_carga
+
+
+def criar_servidor(host: str = '127.0.0.1', porta: int = 0,
+                   latencia_token: float = 0.0, responder=None,
+                   verbose: bool = False, latencia_prompt: float = 0.0,
+                   slots: int = 1, taxa_falha: float = 0.0,
+                   seed: int = 0, latencia_carga: float = 0.0,
+                   modelos_na_gpu: int = 0) -> ThreadingHTTPServer:
+    """
+    Cria (sem iniciar) um Fake Ollama. Com porta=0 o SO escolhe a porta;
+    use server.server_address para descobrir qual.
+    """
+    server = ThreadingHTTPServer((host, porta), FakeOllamaHandler)
+    server.daemon_threads = True
+    server.latencia_token = latencia_token
+    server.latencia_prompt = latencia_prompt
+    server.avaliar_prompt = KVCacheSimulado(slots)
+    server.gpu = GPUSimulada(modelos_na_gpu, latencia_carga)
+    server.responder = responder or resposta_padrao
+    server.verbose = verbose
+    server.generate_calls = 0
+    server.taxa_falha = taxa_falha
+    server.sorteio = random.Random(seed)
+    server.falhas = 0
+    server.lock = threading.Lock()
+    return server
+
+
+# ============= CLI =============
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fake Ollama para testar o RLM localmente"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Interface")
+    parser.add_argument("--porta", type=int, default=11435, help="Porta HTTP")
+    parser.add_argument(
+        "--latencia-token",
+        type=float,
+        default=0.0,
+        help="Segundos por token gerado"
+    )
+    parser.add_argument(
+        "--latencia-prompt",
+        type=float,
+        default=0.0,
+        help="Segundos por token de prompt avaliado (fora do KV cache)"
+    )
+    parser.add_argument("--slots", type=int, default=1, help="Slots de KV cache (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--taxa-falha", type=float, default=0.0, help="Fracao de generates que respondem HTTP 500")
+    parser.add_argument("--latencia-carga", type=float, default=0.0, help="Segundos para carregar um modelo fora da GPU")
+    parser.add_argument("--modelos-na-gpu", type=int, default=0, help="Modelos carregados ao mesmo tempo (0 = sem limite)")
+    parser.add_argument("--roteiro", default=None, help="JSON com regras [{contem, resposta}]")
+    parser.add_argument("--verbose", action="store_true", help="Loga cada request")
+    args = parser.parse_args()
+
+    server = criar_servidor(
+        args.host, args.porta, args.latencia_token, verbose=args.verbose,
+        latencia_prompt=args.latencia_prompt, slots=args.slots,
+        taxa_falha=args.taxa_falha,
+        latencia_carga=args.latencia_carga, modelos_na_gpu=args.modelos_na_gpu,
+        responder=carregar_roteiro(args.roteiro) if args.roteiro else None
+    )
+    print(f"[FakeOllama] Ouvindo em http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[FakeOllama] Encerrado")
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Map-Reduce recursivo sobre o contexto completo
+
+Em vez de cortar o contexto em contexto[:2000], divide o texto em trechos
+que cabem na janela do modelo, roda cada sub-tarefa sobre cada trecho
+(MAP) e junta as respostas parciais em arvore, de `fanout` em `fanout`
+(REDUCE), ate sobrar uma resposta por sub-tarefa.
+
+Limites:
+- no maximo fanout ** max_depth trechos por sub-tarefa; contextos maiores
+  que isso sao amostrados em janelas espalhadas pelo arquivo
+- cada prompt de reduce recebe no maximo `fanout` parciais cortadas para
+  caber em chunk_chars
+- os trechos sao (inicio, fim); o texto so e fatiado na hora do MAP
+"""
+
+import math
+
+
+# Marcador que o MAP usa quando o trecho nao tem nada relevante
+MARCADOR_VAZIO = '[NADA]'
+
+
+def cortar_em_linha(texto, inicio: int, fim: int) -> int:
+    """
+    Ajusta `fim` para a ultima quebra de linha da janela, se ela estiver
+    na segunda metade (evita cortar linhas de log no meio).
+    """
+    if fim >= len(texto):
+        return len(texto)
+    quebra = texto.rfind('\n', inicio + (fim - inicio) // 2, fim)
+    return quebra + 1 if quebra != -1 else fim
+
+
+def planejar_segmentos(texto, chunk_chars: int, fanout: int, max_depth: int) -> list:
+    """
+    Retorna a lista de trechos (inicio, fim) que o MAP vai processar.
+
+    Se o texto cabe em fanout ** max_depth trechos, cobre o texto todo
+    em sequencia; senao, usa janelas de chunk_chars espalhadas de forma
+    uniforme (amostragem com numero de chamadas limitado).
+    """
+    total = len(texto)
+    if total == 0:
+        return [(0, 0)]
+
+    max_trechos = max(1, fanout ** max_depth)
+    necessarios = math.ceil(total / chunk_chars)
+
+    if necessarios <= max_trechos:
+        segmentos = []
+        inicio = 0
+        while inicio < total:
+            fim = cortar_em_linha(texto, inicio, inicio + chunk_chars)
+            segmentos.append((inicio, fim))
+            inicio = fim
+        return segmentos
+
+    passo = (total - chunk_chars) / (max_trechos - 1) if max_trechos > 1 else 0
+    return [
+        (int(i * passo), int(i * passo) + chunk_chars)
+        for i in range(max_trechos)
+    ]
+
+
+def agrupar(itens: list, fanout: int) -> list:
+    """Divide a lista em grupos consecutivos de ate `fanout` itens."""
+    return [itens[i:i + fanout] for i in range(0, len(itens), fanout)]
+
+
+def map_reduce(subtarefas: list, texto, map_fn, reduce_fn, parallel_map,
+               chunk_chars: int, fanout: int, max_depth: int) -> list:
+    """
+    Executa o map-reduce de todas as sub-tarefas sobre o texto.
+
+    Args:
+        map_fn(subtarefa, trecho, indice, total) -> str
+        reduce_fn(subtarefa, parciais) -> str
+        parallel_map(fn, itens) -> list  (mantem a ordem dos itens)
+
+    Returns:
+        Uma resposta por sub-tarefa, na ordem de `subtarefas`
+    """
+    fanout = max(2, fanout)
+    segmentos = planejar_segmentos(texto, chunk_chars, fanout, max_depth)
+    total = len(segmentos)
+    print(f"[MapReduce] {len(texto)} chars -> {total} trecho(s) x {len(subtarefas)} sub-tarefa(s)")
+
+    # MAP: (sub-tarefa, trecho) em paralelo. Ordem por trecho: o prompt
+    # comeca pelo trecho, entao chamadas vizinhas reaproveitam o KV cache
+    n = len(subtarefas)
+    pares = [(s, j) for j in range(total) for s in range(n)]
+
+    def _map(par):
+        s, j = par
+        inicio, fim = segmentos[j]
+        return map_fn(subtarefas[s], texto[inicio:fim], j + 1, total)
+
+    parciais = parallel_map(_map, pares)
+    niveis = [parciais[s::n] for s in range(n)]
+
+    # REDUCE: nivel a nivel, todos os grupos de todas as sub-tarefas juntos
+    while any(len(nivel) > 1 for nivel in niveis):
+        grupos = []
+        for s, nivel in enumerate(niveis):
+            if len(nivel) > 1:
+                grupos.extend((s, grupo) for grupo in agrupar(nivel, fanout))
+
+        reduzidos = parallel_map(
+            lambda item: _reduzir(subtarefas[item[0]], item[1], reduce_fn),
+            grupos
+        )
+
+        novos = [[] if len(nivel) > 1 else nivel for nivel in niveis]
+        for (s, _), resultado in zip(grupos, reduzidos):
+            novos[s].append(resultado)
+        niveis = novos
+
+    return [
+        nivel[0] if not _vazio(nivel[0]) else "Nada relevante encontrado no contexto."
+        for nivel in niveis
+    ]
+
+
+def _vazio(parcial: str) -> bool:
+    return not parcial or parcial.strip().startswith(MARCADOR_VAZIO)
+
+
+def _reduzir(subtarefa, parciais: list, reduce_fn) -> str:
+    """Reduz um grupo, sem chamar o LLM quando sobra 0 ou 1 parcial util."""
+    uteis = [p for p in parciais if not _vazio(p)]
+    if not uteis:
+        return MARCADOR_VAZIO
+    if len(uteis) == 1:
+        return uteis[0]
+    return reduce_fn(subtarefa, uteis)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Memoizacao das sub-tarefas (a etapa mais cara e mais repetida)
+
+Pedidos do mesmo usuario geram sub-tarefas quase iguais ("Identifique os
+erros no log", "identifique os erros no log.") sobre o mesmo historico.
+O cache de respostas (rlm_cache.py) so acerta com o prompt identico; aqui
+a chave e:
+
+    texto da sub-tarefa normalizado (minusculas, sem acentos/pontuacao)
+    + modelo
+    + sha256 do trecho exato de contexto que foi no prompt
+    + respostas das sub-tarefas de que ela depende (DAG)
+
+Invalidacao: quando o contexto vem de arquivo (historico do
+ContextoManager), cada entrada guarda o caminho e a versao (mtime + tamanho)
+do arquivo. Se o arquivo mudou, as entradas antigas dele sao apagadas na
+proxima consulta (ou gravacao) com aquela origem, mesmo que o trecho
+usado seja o mesmo. Tambem da para
+invalidar na mao:
+
+    python rlm/memo_subtarefas.py invalidar rlm/contextos/joao_historico.txt
+    python rlm/memo_subtarefas.py stats
+
+LRU em memoria + SQLite em disco (RLM_MEMO_PATH), com limite de itens nos
+dois niveis e TTL.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from bm25_index import tokenizar
+
+
+# ============= CONFIGURACAO =============
+memo_habilitado = os.environ.get('RLM_MEMO', '1').lower() not in ('0', 'false', 'off')
+memo_path_padrao = os.environ.get('RLM_MEMO_PATH', 'rlm/cache/subtarefas.sqlite3')
+memo_ttl_padrao = float(os.environ.get('RLM_MEMO_TTL', str(7 * 24 * 3600)))
+memo_max_memoria_padrao = int(os.environ.get('RLM_MEMO_MAX_MEMORIA', '512'))
+memo_max_disco_padrao = int(os.environ.get('RLM_MEMO_MAX_DISCO', '20000'))
+
+
+def normalizar(texto: str) -> str:
+    """'Identifique os ERROS no log.' -> 'identifique os erros no log'"""
+    return ' '.join(tokenizar(texto))
+
+
+def _sha256(texto: str) -> str:
+    return hashlib.sha256(texto.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def origem_do_contexto(contexto) -> tuple:
+    """
+    (origem, versao) de um contexto lido de arquivo (ContextSource), ou
+    (None, None) para texto direto.
+    """
+    path = getattr(contexto, 'path', None)
+    if not path:
+        return None, None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None, None
+    return os.path.abspath(path), f"{st.st_mtime_ns}-{st.st_size}"
+
+
+class MemoSubtarefas:
+    """
+    Resultados de sub-tarefas, LRU (memoria) + SQLite (disco), thread-safe.
+
+    Uso:
+        chave = memo.chave(subtarefa, modelo, prefixo_do_prompt, entradas)
+        resposta = memo.get(chave, origem, versao)
+        if resposta is None:
+            resposta = processar(...)
+            memo.set(chave, resposta, origem, versao)
+    """
+
+    def __init__(self, path: str = None, max_memoria: int = None,
+                 max_disco: int = None, ttl: float = None):
+        self.path = path or memo_path_padrao
+        self.max_memoria = max_memoria if max_memoria is not None else memo_max_memoria_padrao
+        self.max_disco = max_disco if max_disco is not None else memo_max_disco_padrao
+        self.ttl = ttl if ttl is not None else memo_ttl_padrao
+
+        self._memoria = OrderedDict()  # chave -> (resposta, origem, versao, criado)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidados = 0
+        self._versoes = {}  # origem -> ultima versao vista do arquivo
+
+        if self.path != ':memory:':
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        import sqlite3
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS memo (
+                chave TEXT PRIMARY KEY,
+                resposta TEXT NOT NULL,
+                origem TEXT,
+                versao TEXT,
+                criado REAL NOT NULL,
+                acessado REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_memo_acessado ON memo(acessado)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_memo_origem ON memo(origem)")
+        self._db.commit()
+
+    @staticmethod
+    def chave(subtarefa: str, modelo: str, contexto_usado: str, entradas=()) -> str:
+        """Hash de (sub-tarefa normalizada, modelo, trecho de contexto, respostas dos pais)."""
+        bruto = json.dumps([
+            normalizar(subtarefa),
+            modelo,
+            _sha256(contexto_usado or ''),
+            [[normalizar(anterior), resposta] for anterior, resposta in entradas],
+        ], ensure_ascii=False)
+        return _sha256(bruto)
+
+    def _expirado(self, criado: float, agora: float) -> bool:
+        return bool(self.ttl) and agora - criado > self.ttl
+
+    def get(self, chave: str, origem: str = None, versao: str = None):
+        """Resultado memorizado ou None (miss, expirado ou arquivo de origem mudou)."""
+        agora = time.time()
+        with self._lock:
+            self._conferir_versao(origem, versao)
+            item = self._memoria.get(chave)
+            if item is None:
+                row = self._db.execute(
+                    "SELECT resposta, origem, versao, criado FROM memo WHERE chave = ?", (chave,)
+                ).fetchone()
+                item = tuple(row) if row is not None else None
+            if item is None:
+                self.misses += 1
+                return None
+
+            resposta, _origem, _versao, criado = item
+            if self._expirado(criado, agora):
+                self._memoria.pop(chave, None)
+                self._db.execute("DELETE FROM memo WHERE chave = ?", (chave,))
+                self._db.commit()
+                self.misses += 1
+                return None
+
+            if chave in self._memoria:
+                self._memoria.move_to_end(chave)
+            else:
+                self._db.execute("UPDATE memo SET acessado = ? WHERE chave = ?", (agora, chave))
+                self._db.commit()
+                self._guardar_memoria(chave, item)
+            self.hits += 1
+            return resposta
+
+    def set(self, chave: str, resposta: str, origem: str = None, versao: str = None):
+        """Grava nos dois niveis e aplica o limite de tamanho do disco."""
+        agora = time.time()
+        with self._lock:
+            self._conferir_versao(origem, versao)
+            self._guardar_memoria(chave, (resposta, origem, versao, agora))
+            self._db.execute(
+                "INSERT OR REPLACE INTO memo (chave, resposta, origem, versao, criado, acessado) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (chave, resposta, origem, versao, agora, agora)
+            )
+            total = self._db.execute("SELECT COUNT(*) FROM memo").fetchone()[0]
+            if total > self.max_disco:
+                self._db.execute(
+                    "DELETE FROM memo WHERE chave IN "
+                    "(SELECT chave FROM memo ORDER BY acessado ASC LIMIT ?)",
+                    (total - self.max_disco,)
+                )
+            self._db.commit()
+
+    def invalidar(self, origem: str) -> int:
+        """Apaga tudo que veio do arquivo `origem` (ex: historico reescrito). Retorna o total."""
+        origem = os.path.abspath(origem)
+        with self._lock:
+            self._versoes.pop(origem, None)
+            return self._invalidar(origem)
+
+    def _conferir_versao(self, origem: str, versao: str):
+        """Arquivo de origem mudou (ou primeira vez no processo): apaga as entradas das versoes antigas."""
+        if origem is None or self._versoes.get(origem) == versao:
+            return
+        self._versoes[origem] = versao
+        self._invalidar(origem, manter_versao=versao)
+
+    def _invalidar(self, origem: str, manter_versao: str = None) -> int:
+        for chave in [c for c, item in self._memoria.items()
+                      if item[1] == origem and (manter_versao is None or item[2] != manter_versao)]:
+            del self._memoria[chave]
+        if manter_versao is None:
+            cursor = self._db.execute("DELETE FROM memo WHERE origem = ?", (origem,))
+        else:
+            cursor = self._db.execute(
+                "DELETE FROM memo WHERE origem = ? AND versao IS NOT ?", (origem, manter_versao)
+            )
+        self._db.commit()
+        self.invalidados += cursor.rowcount
+        return cursor.rowcount
+
+    def _guardar_memoria(self, chave: str, item: tuple):
+        if self.max_memoria <= 0:
+            return
+        self._memoria[chave] = item
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def limpar(self) -> int:
+        with self._lock:
+            self._memoria.clear()
+            cursor = self._db.execute("DELETE FROM memo")
+            self._db.commit()
+            return cursor.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidados': self.invalidados,
+                'itens_memoria': len(self._memoria),
+                'itens_disco': self._db.execute("SELECT COUNT(*) FROM memo").fetchone()[0],
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_memos = {}
+_memos_lock = threading.Lock()
+
+
+def memo_padrao(path: str = None) -> MemoSubtarefas:
+    """Memo compartilhado do processo (um por arquivo), como cache_padrao."""
+    path = path or memo_path_padrao
+    with _memos_lock:
+        if path not in _memos:
+            _memos[path] = MemoSubtarefas(path)
+        return _memos[path]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memo de sub-tarefas do RLM")
+    parser.add_argument("--path", default=memo_path_padrao, help="Arquivo SQLite (padrao: RLM_MEMO_PATH)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("stats", help="Itens em disco")
+    invalidar = sub.add_parser("invalidar", help="Apaga as entradas de um arquivo de contexto")
+    invalidar.add_argument("origem", help="Arquivo de contexto (ex: historico do usuario)")
+    sub.add_parser("limpar", help="Apaga tudo")
+    args = parser.parse_args()
+
+    memo = MemoSubtarefas(args.path)
+    if args.comando == "stats":
+        print(json.dumps(memo.stats(), ensure_ascii=False))
+    elif args.comando == "invalidar":
+        print(f"[Memo] {memo.invalidar(args.origem)} entrada(s) de {args.origem} apagada(s)")
+    else:
+        print(f"[Memo] {memo.limpar()} entrada(s) apagada(s)")
+    memo.close()
+    sys.exit(0)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cascata de modelos por etapa + gerenciador de modelos carregados
+
+Cada etapa do pipeline (fast, split, subtask, map, reduce, aggregate) pode
+usar um modelo diferente; o que nao for configurado usa o modelo principal:
+
+    RLM_MODELS="fast=qwen3:0.6b,split=qwen3:0.6b"   (ou --modelos na CLI)
+
+Numa GPU so, alternar entre modelos a cada etapa faz o Ollama descarregar
+e recarregar os pesos (segundos por troca). O gerenciador:
+- pre-carrega os modelos configurados no startup (aquecer), com keep_alive
+- acompanha quais modelos estao carregados (visao deste processo, LRU com
+  RLM_MAX_LOADED_MODELS, o mesmo limite do OLLAMA_MAX_LOADED_MODELS)
+- quando o modelo de uma etapa leve (fast, split) nao esta carregado e
+  carrega-lo tiraria outro da GPU, usa o modelo principal ja carregado
+- soma o load_duration de cada modelo (custo das trocas)
+"""
+
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+from telemetria import LIMIAR_CARGA
+
+
+# ============= CONFIGURACAO =============
+modelos_padrao = os.environ.get('RLM_MODELS', '')
+# Modelos que cabem juntos na GPU (0 = sem limite, nunca evita troca)
+modelos_na_gpu_padrao = int(os.environ.get('RLM_MAX_LOADED_MODELS', '0'))
+aquecer_padrao = os.environ.get('RLM_WARMUP', '0').lower() in ('1', 'true', 'on')
+
+ETAPAS = ('fast', 'split', 'subtask', 'map', 'reduce', 'aggregate', 'repl')
+# Etapas em que o modelo principal serve de substituto sem perder qualidade
+ETAPAS_LEVES = ('fast', 'split')
+
+
+def parse_modelos(spec: str) -> dict:
+    """'fast=qwen3:0.6b,split=qwen3:0.6b' -> {'fast': 'qwen3:0.6b', ...}"""
+    modelos = {}
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        etapa, sep, modelo = item.partition('=')
+        etapa, modelo = etapa.strip(), modelo.strip()
+        if not sep or not modelo or etapa not in ETAPAS:
+            raise ValueError(f"modelo por etapa invalido: {item!r} (etapas: {', '.join(ETAPAS)})")
+        modelos[etapa] = modelo
+    return modelos
+
+
+class GerenciadorModelos:
+    """
+    Modelos carregados, aquecimento e tempo de carga, thread-safe.
+    Compartilhado pelo processo (gerenciador_padrao), ja que a GPU e uma so.
+    """
+
+    def __init__(self, capacidade: int = None):
+        self.capacidade = modelos_na_gpu_padrao if capacidade is None else capacidade
+        self.trocas_evitadas = 0
+        self.cargas = {}  # modelo -> {'cargas': n, 'load_ms': total}
+        self._residentes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def escolher(self, etapa: str, preferido: str, principal: str) -> str:
+        """Modelo que a etapa deve usar agora."""
+        if preferido == principal or not self.capacidade or etapa not in ETAPAS_LEVES:
+            return preferido
+        with self._lock:
+            if preferido in self._residentes or len(self._residentes) < self.capacidade:
+                return preferido
+            if principal in self._residentes:
+                self.trocas_evitadas += 1
+                return principal
+        return preferido
+
+    def registrar(self, modelo: str, resposta):
+        """Atualiza residentes e cargas a partir de uma resposta do Ollama."""
+        load_ms = (resposta.get('load_duration') or 0) / 1e6
+        with self._lock:
+            self._residentes[modelo] = True
+            self._residentes.move_to_end(modelo)
+            while self.capacidade and len(self._residentes) > self.capacidade:
+                self._residentes.popitem(last=False)
+            if load_ms >= LIMIAR_CARGA * 1000:
+                carga = self.cargas.setdefault(modelo, {'cargas': 0, 'load_ms': 0.0})
+                carga['cargas'] += 1
+                carga['load_ms'] += load_ms
+
+    def aquecer(self, cliente, modelos: list, principal: str, keep_alive: str) -> dict:
+        """
+        Pre-carrega os modelos (generate com prompt vazio). Se nao cabem
+        todos, so carrega os que cabem junto com o principal, que vai por
+        ultimo. Retorna {modelo: ms}.
+        """
+        outros = [m for m in dict.fromkeys(modelos) if m != principal]
+        if self.capacidade:
+            outros = outros[:self.capacidade - 1]
+        ordem = outros + [principal]
+        tempos = {}
+        for modelo in ordem:
+            inicio = time.perf_counter()
+            try:
+                resposta = cliente.generate(model=modelo, prompt='', keep_alive=keep_alive)
+            except Exception as e:
+                print(f"[Modelos] Falha ao aquecer {modelo}: {e}", file=sys.stderr)
+                continue
+            self.registrar(modelo, resposta)
+            tempos[modelo] = (time.perf_counter() - inicio) * 1000
+            print(f"[Modelos] {modelo} carregado em {tempos[modelo]:.0f}ms (keep_alive {keep_alive})",
+                  file=sys.stderr)
+        return tempos
+
+    def resumo(self) -> str:
+        """Linha com cargas por modelo e trocas evitadas (vazia se nada aconteceu)."""
+        with self._lock:
+            partes = [
+                f"{modelo}: {c['cargas']}x {c['load_ms']:.0f}ms"
+                for modelo, c in sorted(self.cargas.items())
+            ]
+            if self.trocas_evitadas:
+                partes.append(f"trocas evitadas: {self.trocas_evitadas}")
+        return ' | '.join(partes)
+
+
+_gerenciador = None
+_gerenciador_lock = threading.Lock()
+
+
+def gerenciador_padrao() -> GerenciadorModelos:
+    """Gerenciador do processo (RLM_MAX_LOADED_MODELS)."""
+    global _gerenciador
+    with _gerenciador_lock:
+        if _gerenciador is None:
+            _gerenciador = GerenciadorModelos()
+        return _gerenciador
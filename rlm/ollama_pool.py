@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pool de hosts Ollama (varias maquinas/GPUs atras do mesmo RLM)
+
+Substitui o Client global dos modulos (mesma interface de generate):
+
+    RLM_OLLAMA_HOSTS="http://gpu1:11434,http://gpu2:11434"
+
+- cada generate vai para o host saudavel com menos requests em andamento
+  (empate: menor latencia media)
+- falha de conexao, timeout ou HTTP 5xx/429: nova tentativa em outro host,
+  com backoff exponencial com jitter (RLM_OLLAMA_RETRIES)
+- circuit breaker: RLM_OLLAMA_FALHAS falhas seguidas tiram o host da
+  rotacao por RLM_OLLAMA_COOLDOWN segundos; depois uma chamada de teste
+  decide se ele volta
+- hedge (RLM_OLLAMA_HEDGE, so sem stream): se a chamada passa de N ms
+  (ou do p95 recente, com `auto`), dispara a mesma chamada em outro host
+  e fica com a primeira que responder
+
+Erros 4xx (ex: modelo nao encontrado) sobem direto, sem nova tentativa.
+Streams so trocam de host antes do primeiro chunk.
+
+ollama/httpx (~0.3s de import) so sao carregados na primeira chamada:
+criar o pool no import dos modulos nao atrasa o startup das CLIs.
+"""
+
+import os
+import math
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+# ============= CONFIGURACAO =============
+hosts_padrao = os.environ.get('RLM_OLLAMA_HOSTS', '')
+tentativas_padrao = int(os.environ.get('RLM_OLLAMA_RETRIES', '2'))
+falhas_padrao = int(os.environ.get('RLM_OLLAMA_FALHAS', '3'))
+cooldown_padrao = float(os.environ.get('RLM_OLLAMA_COOLDOWN', '30'))
+hedge_padrao = os.environ.get('RLM_OLLAMA_HEDGE', 'off')
+
+BACKOFF_BASE = 0.2   # s
+BACKOFF_MAX = 5.0    # s
+AMOSTRAS_HEDGE = 200  # latencias recentes para o p95 do hedge auto
+MIN_AMOSTRAS_HEDGE = 20
+
+
+def ler_hedge(valor):
+    """
+    RLM_OLLAMA_HEDGE -> None (desligado), 'auto' ou o limite em ms.
+    Valor invalido desliga o hedge com um aviso (nao derruba cada generate).
+    """
+    valor = str(valor).strip().lower()
+    if valor in ('', 'off', '0'):
+        return None
+    if valor == 'auto':
+        return 'auto'
+    try:
+        ms = float(valor)
+    except ValueError:
+        ms = -1.0
+    if not (ms > 0 and math.isfinite(ms)):
+        print(f"[Pool] RLM_OLLAMA_HEDGE invalido ({valor!r}): use off, auto ou ms > 0; hedge desligado")
+        return None
+    return ms
+
+
+def lista_hosts(spec: str) -> list:
+    return [h.strip() for h in (spec or '').split(',') if h.strip()]
+
+
+def _reprocessavel(erro: Exception) -> bool:
+    """Falha do host (vale tentar de novo/noutro) x erro do pedido."""
+    import httpx
+    from ollama import ResponseError
+    if isinstance(erro, ResponseError):
+        return erro.status_code >= 500 or erro.status_code == 429
+    return isinstance(erro, (ConnectionError, httpx.TransportError, TimeoutError))
+
+
+class _Host:
+    def __init__(self, url: str, client_kwargs: dict):
+        self.url = url
+        self._client_kwargs = client_kwargs
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.em_voo = 0
+        self.chamadas = 0
+        self.erros = 0
+        self.falhas_seguidas = 0
+        self.aberto_ate = 0.0   # circuito aberto ate este time.monotonic()
+        self.testando = False   # meio-aberto: uma chamada de teste em andamento
+        self.latencia = None    # EWMA (s)
+
+    @property
+    def client(self):
+        """Client do host, criado (e ollama importado) no primeiro uso."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from ollama import Client
+                    self._client = Client(host=self.url, **self._client_kwargs)
+        return self._client
+
+    def estado(self, agora: float) -> str:
+        if self.aberto_ate > agora:
+            return 'aberto'
+        return 'meio-aberto' if self.aberto_ate else 'fechado'
+
+
+class OllamaPool:
+    """
+    Varios hosts Ollama com a interface de generate do Client, thread-safe.
+
+    Uso:
+        cliente = OllamaPool(["http://gpu1:11434", "http://gpu2:11434"])
+        cliente.generate(model=..., prompt=..., stream=False)
+    """
+
+    def __init__(self, hosts: list, tentativas: int = None, limiar_falhas: int = None,
+                 cooldown: float = None, hedge: str = None, **client_kwargs):
+        if not hosts:
+            raise ValueError("OllamaPool precisa de pelo menos um host")
+        self.hosts = [_Host(url, client_kwargs) for url in hosts]
+        self.tentativas = tentativas_padrao if tentativas is None else tentativas
+        self.limiar_falhas = limiar_falhas or falhas_padrao
+        self.cooldown = cooldown_padrao if cooldown is None else cooldown
+        self.hedge = ler_hedge(hedge_padrao if hedge is None else hedge)
+        self.hedges = 0
+        self.hedges_vencedores = 0
+        self._latencias = deque(maxlen=AMOSTRAS_HEDGE)
+        self._lock = threading.Lock()
+        self._sorteio = random.Random()
+        self._hedge_pool = None
+
+    # ----- escolha de host -----
+
+    def _escolher(self, excluir=()) -> _Host:
+        """Host saudavel com menos requests em andamento (reserva o slot)."""
+        agora = time.monotonic()
+        with self._lock:
+            candidatos = [
+                h for h in self.hosts
+                if h not in excluir and (
+                    h.estado(agora) == 'fechado'
+                    or (h.estado(agora) == 'meio-aberto' and not h.testando)
+                )
+            ]
+            if not candidatos:
+                # Todos fora: tenta o que volta primeiro em vez de falhar direto
+                restantes = [h for h in self.hosts if h not in excluir]
+                if not restantes:
+                    return None
+                candidatos = sorted(restantes, key=lambda h: h.aberto_ate)[:1]
+            host = min(candidatos, key=lambda h: (
+                h.em_voo, h.latencia if h.latencia is not None else 0.0, self._sorteio.random()
+            ))
+            if host.estado(agora) != 'fechado':
+                host.testando = True
+            host.em_voo += 1
+            host.chamadas += 1
+            return host
+
+    def _liberar(self, host: _Host, inicio: float, erro: Exception = None):
+        duracao = time.monotonic() - inicio
+        with self._lock:
+            host.em_voo -= 1
+            host.testando = False
+            if erro is None or not _reprocessavel(erro):
+                host.falhas_seguidas = 0
+                host.aberto_ate = 0.0
+                host.latencia = duracao if host.latencia is None else 0.8 * host.latencia + 0.2 * duracao
+                return
+            host.erros += 1
+            host.falhas_seguidas += 1
+            if host.falhas_seguidas >= self.limiar_falhas:
+                if host.aberto_ate <= time.monotonic():
+                    print(f"[Pool] Circuito aberto para {host.url} ({host.falhas_seguidas} falha(s) seguida(s))")
+                host.aberto_ate = time.monotonic() + self.cooldown
+
+    def _backoff(self, tentativa: int):
+        """Backoff exponencial com jitter completo."""
+        time.sleep(self._sorteio.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** tentativa)))
+
+    # ----- generate -----
+
+    def generate(self, **kwargs):
+        if kwargs.get('stream'):
+            return self._generate_stream(kwargs)
+        return self._com_tentativas(lambda excluir: self._generate_hedge(kwargs, excluir))
+
+    def _com_tentativas(self, fn):
+        """Roda fn(excluir) com novas tentativas em outros hosts."""
+        excluir = set()
+        for tentativa in range(self.tentativas + 1):
+            try:
+                return fn(excluir)
+            except _FalhaHost as falha:
+                excluir.add(falha.host)
+                if len(excluir) >= len(self.hosts):
+                    excluir = set()  # todos falharam uma vez: pode repetir
+                if tentativa >= self.tentativas:
+                    raise falha.erro
+                print(f"[Pool] {falha.host.url}: {falha.erro} -> nova tentativa ({tentativa + 1}/{self.tentativas})")
+                self._backoff(tentativa)
+
+    def _chamar(self, host: _Host, kwargs: dict):
+        inicio = time.monotonic()
+        try:
+            resposta = host.client.generate(**kwargs)
+        except Exception as e:
+            self._liberar(host, inicio, e)
+            if _reprocessavel(e):
+                raise _FalhaHost(host, e) from e
+            raise
+        self._liberar(host, inicio)
+        with self._lock:
+            self._latencias.append(time.monotonic() - inicio)
+        return resposta
+
+    def _limite_hedge(self):
+        """Segundos ate disparar o hedge, ou None (desligado)."""
+        if self.hedge is None or len(self.hosts) < 2:
+            return None
+        if self.hedge == 'auto':
+            with self._lock:
+                amostras = sorted(self._latencias)
+            if len(amostras) < MIN_AMOSTRAS_HEDGE:
+                return None
+            return amostras[int(0.95 * (len(amostras) - 1))]
+        return self.hedge / 1000
+
+    def _generate_hedge(self, kwargs: dict, excluir: set):
+        primeiro = self._escolher(excluir)
+        limite = self._limite_hedge()
+        if limite is None:
+            return self._chamar(primeiro, kwargs)
+
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=2 * len(self.hosts) + 4)
+        futuros = {self._hedge_pool.submit(self._chamar, primeiro, kwargs): primeiro}
+        feitos, _ = wait(futuros, timeout=limite)
+        if not feitos:
+            segundo = self._escolher(excluir | {primeiro})
+            if segundo is not None and segundo is not primeiro:
+                with self._lock:
+                    self.hedges += 1
+                futuros[self._hedge_pool.submit(self._chamar, segundo, kwargs)] = segundo
+            else:
+                self._liberar_reserva(segundo)
+
+        # Primeira resposta boa vence; a outra termina sozinha e e descartada
+        pendentes = set(futuros)
+        erro = None
+        while pendentes:
+            feitos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in feitos:
+                try:
+                    resposta = futuro.result()
+                except Exception as e:
+                    erro = e
+                    continue
+                if futuros[futuro] is not primeiro:
+                    with self._lock:
+                        self.hedges_vencedores += 1
+                return resposta
+        raise erro
+
+    def _liberar_reserva(self, host):
+        """Devolve um slot reservado por _escolher e nao usado."""
+        if host is None:
+            return
+        with self._lock:
+            host.em_voo -= 1
+            host.chamadas -= 1
+            host.testando = False
+
+    def _generate_stream(self, kwargs: dict):
+        """Stream: troca de host so ate o primeiro chunk chegar."""
+        excluir = set()
+        for tentativa in range(self.tentativas + 1):
+            host = self._escolher(excluir)
+            inicio = time.monotonic()
+            try:
+                stream = host.client.generate(**kwargs)
+                primeiro = next(stream)
+            except StopIteration:
+                self._liberar(host, inicio)
+                return
+            except Exception as e:
+                self._liberar(host, inicio, e)
+                if not _reprocessavel(e) or tentativa >= self.tentativas:
+                    raise
+                print(f"[Pool] {host.url}: {e} -> nova tentativa ({tentativa + 1}/{self.tentativas})")
+                excluir.add(host)
+                if len(excluir) >= len(self.hosts):
+                    excluir = set()
+                self._backoff(tentativa)
+                continue
+
+            erro = None
+            try:
+                yield primeiro
+                yield from stream
+            except GeneratorExit:
+                raise  # consumidor fechou o stream: nao e falha do host
+            except Exception as e:
+                erro = e
+                raise
+            finally:
+                self._liberar(host, inicio, erro)
+            return
+
+    # ----- estado -----
+
+    def estado(self) -> list:
+        agora = time.monotonic()
+        with self._lock:
+            return [{
+                'host': h.url,
+                'circuito': h.estado(agora),
+                'em_voo': h.em_voo,
+                'chamadas': h.chamadas,
+                'erros': h.erros,
+                'latencia_ms': round(h.latencia * 1000, 1) if h.latencia is not None else None,
+            } for h in self.hosts]
+
+    def prometheus(self) -> str:
+        """Metricas por host no formato texto do Prometheus."""
+        linhas = []
+        for nome, campo, tipo in (
+            ('rlm_ollama_host_inflight', 'em_voo', 'gauge'),
+            ('rlm_ollama_host_calls_total', 'chamadas', 'counter'),
+            ('rlm_ollama_host_errors_total', 'erros', 'counter'),
+        ):
+            linhas.append(f'# TYPE {nome} {tipo}')
+            for h in self.estado():
+                linhas.append(f'{nome}{{host="{h["host"]}"}} {h[campo]}')
+        linhas.append('# TYPE rlm_ollama_host_up gauge')
+        for h in self.estado():
+            linhas.append(f'rlm_ollama_host_up{{host="{h["host"]}"}} {0 if h["circuito"] == "aberto" else 1}')
+        linhas += [
+            '# HELP rlm_ollama_hedges_total Chamadas lentas repetidas em outro host (hedge).',
+            '# TYPE rlm_ollama_hedges_total counter',
+            f'rlm_ollama_hedges_total {self.hedges}',
+            '# HELP rlm_ollama_hedges_won_total Hedges que responderam antes da chamada original.',
+            '# TYPE rlm_ollama_hedges_won_total counter',
+            f'rlm_ollama_hedges_won_total {self.hedges_vencedores}',
+        ]
+        return '\n'.join(linhas) + '\n'
+
+
+class _FalhaHost(Exception):
+    """Falha reprocessavel de um host (uso interno das tentativas)."""
+
+    def __init__(self, host: _Host, erro: Exception):
+        super().__init__(str(erro))
+        self.host = host
+        self.erro = erro
+
+
+def criar_cliente(hosts: str = None, **client_kwargs) -> OllamaPool:
+    """
+    Cliente Ollama dos modulos: RLM_OLLAMA_HOSTS (lista separada por
+    virgula) ou `hosts`, senao OLLAMA_HOST. Com um host so, o pool ainda
+    da novas tentativas e o circuit breaker.
+    """
+    urls = lista_hosts(hosts_padrao) or lista_hosts(hosts)
+    return OllamaPool(urls, **client_kwargs)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prazo (deadline) de um pedido e degradacao quando o tempo acaba
+
+O middleware espera no maximo 300s e o pipeline completo nao tinha nocao
+de tempo. Com chat_completion(..., deadline_ms=...) o SmartRLM responde
+dentro do prazo, degradando em passos:
+
+    1. cada generate tem timeout = tempo restante da etapa e num_predict
+       limitado ao que da para gerar nesse tempo (tokens/s medido por
+       modelo); chamada que passa do timeout e interrompida
+       (chamadas_interrompidas, respostas_cortadas); resposta cortada nao
+       vai para o cache nem para o memo de sub-tarefas
+    2. sub-tarefa que nao cabe antes da reserva da agregacao e pulada
+       (subtarefas_puladas)
+    3. sem tempo para agregar: resposta = resultados parciais concatenados
+       (sem_agregacao)
+    4. nenhuma sub-tarefa terminou: resposta do fast path (resposta_fast,
+       ou sem_resposta e modo 'prazo' se nem ele respondeu)
+
+split/subtask/map/reduce param antes da reserva (fracao do prazo guardada
+para a agregacao); fast e aggregate podem usar o prazo ate o fim.
+"""
+
+import os
+import time
+import queue
+import threading
+import contextvars
+from collections import Counter
+
+
+# ============= CONFIGURACAO =============
+# Prazo padrao de chat_completion em ms (0 = sem prazo)
+deadline_padrao = int(os.environ.get('RLM_DEADLINE_MS', '0'))
+# Fracao do prazo reservada para a agregacao
+reserva_padrao = float(os.environ.get('RLM_DEADLINE_RESERVA', '0.2'))
+# Chamada com menos tempo que isso nem comeca
+min_chamada_ms_padrao = float(os.environ.get('RLM_DEADLINE_MIN_CHAMADA_MS', '250'))
+# Vazao assumida antes da primeira resposta do modelo
+tokens_por_segundo_padrao = float(os.environ.get('RLM_TOKENS_POR_SEGUNDO', '20'))
+
+ETAPAS_ANTES_DA_RESERVA = ('split', 'subtask', 'map', 'reduce')
+NUM_PREDICT_MINIMO = 16
+# Parte do tempo da chamada que vai para gerar tokens (o resto e prompt eval)
+FRACAO_GERACAO = 0.8
+# Resultado de sub-tarefa pulada (fica fora da agregacao)
+PULADA = '[PULADA: prazo esgotado]'
+
+
+class PrazoEsgotado(Exception):
+    """Nao ha tempo para a chamada, ou ela foi interrompida no prazo."""
+
+
+class Prazo:
+    """
+    Prazo de um pedido, compartilhado pelas threads dele (thread-safe).
+
+    Uso:
+        prazo = Prazo(5000)
+        segundos = prazo.verificar('subtask')   # PrazoEsgotado se nao cabe
+        ...
+        prazo.degradar('subtarefas_puladas')
+        resultado.update(prazo.relatorio())
+    """
+
+    def __init__(self, deadline_ms: float, reserva: float = None, min_chamada_ms: float = None):
+        self.deadline_ms = deadline_ms
+        self.fim = time.monotonic() + deadline_ms / 1000
+        self.reserva_ms = deadline_ms * (reserva_padrao if reserva is None else reserva)
+        self.min_chamada_ms = min_chamada_ms_padrao if min_chamada_ms is None else min_chamada_ms
+        self.degradacoes = []  # na ordem em que aconteceram
+        self.contagem = Counter()
+        self._lock = threading.Lock()
+
+    def restante_ms(self, etapa: str = None) -> float:
+        """Tempo que sobra para `etapa` (descontada a reserva nas etapas antes da agregacao)."""
+        restante = (self.fim - time.monotonic()) * 1000
+        if etapa in ETAPAS_ANTES_DA_RESERVA:
+            restante -= self.reserva_ms
+        return restante
+
+    def sem_tempo(self, etapa: str) -> bool:
+        return self.restante_ms(etapa) < self.min_chamada_ms
+
+    def verificar(self, etapa: str) -> float:
+        """Timeout (s) da proxima chamada de `etapa`; PrazoEsgotado se nao cabe mais nenhuma."""
+        restante = self.restante_ms(etapa)
+        if restante < self.min_chamada_ms:
+            raise PrazoEsgotado(f"prazo esgotado antes de '{etapa}'")
+        return restante / 1000
+
+    def degradar(self, nome: str, quantidade: int = 1):
+        with self._lock:
+            if nome not in self.contagem:
+                self.degradacoes.append(nome)
+            self.contagem[nome] += quantidade
+
+    def relatorio(self) -> dict:
+        """Campos que entram no resultado do chat_completion."""
+        with self._lock:
+            return {
+                'degradacoes': list(self.degradacoes),
+                'prazo': {
+                    'deadline_ms': int(self.deadline_ms),
+                    'restante_ms': int(max(0.0, self.restante_ms())),
+                    **self.contagem,
+                },
+            }
+
+
+# ----- num_predict pelo tempo restante -----
+
+_vazao = {}  # modelo -> tokens/s (media movel)
+_vazao_lock = threading.Lock()
+
+
+def registrar_vazao(modelo: str, resposta: dict):
+    """Atualiza os tokens/s do modelo com o chunk final de uma geracao."""
+    tokens = resposta.get('eval_count') or 0
+    duracao = (resposta.get('eval_duration') or 0) / 1e9
+    if tokens < 4 or duracao <= 0:
+        return
+    with _vazao_lock:
+        anterior = _vazao.get(modelo)
+        atual = tokens / duracao
+        _vazao[modelo] = atual if anterior is None else 0.7 * anterior + 0.3 * atual
+
+
+def tokens_por_segundo(modelo: str) -> float:
+    with _vazao_lock:
+        return _vazao.get(modelo, tokens_por_segundo_padrao)
+
+
+def opcoes_com_prazo(opcoes: dict, segundos: float, modelo: str) -> tuple:
+    """
+    Copia dos kwargs do generate com options.num_predict limitado ao que
+    o modelo gera em `segundos`. Retorna (opcoes, limitou).
+    """
+    limite = max(NUM_PREDICT_MINIMO, int(segundos * FRACAO_GERACAO * tokens_por_segundo(modelo)))
+    options = dict(opcoes.get('options') or {})
+    atual = options.get('num_predict')
+    if atual is not None and 0 <= atual <= limite:
+        return opcoes, False
+    options['num_predict'] = limite
+    return {**opcoes, 'options': options}, True
+
+
+# ----- timeout por chamada -----
+
+class _Erro:
+    def __init__(self, erro: Exception):
+        self.erro = erro
+
+
+_FIM = object()
+
+
+def iterar_com_prazo(stream, segundos: float):
+    """
+    Itera um stream do Ollama por no maximo `segundos`; depois levanta
+    PrazoEsgotado. Uma thread le o stream (a leitura bloqueia no prompt
+    eval e entre tokens); ao estourar, ela fecha o stream no proximo
+    chunk e o Ollama para de gerar.
+    """
+    fila = queue.Queue()
+    parar = threading.Event()
+
+    def _ler():
+        try:
+            for chunk in stream:
+                if parar.is_set():
+                    break
+                fila.put(chunk)
+        except Exception as e:
+            fila.put(_Erro(e))
+        finally:
+            fechar = getattr(stream, 'close', None)
+            if fechar is not None:
+                fechar()
+            fila.put(_FIM)
+
+    threading.Thread(target=contextvars.copy_context().run, args=(_ler,), daemon=True).start()
+    limite = time.monotonic() + segundos
+    try:
+        while True:
+            try:
+                item = fila.get(timeout=max(0.0, limite - time.monotonic()))
+            except queue.Empty:
+                raise PrazoEsgotado("chamada interrompida no prazo") from None
+            if item is _FIM:
+                return
+            if isinstance(item, _Erro):
+                raise item.erro
+            yield item
+    finally:
+        parar.set()  # estourou ou o consumidor parou de ler
+
+
+def concatenar_parciais(subtarefas: list, resultados: list) -> str:
+    """Resposta sem agregacao: cada sub-tarefa com o seu resultado."""
+    return '\n\n'.join(
+        f"[{i}] {subtarefa}\n{resultado}"
+        for i, (subtarefa, resultado) in enumerate(zip(subtarefas, resultados), 1)
+        if resultado != PULADA
+    )
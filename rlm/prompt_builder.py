@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Montagem de prompts com orcamento de tokens e prefixo compartilhado
+
+Os prompts antigos cortavam o contexto em 500/2000 chars fixos e punham a
+tarefa antes do contexto, entao cada chamada tinha um prefixo diferente e
+o Ollama re-avaliava o contexto inteiro toda vez.
+
+Aqui o contexto vem PRIMEIRO, num bloco identico para fast path, split e
+todas as sub-tarefas da mesma pergunta; so o final (instrucao + tarefa)
+muda. O Ollama reaproveita o KV cache do prefixo igual e so avalia o
+final. O tamanho do bloco e calculado a partir do num_ctx do modelo.
+
+A tarefa nunca e cortada: se a parte variavel passa da reserva (ex:
+sub-tarefa com as respostas das que ela depende), quem encolhe e o
+contexto do prefixo, com a marca [...] no fim.
+
+Tokens sao estimados por caracteres (RLM_CHARS_POR_TOKEN); o Ollama nao
+expoe o tokenizer e a estimativa so precisa ser conservadora.
+"""
+
+import os
+import math
+
+from map_reduce import cortar_em_linha
+
+
+# ============= CONFIGURACAO =============
+num_ctx_padrao = int(os.environ.get('RLM_NUM_CTX', '4096'))
+keep_alive_padrao = os.environ.get('RLM_KEEP_ALIVE', '30m')
+chars_por_token = float(os.environ.get('RLM_CHARS_POR_TOKEN', '3.5'))
+
+# Tokens reservados para a resposta e para a parte variavel do prompt
+reserva_resposta_padrao = int(os.environ.get('RLM_RESERVA_RESPOSTA', '512'))
+reserva_tarefa_padrao = 256
+
+CABECALHO = "Use o CONTEXTO abaixo para resolver a tarefa que vem depois dele.\n\n"
+INICIO_CONTEXTO = f"{CABECALHO}CONTEXTO:\n"
+MARCA_CORTE = '\n[...]'
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimativa (para cima) de tokens do texto."""
+    return math.ceil(len(texto) / chars_por_token)
+
+
+def tokens_para_chars(tokens: int) -> int:
+    return max(0, int(tokens * chars_por_token))
+
+
+class PromptBuilder:
+    """
+    Monta prompts no formato:
+
+        CABECALHO + CONTEXTO (prefixo igual em todas as chamadas)
+        + instrucao + TAREFA + fechamento (parte variavel)
+
+    e calcula quanto contexto cabe no num_ctx.
+    """
+
+    def __init__(self, num_ctx: int = None, reserva_resposta: int = None,
+                 reserva_tarefa: int = None):
+        self.num_ctx = num_ctx or num_ctx_padrao
+        self.reserva_resposta = reserva_resposta or reserva_resposta_padrao
+        self.reserva_tarefa = reserva_tarefa or reserva_tarefa_padrao
+
+    def orcamento_contexto(self, variavel: str = '') -> int:
+        """
+        Caracteres de contexto que cabem no prefixo. Sem `variavel`, o do
+        prefixo compartilhado; com ela (instrucao + tarefa + fechamento),
+        desconta o tamanho real dela quando passa da reserva da tarefa.
+        """
+        parte_variavel = max(self.reserva_tarefa, estimar_tokens(variavel))
+        livre = self.num_ctx - self.reserva_resposta - parte_variavel - estimar_tokens(INICIO_CONTEXTO)
+        return tokens_para_chars(livre)
+
+    def _bloco(self, contexto: str, orcamento: int) -> str:
+        """CABECALHO + ate `orcamento` chars do contexto (corte em linha)."""
+        fim = cortar_em_linha(contexto, 0, orcamento) if len(contexto) > orcamento else len(contexto)
+        marca = '' if fim >= len(contexto) else MARCA_CORTE
+        return f"{INICIO_CONTEXTO}{contexto[0:fim].rstrip()}{marca}\n\n"
+
+    def prefixo(self, contexto) -> str:
+        """
+        Bloco de contexto compartilhado. Depende so do contexto e do
+        num_ctx, entao e identico em todas as chamadas da mesma pergunta.
+        """
+        if not contexto:
+            return ''
+        return self._bloco(contexto, self.orcamento_contexto())
+
+    def montar(self, prefixo: str, instrucao: str, tarefa: str, fechamento: str) -> str:
+        """
+        Prefixo + parte variavel. A tarefa vai inteira; se ela nao cabe na
+        reserva, o contexto do prefixo e cortado para o prompt caber no
+        num_ctx (so nesse caso o prefixo deixa de ser o compartilhado).
+        """
+        variavel = f"{instrucao}\n\nTAREFA: {tarefa}\n\n{fechamento}"
+        orcamento = self.orcamento_contexto(variavel)
+        if prefixo.startswith(INICIO_CONTEXTO) and len(prefixo) - len(INICIO_CONTEXTO) > orcamento:
+            contexto = prefixo[len(INICIO_CONTEXTO):].rstrip('\n')
+            if contexto.endswith(MARCA_CORTE):
+                contexto = contexto[:-len(MARCA_CORTE)]
+            prefixo = self._bloco(contexto, orcamento)
+        return f"{prefixo}{variavel}"
+
+    def limite_por_item(self, fixo: str, quantidade: int, minimo: int = 200) -> int:
+        """
+        Chars por item quando `quantidade` itens dividem o que sobra do
+        num_ctx depois do texto fixo (ex: resultados na agregacao).
+        """
+        livre = self.num_ctx - self.reserva_resposta - estimar_tokens(fixo)
+        return max(minimo, tokens_para_chars(livre) // max(1, quantidade))
+
+    def opcoes(self, keep_alive: str = None) -> dict:
+        """kwargs extras do generate: janela do modelo e tempo residente."""
+        return {
+            'options': {'num_ctx': self.num_ctx},
+            'keep_alive': keep_alive or keep_alive_padrao,
+        }
@@ -0,0 +1,613 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+REPL em processos isolados (sandbox): o modelo explora o contexto escrevendo Python
+
+No modo REPL (--repl / RLM_REPL=1) o contexto nao vai para o prompt: ele
+fica carregado num processo worker (arquivo via mmap, ver
+context_source.py) e o modelo escreve codigo que roda la. So o que o
+codigo imprime (cortado em RLM_REPL_SAIDA_MAX) volta para o modelo, entao
+da para analisar contextos muito maiores que a janela do modelo.
+
+    pool = pool_padrao()
+    with pool.abrir(ContextSource('log.txt')) as repl:
+        repl.executar("print(contar(r'ERROR'))")      # -> '1234\\n'
+        repl.executar("erros = buscar(r'timeout')")   # estado fica na sessao
+        repl.executar("len(erros)")                   # -> '20\\n'
+
+- workers pre-criados (RLM_REPL_WORKERS); cada sessao fica presa a um
+  worker e guarda as variaveis entre comandos
+- isolamento do worker (Linux, RLM_REPL_ISOLAMENTO=1, o padrao): antes de
+  aceitar comandos ele entra num network namespace vazio (sem rede), faz
+  chroot num diretorio vazio e ja apagado (sem sistema de arquivos, nem
+  para gravar) e perde o root: como root, setuid para RLM_REPL_UID
+  (nobody); sem root, um user namespace sem privilegios fora dele. O
+  arquivo de contexto chega como descritor aberto pelo pai. Se algum
+  passo falha, o pool nao sobe (ErroREPL); RLM_REPL_ISOLAMENTO=0 roda sem
+  isolamento (so limites e builtins reduzidos, NAO e sandbox)
+- limites por worker: CPU por comando (RLIMIT_CPU), memoria (RLIMIT_DATA;
+  o mmap do arquivo nao conta) e timeout de parede; worker que estoura o
+  timeout ou morre e recriado, e as sessoes dele recomecam do zero
+- builtins reduzidos (sem open/exec/eval/input) e import so de modulos
+  de texto/dados (re, json, collections...), carregados antes do chroot.
+  Sozinhos nao seguram nada (da para sair deles por introspeccao); quem
+  segura e o isolamento do processo
+
+No namespace de cada sessao:
+    contexto                 o contexto (str ou ContextSource: len, fatias, rfind)
+    buscar(padrao, limite)   [(posicao, linha)] das linhas que casam com o regex
+    contar(padrao)           ocorrencias do regex no contexto inteiro
+    trecho(posicao, tamanho) contexto[posicao:posicao + tamanho]
+"""
+
+import os
+import re
+import sys
+import atexit
+import threading
+
+from prompt_builder import PromptBuilder, tokens_para_chars
+
+
+# ============= CONFIGURACAO =============
+repl_padrao = os.environ.get('RLM_REPL', '0').lower() in ('1', 'true', 'on')
+repl_workers_padrao = int(os.environ.get('RLM_REPL_WORKERS', '2'))
+repl_cpu_padrao = float(os.environ.get('RLM_REPL_CPU_S', '5'))
+repl_memoria_padrao = int(os.environ.get('RLM_REPL_MEMORIA_MB', '512'))
+repl_timeout_padrao = float(os.environ.get('RLM_REPL_TIMEOUT_S', '10'))
+repl_saida_padrao = int(os.environ.get('RLM_REPL_SAIDA_MAX', '1500'))
+repl_passos_padrao = int(os.environ.get('RLM_REPL_PASSOS', '6'))
+repl_isolamento_padrao = os.environ.get('RLM_REPL_ISOLAMENTO', '1').lower() not in ('0', 'false', 'off')
+repl_uid_padrao = int(os.environ.get('RLM_REPL_UID', '65534'))
+
+MODULOS_PERMITIDOS = frozenset((
+    're', 'json', 'math', 'statistics', 'collections', 'itertools', 'functools',
+    'datetime', 'string', 'textwrap', 'heapq', 'bisect', 'unicodedata',
+))
+BUILTINS_BLOQUEADOS = ('open', 'exec', 'eval', 'compile', 'input', 'breakpoint',
+                       'exit', 'quit', 'help', '__import__')
+# Saida de passo antigo encolhida para o historico caber no num_ctx
+SAIDA_ENCOLHIDA = "\n... [encolhida: {} caracteres]"
+SAIDA_MINIMA = 80
+PASSOS_OMITIDOS = "\n[passos 1 a {}: omitidos, nao cabem no num_ctx]\n"
+# Bloco lido por vez em buscar/contar (contextos de centenas de MB)
+BLOCO_BUSCA = 1 << 20
+# unshare(2); os.unshare so existe a partir do Python 3.12
+_CLONE_NEWUSER = 0x10000000
+_CLONE_NEWNET = 0x40000000
+
+
+class ErroREPL(Exception):
+    """Worker nao respondeu no timeout ou morreu (sessao perdida)."""
+
+
+# ============= WORKER (processo filho) =============
+
+class LimiteCPU(Exception):
+    """Comando passou do limite de CPU."""
+
+
+def _ao_estourar_cpu(signum, frame):
+    raise LimiteCPU("limite de CPU do comando")
+
+
+def _aplicar_limites(memoria_mb: int):
+    try:
+        import resource
+        import signal
+    except ImportError:
+        return None  # sem rlimit (ex: Windows): so o timeout de parede
+    signal.signal(signal.SIGXCPU, _ao_estourar_cpu)
+    if memoria_mb:
+        limite = memoria_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limite, limite))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    return resource
+
+
+def _unshare(flags: int):
+    if hasattr(os, 'unshare'):
+        os.unshare(flags)
+        return
+    if not sys.platform.startswith('linux'):
+        raise OSError(f"namespaces nao existem em {sys.platform}")
+    import ctypes
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.unshare(flags) != 0:
+        erro = ctypes.get_errno()
+        raise OSError(erro, f"unshare: {os.strerror(erro)}")
+
+
+def _isolar(uid: int) -> dict:
+    """
+    Fecha o worker antes do primeiro comando: sem rede, raiz vazia e sem
+    root. Tudo que o REPL importa tem que ser carregado antes do chroot.
+    OSError se algum passo nao for possivel.
+    """
+    import tempfile
+    import importlib
+    for nome in sorted(MODULOS_PERMITIDOS) + ['collections.abc', 'ast', 'io', 'contextlib',
+                                              'context_source', 'multiprocessing.reduction']:
+        importlib.import_module(nome)
+
+    # Raiz = diretorio vazio ja apagado: nada para ler e nada pode ser criado
+    raiz = tempfile.mkdtemp(prefix='rlm_repl_')
+    os.chdir(raiz)
+    os.rmdir(raiz)
+    root = os.geteuid() == 0
+    # Sem root, o user namespace da os privilegios (so dentro dele) para o chroot
+    _unshare(_CLONE_NEWNET if root else _CLONE_NEWUSER | _CLONE_NEWNET)
+    os.chroot('.')
+    if root:
+        os.setgroups([])
+        os.setgid(uid)
+        os.setuid(uid)
+    if os.geteuid() == 0:
+        raise OSError("worker continua root depois do setuid")
+    return {'rede': 'netns', 'raiz': 'vazia', 'uid': os.geteuid(),
+            'namespace_usuario': not root}
+
+
+def _builtins_restritos() -> dict:
+    import builtins
+    restritos = {nome: valor for nome, valor in vars(builtins).items()
+                 if nome not in BUILTINS_BLOQUEADOS}
+
+    def _importar(nome, globals=None, locals=None, fromlist=(), level=0):
+        if level or nome.split('.')[0] not in MODULOS_PERMITIDOS:
+            raise ImportError(f"import de '{nome}' nao permitido no REPL")
+        return __import__(nome, globals, locals, fromlist, level)
+
+    restritos['__import__'] = _importar
+    return restritos
+
+
+def _abrir_contexto(conexao, spec: tuple):
+    tipo, valor = spec
+    if tipo == 'descritor':
+        # Arquivo aberto pelo pai: o worker nao enxerga o sistema de arquivos
+        from multiprocessing import reduction
+        from context_source import ContextSource
+        return ContextSource(valor, descritor=reduction.recv_handle(conexao))
+    return valor
+
+
+def _blocos(contexto):
+    """(posicao, texto) em blocos que terminam em fim de linha."""
+    n = len(contexto)
+    pos = 0
+    while pos < n:
+        fim = min(n, pos + BLOCO_BUSCA)
+        if fim < n:
+            quebra = contexto.rfind('\n', pos, fim)
+            if quebra > pos:
+                fim = quebra + 1
+        yield pos, contexto[pos:fim]
+        pos = fim
+
+
+def _namespace(contexto, builtins_restritos: dict) -> dict:
+    em_bytes = not isinstance(contexto, str)  # ContextSource: posicoes em bytes
+
+    def buscar(padrao: str, limite: int = 20) -> list:
+        """[(posicao, linha)] das primeiras `limite` linhas que casam com o regex."""
+        regex = re.compile(padrao)
+        achados = []
+        for pos, bloco in _blocos(contexto):
+            for m in regex.finditer(bloco):
+                inicio = bloco.rfind('\n', 0, m.start()) + 1
+                fim = bloco.find('\n', m.end())
+                linha = bloco[inicio:fim if fim >= 0 else len(bloco)]
+                antes = bloco[:inicio]
+                achados.append((pos + (len(antes.encode('utf-8')) if em_bytes else len(antes)), linha))
+                if len(achados) >= limite:
+                    return achados
+        return achados
+
+    def contar(padrao: str) -> int:
+        """Ocorrencias do regex no contexto inteiro."""
+        regex = re.compile(padrao)
+        return sum(len(regex.findall(bloco)) for _, bloco in _blocos(contexto))
+
+    def trecho(posicao: int, tamanho: int = 1000) -> str:
+        return contexto[max(0, posicao):max(0, posicao) + tamanho]
+
+    return {'__builtins__': builtins_restritos, '__name__': '__repl__',
+            'contexto': contexto, 'buscar': buscar, 'contar': contar, 'trecho': trecho}
+
+
+def _rodar(namespace: dict, codigo: str, saida_max: int) -> str:
+    """exec do codigo; como num REPL, o valor da ultima expressao e impresso."""
+    import io
+    import ast
+    import contextlib
+
+    saida = io.StringIO()
+    with contextlib.redirect_stdout(saida), contextlib.redirect_stderr(saida):
+        try:
+            arvore = ast.parse(codigo, '<repl>', 'exec')
+            ultima = None
+            if arvore.body and isinstance(arvore.body[-1], ast.Expr):
+                ultima = ast.Expression(arvore.body.pop().value)
+            exec(compile(arvore, '<repl>', 'exec'), namespace)
+            if ultima is not None:
+                valor = eval(compile(ultima, '<repl>', 'eval'), namespace)
+                if valor is not None:
+                    print(repr(valor))
+        except BaseException as e:  # SystemExit/LimiteCPU/MemoryError nao derrubam o worker
+            print(f"[ERROR] {type(e).__name__}: {e}")
+    texto = saida.getvalue()
+    if len(texto) > saida_max:
+        texto = texto[:saida_max] + f"\n... [saida cortada: {len(texto)} caracteres]"
+    return texto
+
+
+def _servir(conexao, cpu_segundos: float, memoria_mb: int, saida_max: int, isolar: bool, uid: int):
+    """
+    Loop do worker. Primeiro avisa ('pronto', isolamento) ou ('erro', motivo);
+    depois ('abrir'|'executar'|'fechar', sessao, ...) -> ('ok', resultado).
+    """
+    resource = _aplicar_limites(memoria_mb)
+    isolamento = None
+    if isolar:
+        try:
+            isolamento = _isolar(uid)
+        except OSError as e:
+            conexao.send(('erro', f"isolamento do worker falhou ({e}); "
+                                  f"RLM_REPL_ISOLAMENTO=0 roda sem sandbox"))
+            return
+    builtins_restritos = _builtins_restritos()
+    conexao.send(('pronto', isolamento))
+    sessoes = {}
+    while True:
+        try:
+            comando, sessao, *resto = conexao.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            if comando == 'abrir':
+                sessoes[sessao] = _namespace(_abrir_contexto(conexao, resto[0]), builtins_restritos)
+                resultado = None
+            elif comando == 'executar':
+                if resource is not None:
+                    uso = resource.getrusage(resource.RUSAGE_SELF)
+                    usado = uso.ru_utime + uso.ru_stime
+                    resource.setrlimit(resource.RLIMIT_CPU,
+                                       (int(usado + cpu_segundos) + 1, resource.RLIM_INFINITY))
+                try:
+                    resultado = _rodar(sessoes[sessao], resto[0], saida_max)
+                finally:
+                    if resource is not None:
+                        resource.setrlimit(resource.RLIMIT_CPU,
+                                           (resource.RLIM_INFINITY, resource.RLIM_INFINITY))
+            else:  # fechar
+                sessoes.pop(sessao, None)
+                resultado = None
+            conexao.send(('ok', resultado))
+        except Exception as e:
+            conexao.send(('erro', f"{type(e).__name__}: {e}"))
+
+
+# ============= POOL (processo pai) =============
+
+class _Worker:
+    """Um processo worker + o pipe dele. Usar so com self.lock."""
+
+    def __init__(self, ctx, limites: tuple):
+        self.conexao, filho = ctx.Pipe()
+        self.processo = ctx.Process(target=_servir, args=(filho, *limites), daemon=True)
+        self.processo.start()
+        filho.close()
+        self.lock = threading.Lock()
+        self.sessoes = set()
+        self.isolamento = None
+
+    def aguardar_pronto(self, timeout: float):
+        """Espera o worker se isolar; ErroREPL se ele nao conseguiu."""
+        try:
+            if not self.conexao.poll(timeout):
+                raise ErroREPL(f"worker nao iniciou em {timeout:.0f}s")
+            status, resultado = self.conexao.recv()
+        except (EOFError, OSError) as e:
+            self.matar()
+            raise ErroREPL(f"worker morreu ao iniciar: {e}") from None
+        except ErroREPL:
+            self.matar()
+            raise
+        if status != 'pronto':
+            self.matar()
+            raise ErroREPL(resultado)
+        self.isolamento = resultado
+
+    def pedir(self, mensagem: tuple, timeout: float, descritor: int = None):
+        self.conexao.send(mensagem)
+        if descritor is not None:
+            from multiprocessing import reduction
+            reduction.send_handle(self.conexao, descritor, self.processo.pid)
+        if not self.conexao.poll(timeout):
+            raise TimeoutError
+        status, resultado = self.conexao.recv()
+        if status != 'ok':
+            raise ErroREPL(resultado)
+        return resultado
+
+    def matar(self):
+        self.processo.kill()
+        self.processo.join(1)
+        self.conexao.close()
+
+
+class SessaoREPL:
+    """
+    Sessao de REPL num worker do pool (estado guardado entre comandos).
+
+    Uso:
+        with pool_padrao().abrir(contexto) as repl:
+            saida = repl.executar("print(len(contexto))")
+    """
+
+    def __init__(self, contexto, pool: 'PoolREPL'):
+        self.contexto = contexto
+        self.pool = pool
+        self.id = os.urandom(8).hex()
+        self.worker = None  # _Worker onde a sessao esta aberta
+        self.reiniciadas = 0
+
+    def executar(self, codigo: str, timeout: float = None) -> str:
+        """Executa codigo Python na sessao e retorna o que ele imprimiu."""
+        return self.pool.executar(self, codigo, timeout)
+
+    def limpar(self):
+        """Apaga as variaveis da sessao (o contexto e recarregado no proximo comando)."""
+        self.pool.fechar(self)
+
+    def fechar(self):
+        self.limpar()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+def _spec_contexto(contexto) -> tuple:
+    """
+    Como o worker recebe o contexto: ((tipo, valor), descritor). Arquivo
+    (ContextSource) vai como descritor aberto e o worker faz o mmap; texto
+    vai pelo pipe.
+    """
+    if hasattr(contexto, 'fileno'):
+        return ('descritor', contexto.path), contexto.fileno()
+    return ('texto', contexto or ''), None
+
+
+class PoolREPL:
+    """
+    Workers pre-criados para as sessoes de REPL, thread-safe.
+
+    Cada comando roda com limite de CPU (cpu_segundos) e de memoria
+    (memoria_mb) no worker e timeout de parede no pai; worker que passa do
+    timeout e morto e recriado. Com isolar (padrao: RLM_REPL_ISOLAMENTO) os
+    workers rodam sem rede, sem sistema de arquivos e sem root; se nao der
+    para isolar, o construtor levanta ErroREPL.
+    """
+
+    def __init__(self, workers: int = None, cpu_segundos: float = None, memoria_mb: int = None,
+                 timeout: float = None, saida_max: int = None, isolar: bool = None):
+        import multiprocessing
+        self.timeout = timeout or repl_timeout_padrao
+        self.saida_max = saida_max or repl_saida_padrao
+        self._limites = (cpu_segundos or repl_cpu_padrao,
+                         repl_memoria_padrao if memoria_mb is None else memoria_mb,
+                         self.saida_max,
+                         repl_isolamento_padrao if isolar is None else isolar,
+                         repl_uid_padrao)
+        # forkserver: workers saem de um processo limpo (sem as threads do servidor)
+        metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._ctx = multiprocessing.get_context(metodo)
+        if metodo == 'forkserver':
+            self._ctx.set_forkserver_preload(['repl_pool'])
+        self._lock = threading.Lock()
+        self._workers = [_Worker(self._ctx, self._limites)
+                         for _ in range(max(1, workers or repl_workers_padrao))]
+        try:
+            for worker in self._workers:
+                worker.aguardar_pronto(self.timeout)
+        except ErroREPL:
+            self.encerrar()
+            raise
+        self.comandos = 0
+        self.reinicios = 0
+
+    def abrir(self, contexto="") -> SessaoREPL:
+        """Nova sessao com o contexto carregado no worker com menos sessoes."""
+        repl = SessaoREPL(contexto, self)
+        self._abrir_no_worker(repl)
+        return repl
+
+    def executar(self, repl: SessaoREPL, codigo: str, timeout: float = None) -> str:
+        aviso = ''
+        if repl.worker is None or repl.worker not in self._workers or repl.id not in repl.worker.sessoes:
+            if repl.worker is not None:
+                # Worker recriado (timeout/crash): variaveis anteriores perdidas
+                repl.reiniciadas += 1
+                aviso = "[aviso] sessao reiniciada, variaveis anteriores perdidas\n"
+            self._abrir_no_worker(repl)
+        with self._lock:
+            self.comandos += 1
+        return aviso + self._pedir(repl.worker, ('executar', repl.id, codigo), timeout or self.timeout)
+
+    def fechar(self, repl: SessaoREPL):
+        worker, repl.worker = repl.worker, None
+        if worker is None or worker not in self._workers or repl.id not in worker.sessoes:
+            return
+        try:
+            self._pedir(worker, ('fechar', repl.id), self.timeout)
+        except ErroREPL:
+            pass
+        worker.sessoes.discard(repl.id)
+
+    def _abrir_no_worker(self, repl: SessaoREPL):
+        with self._lock:
+            worker = min(self._workers, key=lambda w: len(w.sessoes))
+            worker.sessoes.add(repl.id)
+        repl.worker = worker
+        spec, descritor = _spec_contexto(repl.contexto)
+        try:
+            self._pedir(worker, ('abrir', repl.id, spec), self.timeout, descritor)
+        except ErroREPL:
+            worker.sessoes.discard(repl.id)
+            raise
+
+    def _pedir(self, worker: _Worker, mensagem: tuple, timeout: float, descritor: int = None):
+        with worker.lock:
+            if worker not in self._workers:
+                raise ErroREPL("worker recriado durante o comando")
+            try:
+                return worker.pedir(mensagem, timeout, descritor)
+            except TimeoutError:
+                self._recriar(worker)
+                raise ErroREPL(f"comando passou de {timeout:.0f}s (worker recriado)") from None
+            except (EOFError, OSError) as e:
+                self._recriar(worker)
+                raise ErroREPL(f"worker morreu: {e}") from None
+
+    def _recriar(self, worker: _Worker):
+        worker.matar()
+        novo = _Worker(self._ctx, self._limites)
+        novo.aguardar_pronto(self.timeout)
+        with self._lock:
+            self._workers[self._workers.index(worker)] = novo
+            self.reinicios += 1
+        print(f"[REPL] Worker recriado ({len(worker.sessoes)} sessao(oes) perdida(s))", file=sys.stderr)
+
+    def estado(self) -> dict:
+        with self._lock:
+            return {
+                'workers': len(self._workers),
+                'sessoes': sum(len(w.sessoes) for w in self._workers),
+                'comandos': self.comandos,
+                'reinicios': self.reinicios,
+                'isolamento': self._workers[0].isolamento if self._workers else None,
+            }
+
+    def encerrar(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.matar()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool_padrao() -> PoolREPL:
+    """Pool compartilhado do processo, criado no primeiro uso do modo REPL."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PoolREPL()
+            atexit.register(_pool.encerrar)
+        return _pool
+
+
+# ============= PROMPT DO MODO REPL =============
+
+_BLOCO_CODIGO = re.compile(r"```(?:python|py)?[ \t]*\n(.*?)```", re.DOTALL)
+
+
+def extrair_passo(resposta: str) -> tuple:
+    """
+    Resposta do modelo -> (final, codigo). FINAL: encerra; senao o
+    primeiro bloco ```python```; sem nenhum dos dois, a resposta e final.
+    """
+    if 'FINAL:' in resposta:
+        return resposta.split('FINAL:', 1)[1].strip(), None
+    bloco = _BLOCO_CODIGO.search(resposta)
+    if bloco and bloco.group(1).strip():
+        return None, bloco.group(1).strip()
+    return resposta.strip(), None
+
+
+def resposta_ultimo_passo(resposta: str) -> str:
+    """
+    Resposta do ultimo passo (forcado). Se o modelo ainda mandou codigo,
+    fica o texto fora dos blocos; sem texto, um [ERROR].
+    """
+    final, codigo = extrair_passo(resposta)
+    if codigo is None:
+        return final
+    texto = _BLOCO_CODIGO.sub('', resposta).strip()
+    return texto or "[ERROR] modo REPL terminou sem resposta final"
+
+
+def _passo_anterior(i: int, codigo: str, saida: str) -> str:
+    return f"\n[{i}]\n```python\n{codigo}\n```\nSaida:\n{saida}\n"
+
+
+def _historico_no_orcamento(historico: list, saida_max: int, limite: int) -> str:
+    """
+    Passos anteriores em ate `limite` chars. Do mais novo para o mais
+    antigo: inteiro se cabe, senao com a saida encolhida no que sobra; os
+    mais antigos que nao cabem nem assim viram uma linha de omitidos.
+    """
+    titulo = "\nPASSOS ANTERIORES:\n"
+    restante = limite - len(titulo) - len(PASSOS_OMITIDOS.format(len(historico)))
+    blocos = []
+    omitidos = 0
+    for i in range(len(historico), 0, -1):
+        codigo, saida = historico[i - 1]
+        codigo = codigo[:saida_max]
+        saida = saida or '(nada impresso)'
+        bloco = _passo_anterior(i, codigo, saida)
+        if len(bloco) > restante:
+            marca = SAIDA_ENCOLHIDA.format(len(saida))
+            cabe = restante - len(_passo_anterior(i, codigo, marca))
+            if cabe < SAIDA_MINIMA:
+                omitidos = i
+                break
+            bloco = _passo_anterior(i, codigo, saida[:cabe] + marca)
+        blocos.append(bloco)
+        restante -= len(bloco)
+    if omitidos:
+        blocos.append(PASSOS_OMITIDOS.format(omitidos))
+    return titulo + ''.join(reversed(blocos))
+
+
+def prompt_repl(tarefa: str, contexto, historico: list, saida_max: int, ultimo: bool = False,
+                prompts: PromptBuilder = None) -> str:
+    """
+    Prompt de um passo do modo REPL; `historico` = [(codigo, saida)].
+    O historico e encolhido (saidas antigas cortadas, passos antigos
+    omitidos) para o prompt caber no num_ctx menos a reserva da resposta.
+    """
+    prompts = prompts or PromptBuilder()
+    amostra = contexto[:400] if contexto else ''
+    prompt = f"""Voce tem um REPL Python. O contexto da tarefa ({len(contexto) if contexto else 0} caracteres) NAO esta neste prompt:
+ele esta na variavel `contexto` do REPL. Escreva codigo para explorar e so imprima o necessario.
+
+Disponivel no REPL:
+- contexto: len(contexto), fatias contexto[a:b]
+- buscar(padrao, limite=20) -> [(posicao, linha)] das linhas que casam com o regex
+- contar(padrao) -> ocorrencias do regex no contexto inteiro
+- trecho(posicao, tamanho=1000) -> texto a partir da posicao
+- modulos: {', '.join(sorted(MODULOS_PERMITIDOS))}
+As variaveis ficam entre um passo e outro. A saida de cada passo e cortada em {saida_max} caracteres.
+
+Responda com UM bloco ```python``` por vez. Quando souber a resposta, escreva FINAL: seguido da resposta.
+
+TAREFA: {tarefa}
+
+INICIO DO CONTEXTO:
+{amostra}
+"""
+    if ultimo:
+        fim = "\nAcabaram os passos. Responda agora, com o que ja descobriu.\nFINAL:"
+    else:
+        fim = "\nProximo passo:"
+    if historico:
+        limite = tokens_para_chars(prompts.num_ctx - prompts.reserva_resposta) - len(prompt) - len(fim)
+        prompt += _historico_no_orcamento(historico, saida_max, limite)
+    return prompt + fim
@@ -0,0 +1,655 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pipeline comum do RLM: split -> sub-tarefas -> agregacao
+
+OllamaRLM (rlm_ollama.py) e SmartRLM (smart_rlm.py) herdam daqui o
+pipeline inteiro: generate com cache de respostas e deduplicacao em lote,
+split em streaming com o DAG de sub-tarefas, memo e BM25 por sub-tarefa,
+map-reduce recursivo, agregacao em arvore, modo REPL e lote.
+
+O SmartRLM so acrescenta o que e dele (fast path, prazo, modo
+especulativo e roteador) pelos ganchos, que aqui nao fazem nada:
+
+    _antes_de_chamar(etapa)   antes de cada generate (cancelamento, prazo)
+    _checar_cancelamento()    entre as etapas do pipeline
+    _chamar(...)              chamada sem stream (com prazo: stream + timeout)
+    _abrir_stream(...)        chamada com stream
+    _sem_tempo(etapa)         pula a sub-tarefa se o prazo nao deixa
+    _degradar(motivo)         conta uma degradacao do prazo
+    _timeout_repl(timeout)    timeout de cada comando do REPL
+
+O cliente Ollama fica no modulo de cada classe (`_cliente`), porque o
+servidor e o benchmark trocam smart_rlm.cliente_ollama / rlm_ollama.cliente_ollama.
+"""
+
+import re
+import os
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from rlm_cache import ResponseCache, cache_padrao, cache_habilitado
+from memo_subtarefas import memo_padrao, memo_habilitado, origem_do_contexto
+from map_reduce import map_reduce, MARCADOR_VAZIO
+from bm25_index import selecionar_contexto
+from prompt_builder import PromptBuilder
+from agregacao import reduzir_em_arvore, cortar
+from dag import EscalonadorDAG
+from prazo import PrazoEsgotado, PULADA
+from split_stream import ParserSubtarefas, SCHEMA_SPLIT
+from repl_pool import ErroREPL, pool_padrao, repl_padrao, repl_passos_padrao, extrair_passo, resposta_ultimo_passo, prompt_repl
+from modelos import parse_modelos, modelos_padrao, gerenciador_padrao
+from telemetria import telemetria_padrao
+from batch_runner import Deduplicador, executar_lote, batch_workers_padrao
+
+
+# ============= CONFIGURACAO =============
+# Sub-tarefas simultaneas (1 = sequencial). Util com OLLAMA_NUM_PARALLEL > 1
+max_concurrency_padrao = int(os.environ.get('RLM_MAX_CONCURRENCY', '1'))
+
+# Map-reduce recursivo sobre o contexto inteiro (em vez de contexto[:2000])
+recursivo_padrao = os.environ.get('RLM_RECURSIVE', '0').lower() in ('1', 'true', 'on')
+chunk_chars_padrao = int(os.environ.get('RLM_CHUNK_CHARS', '6000'))
+fanout_padrao = int(os.environ.get('RLM_FANOUT', '4'))
+
+# Recuperacao BM25: cada sub-tarefa recebe so os trechos relevantes
+bm25_padrao = os.environ.get('RLM_RETRIEVAL', '').lower() == 'bm25'
+bm25_k_padrao = int(os.environ.get('RLM_RETRIEVAL_K', '5'))
+
+
+class Cancelado(Exception):
+    """O fast path venceu: o trabalho especulativo foi descartado."""
+
+
+class RLMBase:
+    """
+    Pipeline RLM sem fast path:
+    1. Quebra a tarefa em sub-tarefas (split em streaming)
+    2. Processa cada sub-tarefa assim que ela fecha no split (DAG)
+    3. Agrega os resultados numa resposta final
+    """
+
+    def __init__(self, model: str = "qwen3:4b", max_concurrency: int = None,
+                 usar_cache: bool = True, recursivo: bool = None,
+                 bm25: bool = None, num_ctx: int = None, keep_alive: str = None,
+                 modelos: dict = None, repl: bool = None):
+        self.model = model
+        self.max_depth = 3
+        self.call_count = 0
+        self.max_concurrency = max_concurrency or max_concurrency_padrao
+        self.cache = cache_padrao() if usar_cache and cache_habilitado else None
+        # Memo por sub-tarefa (texto normalizado + trecho de contexto), ver memo_subtarefas.py
+        self.memo = memo_padrao() if usar_cache and memo_habilitado else None
+        self.recursivo = recursivo_padrao if recursivo is None else recursivo
+        # Modo REPL: o modelo explora o contexto com Python num worker (repl_pool.py)
+        self.modo_repl = repl_padrao if repl is None else repl
+        self.repl_passos = repl_passos_padrao
+        self.chunk_chars = chunk_chars_padrao
+        self.fanout = fanout_padrao
+        self.bm25 = bm25_padrao if bm25 is None else bm25
+        self.bm25_k = bm25_k_padrao
+        self.prompts = PromptBuilder(num_ctx=num_ctx)
+        self.keep_alive = keep_alive
+        # Cascata: modelo por etapa (RLM_MODELS / --modelos); o resto usa self.model
+        self.modelos = {**parse_modelos(modelos_padrao), **(modelos or {})}
+        self.gerenciador = gerenciador_padrao()
+        self.metricas = {'chamadas': 0, 'prompt_eval_count': 0, 'prompt_eval_ms': 0.0, 'eval_count': 0,
+                         'load_ms': 0.0}
+        self._metricas_lock = threading.Lock()
+        self._dedup = None  # Deduplicador durante um lote
+        self.telemetria = telemetria_padrao()
+
+    # ----- ganchos (o SmartRLM sobrescreve) -----
+
+    def _cliente(self):
+        """Cliente Ollama (global do modulo da subclasse)."""
+        raise NotImplementedError
+
+    def _antes_de_chamar(self, etapa: str):
+        """Chamado antes de cada generate; pode levantar Cancelado ou PrazoEsgotado."""
+
+    def _checar_cancelamento(self):
+        """Chamado entre as etapas do pipeline; pode levantar Cancelado."""
+
+    def _sem_tempo(self, etapa: str) -> bool:
+        """True se a etapa nao cabe mais no prazo do pedido."""
+        return False
+
+    def _degradar(self, motivo: str):
+        """Conta uma degradacao no prazo do pedido (sem prazo, nada)."""
+
+    def _timeout_repl(self, timeout: float) -> float:
+        """Timeout de parede de cada comando do REPL."""
+        return timeout
+
+    # ----- chamadas ao Ollama -----
+
+    def _sanitize_response(self, text: str) -> str:
+        """Remove markdown code blocks e caracteres especiais."""
+        text = re.sub(r'```(?:python|json|yaml|plaintext|)?\n?', '', text)
+        text = re.sub(r'```', '', text)
+        return text.strip()
+
+    def _registrar_metricas(self, resposta, modelo: str):
+        """Acumula prompt eval / geracao / carga reportados pelo Ollama."""
+        self.gerenciador.registrar(modelo, resposta)
+        with self._metricas_lock:
+            self.metricas['chamadas'] += 1
+            self.metricas['prompt_eval_count'] += resposta.get('prompt_eval_count') or 0
+            self.metricas['prompt_eval_ms'] += (resposta.get('prompt_eval_duration') or 0) / 1e6
+            self.metricas['eval_count'] += resposta.get('eval_count') or 0
+            self.metricas['load_ms'] += (resposta.get('load_duration') or 0) / 1e6
+
+    def _modelo(self, etapa: str) -> str:
+        """Modelo da etapa (cascata), sem forcar troca de modelo na GPU."""
+        return self.gerenciador.escolher(etapa, self.modelos.get(etapa, self.model), self.model)
+
+    def aquecer(self) -> dict:
+        """Pre-carrega no Ollama todos os modelos configurados ({modelo: ms})."""
+        return self.gerenciador.aquecer(
+            self._cliente(), list(self.modelos.values()), self.model,
+            self.prompts.opcoes(self.keep_alive)['keep_alive']
+        )
+
+    def _generate(self, prompt: str, etapa: str = 'generate', **opcoes) -> str:
+        """
+        Chama o Ollama (sem stream) passando pelo cache de respostas.
+        `etapa` identifica a chamada na telemetria (fast, split, subtask...).
+        Erros do Ollama sobem para o chamador; com prazo, PrazoEsgotado.
+        """
+        return self._generate_completo(prompt, etapa, **opcoes)[0]
+
+    def _generate_completo(self, prompt: str, etapa: str = 'generate', **opcoes) -> tuple:
+        """
+        _generate que retorna (texto, completa). Resposta cortada pelo
+        num_predict do prazo nao e completa: fica fora do cache e do memo.
+        """
+        self._antes_de_chamar(etapa)
+        inicio = time.perf_counter()
+        modelo = self._modelo(etapa)
+        chave = None
+        if self.cache is not None:
+            chave = self.cache.chave(modelo, prompt, opcoes)
+            cached = self.cache.get(chave)
+            if cached is not None:
+                self.telemetria.registrar(etapa, modelo, inicio, cache='hit')
+                return cached, True
+
+        texto, completa = self._chamar(prompt, opcoes, etapa, inicio, modelo)
+        if chave is not None and texto and completa:
+            self.cache.set(chave, texto)
+        return texto, completa
+
+    def _chamar(self, prompt: str, opcoes: dict, etapa: str, inicio: float, modelo: str) -> tuple:
+        """(texto, completa) de uma chamada sem stream."""
+        if self._dedup is not None:
+            # Em lote: o mesmo prompt em pedidos diferentes roda uma vez so
+            texto = self._dedup.executar(
+                ResponseCache.chave(modelo, prompt, opcoes),
+                lambda: self._chamar_ollama(prompt, opcoes, etapa, inicio, modelo)
+            )
+        else:
+            texto = self._chamar_ollama(prompt, opcoes, etapa, inicio, modelo)
+        return texto, True
+
+    def _chamar_ollama(self, prompt: str, opcoes: dict, etapa: str, inicio: float,
+                       modelo: str) -> str:
+        try:
+            response = self._cliente().generate(
+                model=modelo,
+                prompt=prompt,
+                stream=False,
+                **{**self.prompts.opcoes(self.keep_alive), **opcoes}
+            )
+        except Exception as e:
+            self.telemetria.registrar(etapa, modelo, inicio, erro=str(e))
+            raise
+        self._registrar_metricas(response, modelo)
+        self.telemetria.registrar(etapa, modelo, inicio, response, prompt_chars=len(prompt))
+        return response.get('response', '')
+
+    def _abrir_stream(self, modelo: str, prompt: str, kwargs: dict, etapa: str) -> tuple:
+        """(chunks, limitou): stream do generate; limitou = num_predict reduzido pelo prazo."""
+        return self._cliente().generate(model=modelo, prompt=prompt, stream=True, **kwargs), False
+
+    def _cortada(self, final: dict, limitou: bool) -> bool:
+        """Resposta parou no num_predict que o prazo impos (conta a degradacao)."""
+        if limitou and final is not None and final.get('done_reason') == 'length':
+            self._degradar('respostas_cortadas')
+            return True
+        return False
+
+    def _generate_stream(self, prompt: str, etapa: str = 'generate', **opcoes):
+        """
+        Versao streaming de _generate (yield de cada pedaco de texto).
+        Cache hit entrega a resposta inteira de uma vez; so grava no
+        cache quando o stream vai ate o fim.
+        """
+        self._antes_de_chamar(etapa)
+        inicio = time.perf_counter()
+        modelo = self._modelo(etapa)
+        chave = None
+        if self.cache is not None:
+            chave = self.cache.chave(modelo, prompt, opcoes)
+            cached = self.cache.get(chave)
+            if cached is not None:
+                self.telemetria.registrar(etapa, modelo, inicio, cache='hit')
+                yield cached
+                return
+
+        partes = []
+        final = None
+        try:
+            stream, limitou = self._abrir_stream(
+                modelo, prompt, {**self.prompts.opcoes(self.keep_alive), **opcoes}, etapa
+            )
+            for chunk in stream:
+                if chunk.get('done'):
+                    final = chunk
+                    self._registrar_metricas(chunk, modelo)
+                texto = chunk.get('response', '')
+                if texto:
+                    partes.append(texto)
+                    yield texto
+        finally:
+            # Sem chunk final: erro ou stream fechado antes do fim (ex: fast path incerto)
+            self.telemetria.registrar(
+                etapa, modelo, inicio, final,
+                cancelado=final is None, prompt_chars=len(prompt)
+            )
+
+        if not self._cortada(final, limitou) and chave is not None and partes:
+            self.cache.set(chave, ''.join(partes))
+
+    # ----- split + sub-tarefas -----
+
+    def _split_task(self, tarefa: str, contexto: str) -> list:
+        """Quebra a tarefa em sub-tarefas (plano inteiro)."""
+        return [subtarefa for subtarefa, _ in self._split_stream(tarefa, contexto)]
+
+    def _split_stream(self, tarefa: str, contexto: str):
+        """
+        Gera (sub-tarefa, dependencias) conforme o split e escrito: saida
+        estruturada (SCHEMA_SPLIT) + parser incremental, sem regex nem
+        json.loads da resposta inteira. Dependencias sao indices base 0.
+        Sem nenhuma sub-tarefa valida, gera a propria tarefa.
+        """
+        prompt = self.prompts.montar(
+            self.prompts.prefixo(contexto),
+            'Analise esta tarefa e quebre-a em 2-3 sub-tarefas.\nRetorne APENAS JSON com chave "subtasks": lista de {"tarefa", "depende_de"}.\n'
+            'Em "depende_de", os numeros das sub-tarefas anteriores cuja resposta ela precisa ([] se nenhuma).',
+            tarefa,
+            "JSON:"
+        )
+        parser = ParserSubtarefas()
+        try:
+            if self._dedup is not None:
+                # Em lote o prompt passa pelo deduplicador (sem stream)
+                yield from parser.alimentar(self._generate(prompt, etapa='split', format=SCHEMA_SPLIT))
+            else:
+                for texto in self._generate_stream(prompt, etapa='split', format=SCHEMA_SPLIT):
+                    yield from parser.alimentar(texto)
+        except Cancelado:
+            raise
+        except Exception as e:
+            print(f"[!] Erro ao quebrar: {e}")
+        if not parser.subtarefas:
+            yield tarefa, ()
+
+    def _split_e_subtarefas(self, tarefa: str, contexto: str) -> tuple:
+        """
+        Steps 1 e 2 do pipeline (split + sub-tarefas).
+        Cada sub-tarefa entra no DAG (dag.py) assim que fecha no JSON do
+        split, enquanto o modelo ainda escreve as proximas, e roda quando as
+        de que depende terminam. No modo recursivo o map-reduce precisa do
+        plano inteiro antes de comecar (e ignora as dependencias).
+        Retorna (subtarefas, resultados).
+        """
+        if self.recursivo:
+            subtarefas = self._split_task(tarefa, contexto)
+            self._checar_cancelamento()
+            print(f"[RLM] Split em {len(subtarefas)} sub-tarefas")
+            resultados = self._process_subtasks(subtarefas, contexto)
+            self._checar_cancelamento()
+            return subtarefas, resultados
+
+        subtarefas = []
+        dag = EscalonadorDAG(self._executor_dag(subtarefas, contexto), self.max_concurrency)
+        try:
+            for subtarefa, depende in self._split_stream(tarefa, contexto):
+                subtarefas.append(subtarefa)
+                depende_txt = f" (depende de {', '.join(str(d + 1) for d in depende)})" if depende else ''
+                print(f"  [{len(subtarefas)}] {subtarefa[:60]}...{depende_txt}")
+                dag.adicionar(depende)
+            resultados = dag.fechar()
+        finally:
+            dag.encerrar()
+        plano = dag.relatorio()
+        print(f"[RLM] Split em {len(subtarefas)} sub-tarefas | dependencias: {plano['dependencias']} | "
+              f"caminho critico: {plano['caminho_critico']}")
+        self._checar_cancelamento()
+        return subtarefas, resultados
+
+    def _executor_dag(self, subtarefas: list, contexto: str):
+        """executar(indice, entradas) do EscalonadorDAG: roda uma sub-tarefa com as respostas dos pais."""
+        def _executar(indice, entradas):
+            return self._process_subtask(
+                subtarefas[indice], contexto,
+                [(subtarefas[pai], resposta) for pai, resposta in entradas]
+            )
+        return _executar
+
+    def _contexto_subtarefa(self, subtarefa: str, contexto: str) -> str:
+        """
+        Prefixo de contexto de uma sub-tarefa: com BM25, os top-k trechos
+        para o texto da sub-tarefa; senao, o mesmo bloco compartilhado por
+        todas as chamadas (o Ollama reaproveita o KV cache dele).
+        """
+        if self.bm25:
+            # Mesmo orcamento do prefixo compartilhado (num_ctx do PromptBuilder)
+            trechos = selecionar_contexto(
+                subtarefa, contexto, self.bm25_k, self.prompts.orcamento_contexto()
+            )
+            return self.prompts.prefixo(trechos)
+        return self.prompts.prefixo(contexto)
+
+    def _process_subtask(self, subtarefa: str, contexto: str, entradas: list = ()) -> str:
+        """
+        Processa uma sub-tarefa individual. `entradas` = [(sub-tarefa,
+        resposta)] das sub-tarefas de que ela depende (DAG do split).
+        Resultados ficam no memo de sub-tarefas: a mesma sub-tarefa (a menos
+        de caixa/acentos/pontuacao) sobre o mesmo trecho nao chama o Ollama.
+        Sem tempo no prazo, retorna PULADA.
+        """
+        prefixo = self._contexto_subtarefa(subtarefa, contexto)
+        chave = origem = versao = None
+        if self.memo is not None:
+            inicio = time.perf_counter()
+            modelo = self._modelo('subtask')
+            chave = self.memo.chave(subtarefa, modelo, prefixo, entradas)
+            origem, versao = origem_do_contexto(contexto)
+            memorizada = self.memo.get(chave, origem, versao)
+            if memorizada is not None:
+                self.telemetria.registrar('subtask', modelo, inicio, cache='memo')
+                return memorizada
+
+        if self._sem_tempo('subtask'):
+            self._degradar('subtarefas_puladas')
+            return PULADA
+
+        texto = subtarefa
+        if entradas:
+            # Dividem ate metade do orcamento de contexto; o montar corta o
+            # contexto do prefixo para elas caberem (a tarefa vai inteira)
+            por_item = max(120, self.prompts.orcamento_contexto() // 2 // len(entradas))
+            texto += "\n\nRESPOSTAS DAS SUB-TAREFAS DE QUE ESTA DEPENDE:" + ''.join(
+                f"\n- {cortar(anterior, 120)}\n  -> {cortar(resposta, por_item)}"
+                for anterior, resposta in entradas
+            )
+        prompt = self.prompts.montar(
+            prefixo,
+            "Resolva esta sub-tarefa de forma concisa.",
+            texto,
+            "Resposta:"
+        )
+        try:
+            resposta, completa = self._generate_completo(prompt, etapa='subtask')
+            resposta = resposta.strip()
+        except Cancelado:
+            raise
+        except PrazoEsgotado:
+            self._degradar('subtarefas_puladas')
+            return PULADA
+        except Exception as e:
+            return f"[ERROR] {str(e)}"
+        if chave is not None and completa and resposta and not resposta.startswith('[ERROR]'):
+            self.memo.set(chave, resposta, origem, versao)
+        return resposta
+
+    def _parallel_map(self, fn, itens: list) -> list:
+        """
+        Aplica fn em cada item. Com max_concurrency > 1 roda em paralelo
+        (thread pool limitado); os resultados voltam na ordem dos itens.
+        """
+        workers = max(1, min(self.max_concurrency, len(itens)))
+        if workers == 1:
+            return [fn(item) for item in itens]
+
+        # copy_context: spans das threads ficam no trace da chamada
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futuros = [executor.submit(contextvars.copy_context().run, fn, item) for item in itens]
+            return [futuro.result() for futuro in futuros]
+
+    def _process_subtasks(self, subtarefas: list, contexto: str) -> list:
+        """
+        Processa todas as sub-tarefas, na ordem.
+        No modo recursivo, cada uma roda em map-reduce sobre o contexto inteiro.
+        """
+        if self.recursivo:
+            return map_reduce(
+                subtarefas, contexto,
+                self._map_chunk, self._reduce_partials, self._parallel_map,
+                self.chunk_chars, self.fanout, self.max_depth
+            )
+
+        total = len(subtarefas)
+
+        def _run(item):
+            i, subtarefa = item
+            print(f"  [{i}/{total}] {subtarefa[:60]}...")
+            return self._process_subtask(subtarefa, contexto)
+
+        return self._parallel_map(_run, list(enumerate(subtarefas, 1)))
+
+    def _map_chunk(self, subtarefa: str, trecho: str, indice: int, total: int) -> str:
+        """MAP: resolve a sub-tarefa olhando so um trecho do contexto."""
+        prompt = f"""TRECHO (parte {indice}/{total} do contexto):
+{trecho}
+
+Resolva esta sub-tarefa usando APENAS o trecho acima.
+Se o trecho nao tiver nada relevante para a tarefa, responda apenas {MARCADOR_VAZIO}.
+
+TAREFA: {subtarefa}
+
+Resposta:"""
+        try:
+            return self._generate(prompt, etapa='map').strip()
+        except Cancelado:
+            raise
+        except Exception as e:
+            return f"[ERROR] {str(e)}"
+
+    def _reduce_partials(self, subtarefa: str, parciais: list) -> str:
+        """REDUCE: junta respostas parciais de trechos diferentes."""
+        limite = max(200, self.chunk_chars // len(parciais))
+        prompt = f"""Combine estas respostas parciais (de trechos diferentes do mesmo contexto) em uma unica resposta.
+Mantenha todos os fatos relevantes e remova repeticoes.
+
+TAREFA: {subtarefa}
+
+PARCIAIS:
+"""
+        for i, parcial in enumerate(parciais, 1):
+            prompt += f"\n[{i}] {parcial[:limite]}\n"
+        prompt += "\nResposta combinada:"
+
+        try:
+            return self._generate(prompt, etapa='reduce').strip()
+        except Cancelado:
+            raise
+        except Exception as e:
+            return f"[ERROR] {str(e)}"
+
+    # ----- agregacao -----
+
+    def _sintetizar_grupo(self, grupo: list, tarefa_original: str) -> str:
+        """Nivel intermediario da agregacao em arvore: sintetiza um grupo de resultados."""
+        prompt = f"""Combine estes resultados parciais em uma unica sintese.
+Mantenha todos os fatos, numeros e conclusoes relevantes; remova repeticoes.
+
+TAREFA ORIGINAL: {tarefa_original}
+
+RESULTADOS:
+"""
+        for i, (rotulo, texto, _) in enumerate(grupo, 1):
+            prompt += f"\n[{i}] {rotulo}\n    -> {texto}\n"
+        prompt += "\nSintese:"
+
+        try:
+            return self._generate(prompt, etapa='aggregate').strip()
+        except (Cancelado, PrazoEsgotado):
+            raise
+        except Exception as e:
+            # Segue com os textos do grupo (o proximo nivel corta se precisar)
+            print(f"[!] Erro ao sintetizar grupo: {e}")
+            return ' | '.join(texto for _, texto, _ in grupo)
+
+    def _reduzir_resultados(self, subtarefas: list, resultados: list, tarefa_original: str) -> tuple:
+        """
+        (rotulos, textos) que cabem no prompt de agregacao: os proprios
+        resultados, ou as sinteses da agregacao em arvore se nao couberem.
+        """
+        orcamento = self.prompts.limite_por_item(self._aggregation_prompt([], [], tarefa_original), 1)
+        return reduzir_em_arvore(
+            subtarefas, resultados,
+            lambda grupo: self._sintetizar_grupo(grupo, tarefa_original),
+            self._parallel_map, orcamento
+        )
+
+    def _aggregation_prompt(self, subtarefas: list, resultados: list, tarefa_original: str,
+                            rascunho: str = None) -> str:
+        """
+        Monta o prompt de agregacao. `rascunho` = resposta do fast path
+        incerto (modo especulativo), entra como mais um resultado.
+        """
+        aggregation_prompt = f"""Agregue estes resultados em uma resposta coerente.
+
+TAREFA ORIGINAL: {tarefa_original}
+
+RESULTADOS:
+"""
+        limite = self.prompts.limite_por_item(
+            aggregation_prompt + ''.join(subtarefas), len(resultados) + (1 if rascunho else 0)
+        )
+        if sum(map(len, resultados)) + len(rascunho or '') <= limite * (len(resultados) + (1 if rascunho else 0)):
+            limite = None  # ja cabe inteiro (ex: depois da agregacao em arvore)
+        for i, (sub, res) in enumerate(zip(subtarefas, resultados)):
+            aggregation_prompt += f"\n[{i+1}] {sub}\n    -> {res[:limite]}\n"
+        if rascunho:
+            aggregation_prompt += f"\nRESPOSTA PRELIMINAR (rapida, pode estar incompleta):\n{rascunho[:limite]}\n"
+
+        aggregation_prompt += "\nResposta final clara:"
+        return aggregation_prompt
+
+    def _aggregate_results(self, subtarefas: list, resultados: list, tarefa_original: str,
+                           rascunho: str = None) -> str:
+        """Agrega resultados das sub-tarefas (em arvore se nao couberem num prompt)."""
+        subtarefas, resultados = self._reduzir_resultados(subtarefas, resultados, tarefa_original)
+        aggregation_prompt = self._aggregation_prompt(subtarefas, resultados, tarefa_original, rascunho)
+
+        try:
+            return self._generate(aggregation_prompt, etapa='aggregate').strip()
+        except (Cancelado, PrazoEsgotado):
+            raise
+        except Exception as e:
+            return f"[ERROR] {str(e)}"
+
+    def _aggregate_results_stream(self, subtarefas: list, resultados: list, tarefa_original: str,
+                                  rascunho: str = None):
+        """
+        Versao streaming de _aggregate_results: yield dos eventos token da
+        agregacao e retorna a resposta final.
+        """
+        partes = []
+        try:
+            subtarefas, resultados = self._reduzir_resultados(subtarefas, resultados, tarefa_original)
+            prompt = self._aggregation_prompt(subtarefas, resultados, tarefa_original, rascunho)
+            for texto in self._generate_stream(prompt, etapa='aggregate'):
+                if texto:
+                    partes.append(texto)
+                    yield {'evento': 'token', 'etapa': 'aggregate', 'texto': texto}
+        except Exception as e:
+            erro = f"[ERROR] {str(e)}"
+            partes.append(erro)
+            yield {'evento': 'token', 'etapa': 'aggregate', 'texto': erro}
+
+        return ''.join(partes).strip()
+
+    # ----- modo REPL -----
+
+    def _repl_rlm(self, tarefa: str, contexto: str) -> str:
+        """
+        Modo REPL: o contexto fica numa sessao do pool de workers
+        (repl_pool.py) e o modelo escreve Python para explora-lo; so a
+        saida dos comandos volta para o prompt. Termina no FINAL: do
+        modelo ou depois de repl_passos passos.
+        """
+        print("\n[RLM-REPL] Explorando o contexto com codigo...")
+        historico = []
+        try:
+            pool = pool_padrao()  # ErroREPL se os workers nao conseguem se isolar
+            with pool.abrir(contexto) as repl:
+                for passo in range(1, self.repl_passos + 1):
+                    prompt = prompt_repl(tarefa, contexto, historico, pool.saida_max, prompts=self.prompts)
+                    final, codigo = extrair_passo(self._generate(prompt, etapa='repl'))
+                    if final is not None:
+                        return final
+                    print(f"  [REPL {passo}] {codigo.splitlines()[0][:60]}...")
+                    try:
+                        saida = repl.executar(codigo, self._timeout_repl(pool.timeout))
+                    except ErroREPL as e:
+                        saida = f"[ERROR] {e}"
+                    historico.append((codigo, saida))
+
+            prompt = prompt_repl(tarefa, contexto, historico, pool.saida_max, ultimo=True, prompts=self.prompts)
+            return resposta_ultimo_passo(self._generate(prompt, etapa='repl'))
+        except (Cancelado, PrazoEsgotado):
+            raise
+        except Exception as e:
+            return f"[ERROR] {str(e)}"
+
+    # ----- lote -----
+
+    def chat_completion_batch(self, pedidos: list, max_workers: int = None) -> list:
+        """
+        Executa varias tarefas num processo so.
+
+        Args:
+            pedidos: [{'tarefa': str, 'contexto': str}] ou
+                     [{'tarefa': str, 'contexto_arquivo': path}] ou [str]
+            max_workers: tarefas simultaneas (padrao: RLM_BATCH_WORKERS ou 2)
+
+        Returns:
+            Um resultado por pedido, na ordem (com 'erro' se falhou).
+            Pedidos iguais e prompts iguais entre pedidos rodam uma vez so.
+        """
+        itens = [
+            (str(i), pedido if isinstance(pedido, dict) else {'tarefa': pedido})
+            for i, pedido in enumerate(pedidos)
+        ]
+        resultados = dict(self.chat_completion_batch_stream(itens, max_workers))
+        return [resultados[str(i)] for i in range(len(itens))]
+
+    def chat_completion_batch_stream(self, pedidos, max_workers: int = None,
+                                     pular=(), stats: dict = None):
+        """
+        Versao streaming do lote: recebe um iteravel de (id, pedido) e faz
+        yield de (id, resultado) conforme cada um termina. Ids em `pular`
+        (checkpoint) nao rodam.
+        """
+        stats = stats if stats is not None else {}
+        self._dedup = Deduplicador()
+        try:
+            yield from executar_lote(
+                pedidos, self._processar_pedido,
+                max_workers or batch_workers_padrao, pular, stats
+            )
+        finally:
+            stats['prompts_reaproveitados'] = self._dedup.reaproveitados
+            self._dedup = None
+
+    def _processar_pedido(self, pedido: dict) -> dict:
+        """Um pedido do lote -> resultado (dict) da subclasse."""
+        raise NotImplementedError
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache de respostas do Ollama em dois niveis
+
+1. LRU em memoria (OrderedDict) - hit custa microssegundos
+2. SQLite em disco - sobrevive entre processos/execucoes
+
+Chave = sha256(modelo + prompt completo + opcoes de geracao).
+Entradas expiram por TTL e o disco e podado por tamanho (LRU por acesso).
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+# ============= CONFIGURACAO =============
+cache_path_padrao = os.environ.get('RLM_CACHE_PATH', 'rlm/cache/respostas.sqlite3')
+cache_ttl_padrao = float(os.environ.get('RLM_CACHE_TTL', str(7 * 24 * 3600)))
+cache_max_memoria_padrao = int(os.environ.get('RLM_CACHE_MAX_MEMORIA', '256'))
+cache_max_disco_padrao = int(os.environ.get('RLM_CACHE_MAX_DISCO', '10000'))
+cache_habilitado = os.environ.get('RLM_CACHE', '1').lower() not in ('0', 'false', 'off')
+
+
+class ResponseCache:
+    """
+    Cache LRU (memoria) + SQLite (disco), thread-safe.
+
+    Uso:
+        chave = cache.chave(model, prompt, opcoes)
+        texto = cache.get(chave)
+        if texto is None:
+            texto = gerar(...)
+            cache.set(chave, texto)
+    """
+
+    def __init__(self, path: str = None, max_memoria: int = None,
+                 max_disco: int = None, ttl: float = None):
+        self.path = path or cache_path_padrao
+        self.max_memoria = max_memoria if max_memoria is not None else cache_max_memoria_padrao
+        self.max_disco = max_disco if max_disco is not None else cache_max_disco_padrao
+        self.ttl = ttl if ttl is not None else cache_ttl_padrao
+
+        self._memoria = OrderedDict()  # chave -> (resposta, criado)
+        self._lock = threading.Lock()
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+
+        if self.path != ':memory:':
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        import sqlite3  # no construtor: --help e --no-cache nao pagam o import
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS respostas (
+                chave TEXT PRIMARY KEY,
+                resposta TEXT NOT NULL,
+                criado REAL NOT NULL,
+                acessado REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_acessado ON respostas(acessado)")
+        self._db.commit()
+
+    @staticmethod
+    def chave(model: str, prompt: str, opcoes: dict = None) -> str:
+        """Hash estavel de (modelo, prompt, opcoes de geracao)."""
+        bruto = json.dumps([model, prompt, opcoes or {}], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(bruto.encode('utf-8')).hexdigest()
+
+    def _expirado(self, criado: float, agora: float) -> bool:
+        return bool(self.ttl) and agora - criado > self.ttl
+
+    def get(self, chave: str):
+        """Retorna a resposta em cache ou None (miss/expirada)."""
+        agora = time.time()
+        with self._lock:
+            item = self._memoria.get(chave)
+            if item is not None:
+                resposta, criado = item
+                if not self._expirado(criado, agora):
+                    self._memoria.move_to_end(chave)
+                    self.hits_memoria += 1
+                    return resposta
+                del self._memoria[chave]
+
+            row = self._db.execute(
+                "SELECT resposta, criado FROM respostas WHERE chave = ?", (chave,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            resposta, criado = row
+            if self._expirado(criado, agora):
+                self._db.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+                self._db.commit()
+                self.misses += 1
+                return None
+
+            self._db.execute("UPDATE respostas SET acessado = ? WHERE chave = ?", (agora, chave))
+            self._db.commit()
+            self._guardar_memoria(chave, resposta, criado)
+            self.hits_disco += 1
+            return resposta
+
+    def set(self, chave: str, resposta: str):
+        """Grava nos dois niveis e aplica o limite de tamanho do disco."""
+        agora = time.time()
+        with self._lock:
+            self._guardar_memoria(chave, resposta, agora)
+            self._db.execute(
+                "INSERT OR REPLACE INTO respostas (chave, resposta, criado, acessado) VALUES (?, ?, ?, ?)",
+                (chave, resposta, agora, agora)
+            )
+            total = self._db.execute("SELECT COUNT(*) FROM respostas").fetchone()[0]
+            if total > self.max_disco:
+                self._db.execute(
+                    "DELETE FROM respostas WHERE chave IN "
+                    "(SELECT chave FROM respostas ORDER BY acessado ASC LIMIT ?)",
+                    (total - self.max_disco,)
+                )
+            self._db.commit()
+
+    def _guardar_memoria(self, chave: str, resposta: str, criado: float):
+        if self.max_memoria <= 0:
+            return
+        self._memoria[chave] = (resposta, criado)
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Contadores de hit/miss."""
+        with self._lock:
+            return {
+                'hits_memoria': self.hits_memoria,
+                'hits_disco': self.hits_disco,
+                'misses': self.misses,
+                'itens_memoria': len(self._memoria)
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def cache_padrao(path: str = None) -> ResponseCache:
+    """
+    Cache compartilhado do processo (um por arquivo), para que OllamaRLM
+    e SmartRLM usem o mesmo LRU em memoria.
+    """
+    path = path or cache_path_padrao
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = ResponseCache(path)
+        return _caches[path]
@@ -7,49 +7,27 @@ Processa tarefas complexas de forma recursiva com poucos recursos.
 Suporta analise de textos grandes, arquivos e historicos.
 """
 
-import re
 import sys
-import io
 import os
-import argparse
-import json
-from ollama import Client
+import time
+
+from context_source import ContextSource
+from rlm_base import RLMBase
+from ollama_pool import criar_cliente
+from modelos import aquecer_padrao
+from telemetria import configurar as configurar_telemetria
+from batch_runner import abrir_contexto, processar_jsonl
 
 
 # ============= CONFIGURACAO =============
 ollama_host = os.environ.get('OLLAMA_HOST', 'http://ollama:11434')
-cliente_ollama = Client(host=ollama_host)
+# Varios hosts: RLM_OLLAMA_HOSTS=url1,url2 (ver ollama_pool.py)
+cliente_ollama = criar_cliente(ollama_host)
 
 
 # ============= CLASSES GENERICAS =============
 
-class LocalREPL:
-    """
-    Environment local para capturar outputs Python.
-    Simula um REPL (Read-Eval-Print Loop) seguro.
-    """
-    def __init__(self):
-        self.locals = {}
-        self.output = io.StringIO()
-
-    def execute(self, code: str) -> str:
-        """Executa codigo Python e retorna o output."""
-        try:
-            old_stdout = sys.stdout
-            sys.stdout = self.output
-            exec(code, self.locals)
-            sys.stdout = old_stdout
-            return self.output.getvalue()
-        except Exception as e:
-            sys.stdout = old_stdout
-            return f"[ERROR] {type(e).__name__}: {str(e)}"
-
-    def clear(self):
-        """Limpa o buffer de output."""
-        self.output = io.StringIO()
-
-
-class OllamaRLM:
+class OllamaRLM(RLMBase):
     """
     Recursive Language Model usando Ollama.
     
@@ -59,94 +37,12 @@ class OllamaRLM:
     3. Processa cada sub-tarefa
     4. Agrega os resultados
     5. Retorna resposta final
-    """
-    
-    def __init__(self, model: str = "qwen3:4b"):
-        self.model = model
-        self.repl = LocalREPL()
-        self.max_depth = 3
-        self.call_count = 0
-
-    def _sanitize_response(self, text: str) -> str:
-        """Remove markdown code blocks e caracteres especiais."""
-        text = re.sub(r'```(?:python|json|yaml|plaintext|)?\n?', '', text)
-        text = re.sub(r'```', '', text)
-        return text.strip()
-
-    def _split_task(self, tarefa: str, contexto: str) -> list:
-        """
-        Quebra a tarefa em sub-tarefas recursivas.
-        Retorna lista de sub-tarefas.
-        """
-        prompt = f"""Analise esta tarefa e quebre-a em 2-3 sub-tarefas menores.
-Retorne APENAS JSON com chave "subtasks".
-
-TAREFA: {tarefa}
-
-CONTEXTO (primeiros 500 chars): {contexto[:500]}...
-
-Responda APENAS em JSON:"""
-        try:
-            response = cliente_ollama.generate(
-                model=self.model,
-                prompt=prompt,
-                stream=False
-            )
-            
-            text = response.get('response', '{}')
-            text = self._sanitize_response(text)
-            
-            match = re.search(r'\{.*\}', text, re.DOTALL)
-            if match:
-                data = json.loads(match.group())
-                return data.get('subtasks', [tarefa])
-            return [tarefa]
-        except Exception as e:
-            print(f"[!] Erro ao quebrar tarefa: {e}")
-            return [tarefa]
-
-    def _process_subtask(self, subtarefa: str, contexto: str) -> str:
-        """Processa uma sub-tarefa individual."""
-        prompt = f"""Resolva esta sub-tarefa de forma concisa.
-
-TAREFA: {subtarefa}
-
-CONTEXTO:
-{contexto[:2000]}
-
-Responda APENAS a solucao, sem explicacoes desnecessarias."""
-        try:
-            response = cliente_ollama.generate(
-                model=self.model,
-                prompt=prompt,
-                stream=False
-            )
-            return response.get('response', '').strip()
-        except Exception as e:
-            return f"[ERROR] {str(e)}"
 
-    def _aggregate_results(self, subtarefas: list, resultados: list, tarefa_original: str) -> str:
-        """Agrega os resultados das sub-tarefas em uma resposta final."""
-        aggregation_prompt = f"""Agregue estes resultados em uma resposta coerente.
-
-TAREFA ORIGINAL: {tarefa_original}
-
-RESULTADOS:
-"""
-        for i, (sub, res) in enumerate(zip(subtarefas, resultados)):
-            aggregation_prompt += f"\n[{i+1}] {sub}\n    -> {res[:500]}\n"
-
-        aggregation_prompt += "\nRetorne uma resposta final clara:"
+    O pipeline fica em rlm_base.py (compartilhado com o SmartRLM).
+    """
 
-        try:
-            response = cliente_ollama.generate(
-                model=self.model,
-                prompt=aggregation_prompt,
-                stream=False
-            )
-            return response.get('response', '').strip()
-        except Exception as e:
-            return f"[ERROR] {str(e)}"
+    def _cliente(self):
+        return cliente_ollama
 
     def chat_completion(self, tarefa: str, contexto: str = "") -> str:
         """
@@ -159,72 +55,133 @@ RESULTADOS:
         Returns:
             Resposta final processada
         """
+        trace = self.telemetria.iniciar('chat_completion')
         self.call_count += 1
         print(f"\n[RLM-{self.call_count}] Processing: {tarefa[:80]}...")
 
-        # Step 1: Split task
-        subtarefas = self._split_task(tarefa, contexto)
-        print(f"[RLM] Split into {len(subtarefas)} subtasks")
+        if self.modo_repl:
+            resposta_final = self._repl_rlm(tarefa, contexto)
+            self.telemetria.finalizar(trace, modo='repl')
+            return resposta_final
 
-        # Step 2: Process each subtask
-        resultados = []
-        for i, subtarefa in enumerate(subtarefas, 1):
-            print(f"  [{i}/{len(subtarefas)}] {subtarefa[:60]}...")
-            resultado = self._process_subtask(subtarefa, contexto)
-            resultados.append(resultado)
+        # Steps 1 e 2: split + sub-tarefas (despachadas durante o split)
+        subtarefas, resultados = self._split_e_subtarefas(tarefa, contexto)
 
         # Step 3: Aggregate results
         print("[RLM] Aggregating final results...")
         resposta_final = self._aggregate_results(subtarefas, resultados, tarefa)
 
+        self.telemetria.finalizar(trace, modo='full')
         return resposta_final
 
+    def _processar_pedido(self, pedido: dict) -> dict:
+        start_time = time.time()
+        with abrir_contexto(pedido) as contexto:
+            resposta = self.chat_completion(pedido.get('tarefa', ''), contexto)
+        return {'resposta': resposta, 'tempo_ms': int((time.time() - start_time) * 1000)}
+
+    def chat_completion_stream(self, tarefa: str, contexto: str = ""):
+        """
+        Versao streaming do chat_completion.
+
+        Split e sub-tarefas rodam normalmente; a agregacao e gerada em
+        streaming. Faz yield de eventos (dicts):
+            {'evento': 'token', 'etapa': 'aggregate', 'texto': str}
+            ...
+            {'evento': 'resultado', 'resposta': str, 'tempo_ms': int, 'ttft_ms': int}
+        """
+        start_time = time.time()
+        ttft_ms = None
+        trace = self.telemetria.iniciar('chat_completion_stream')
+
+        self.call_count += 1
+        print(f"\n[RLM-{self.call_count}] Processing (stream): {tarefa[:80]}...")
+
+        if self.modo_repl:
+            resposta = self._repl_rlm(tarefa, contexto)
+            elapsed = int((time.time() - start_time) * 1000)
+            self.telemetria.finalizar(trace, modo='repl', ttft_ms=elapsed)
+            yield {'evento': 'token', 'etapa': 'repl', 'texto': resposta}
+            yield {'evento': 'resultado', 'resposta': resposta, 'tempo_ms': elapsed, 'ttft_ms': elapsed}
+            return
+
+        subtarefas, resultados = self._split_e_subtarefas(tarefa, contexto)
+
+        print("[RLM] Aggregating final results...")
+        eventos = self._aggregate_results_stream(subtarefas, resultados, tarefa)
+        while True:
+            try:
+                evento = next(eventos)
+            except StopIteration as fim:
+                resposta = fim.value
+                break
+            if ttft_ms is None:
+                ttft_ms = int((time.time() - start_time) * 1000)
+            yield evento
+
+        elapsed = int((time.time() - start_time) * 1000)
+        self.telemetria.finalizar(trace, modo='full', ttft_ms=ttft_ms)
+        yield {
+            'evento': 'resultado',
+            'resposta': resposta,
+            'tempo_ms': elapsed,
+            'ttft_ms': ttft_ms if ttft_ms is not None else elapsed
+        }
+
 
 # ============= MODO GENERICO (Ponto de Entrada) =============
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description="RLM Generico via Ollama - Processa tarefas complexas"
-    )
-    
-    parser.add_argument(
-        "--tarefa",
-        type=str,
-        required=True,
-        help="Instrucao principal para o RLM"
-    )
-    
-    parser.add_argument(
-        "--contexto",
-        type=str,
-        default="",
-        help="Texto de contexto ou caminho para arquivo"
-    )
-    
-    parser.add_argument(
-        "--modelo",
-        type=str,
-        default="qwen3:4b",
-        help="Modelo Ollama a usar"
-    )
-    
-    parser.add_argument(
-        "--verbose",
-        action="store_true",
-        help="Modo verboso com mais detalhes"
-    )
+def executar_cli(args, modelos: dict = None):
+    """Corpo da CLI; argumentos ja validados por cli.main."""
+    if args.trace or args.metricas:
+        configurar_telemetria(args.trace, args.metricas)
 
-    args = parser.parse_args()
+    # Step 1: Initialize RLM
+    print(f"[*] Starting RLM with model: {args.modelo}", file=sys.stderr if args.batch_jsonl else sys.stdout)
+    try:
+        rlm = OllamaRLM(
+            model=args.modelo,
+            max_concurrency=args.concorrencia,
+            usar_cache=not args.no_cache,
+            recursivo=args.recursivo or None,
+            repl=args.repl or None,
+            bm25=args.bm25 or None,
+            num_ctx=args.num_ctx,
+            keep_alive=args.keep_alive,
+            modelos=modelos
+        )
+    except Exception as e:
+        print(f"[-] Error initializing RLM: {e}")
+        sys.exit(1)
+    if args.modelos_na_gpu is not None:
+        rlm.gerenciador.capacidade = args.modelos_na_gpu
+    if args.aquecer or aquecer_padrao:
+        rlm.aquecer()
+
+    # Modo lote: varias tarefas, resultados em JSONL (logs vao para stderr)
+    if args.batch_jsonl:
+        try:
+            processar_jsonl(rlm, args.batch_jsonl, args.saida, args.batch_workers, args.retomar)
+        except KeyboardInterrupt:
+            print("\n[!] Interrupted", file=sys.stderr)
+            sys.exit(130)
+        sys.exit(0)
 
-    # Step 1: Load context
+    # Step 2: Load context
     contexto_final = args.contexto
     
+    if args.contexto:
+        # Historico com entradas ainda no segmento .log: compacta antes do mmap
+        from context_manager import compactar_pendente
+        if compactar_pendente(args.contexto):
+            print("[+] Pending history entries compacted")
+
     if args.contexto and os.path.isfile(args.contexto):
         print(f"[*] Reading context from file: {args.contexto}")
         try:
-            with open(args.contexto, 'r', encoding='utf-8') as f:
-                contexto_final = f.read()
-                print(f"[+] Loaded {len(contexto_final)} characters")
+            # mmap: o pipeline fatia o arquivo sob demanda, sem f.read()
+            contexto_final = ContextSource(args.contexto)
+            print(f"[+] Mapped {len(contexto_final)} bytes")
         except Exception as e:
             print(f"[-] Error reading file: {e}")
             sys.exit(1)
@@ -233,27 +190,49 @@ if __name__ == "__main__":
     else:
         print("[!] No context provided (task only)")
 
-    # Step 2: Initialize RLM
-    print(f"\n[*] Starting RLM with model: {args.modelo}")
-    try:
-        rlm = OllamaRLM(model=args.modelo)
-    except Exception as e:
-        print(f"[-] Error initializing RLM: {e}")
-        sys.exit(1)
-
     # Step 3: Execute
     print("\n" + "="*50)
     print(f"[TASK] {args.tarefa}")
     print("="*50)
 
     try:
-        resultado_final = rlm.chat_completion(args.tarefa, contexto_final)
-        
-        print("\n" + "="*50)
-        print("[+] FINAL RLM RESPONSE")
-        print("="*50)
-        print(resultado_final)
-        print("="*50)
+        if args.stream:
+            cabecalho = False
+            for evento in rlm.chat_completion_stream(args.tarefa, contexto_final):
+                if evento['evento'] == 'token':
+                    if not cabecalho:
+                        print("\n" + "="*50)
+                        print("[+] FINAL RLM RESPONSE (stream)")
+                        print("="*50)
+                        cabecalho = True
+                    sys.stdout.write(evento['texto'])
+                    sys.stdout.flush()
+                else:
+                    print("\n" + "="*50)
+                    print(f"[+] Tempo: {evento['tempo_ms']}ms | TTFT: {evento['ttft_ms']}ms")
+        else:
+            resultado_final = rlm.chat_completion(args.tarefa, contexto_final)
+
+            print("\n" + "="*50)
+            print("[+] FINAL RLM RESPONSE")
+            print("="*50)
+            print(resultado_final)
+            print("="*50)
+
+        if rlm.cache is not None:
+            stats = rlm.cache.stats()
+            print(f"[Cache] Hits: {stats['hits_memoria']} memoria + {stats['hits_disco']} disco | Misses: {stats['misses']}")
+        if rlm.memo is not None:
+            stats = rlm.memo.stats()
+            print(f"[Memo] Sub-tarefas: {stats['hits']} hit(s) | {stats['misses']} miss(es) | "
+                  f"{stats['invalidados']} invalidada(s)")
+        metricas = rlm.metricas
+        if metricas['chamadas']:
+            print(f"[Prompt] {metricas['chamadas']} chamada(s) | prompt eval: {metricas['prompt_eval_count']} tokens, "
+                  f"{metricas['prompt_eval_ms']:.0f}ms ({metricas['prompt_eval_ms'] / metricas['chamadas']:.0f}ms/chamada) | "
+                  f"gerados: {metricas['eval_count']} tokens")
+        if metricas['load_ms']:
+            print(f"[Modelos] carga: {metricas['load_ms']:.0f}ms | {rlm.gerenciador.resumo()}")
         
     except KeyboardInterrupt:
         print("\n[!] Interrupted by user")
@@ -264,3 +243,8 @@ if __name__ == "__main__":
         if args.verbose:
             traceback.print_exc()
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    from cli import main
+    main('rlm', executar_cli)
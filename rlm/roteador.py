@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Roteador aprendido do SmartRLM (fast path x pipeline completo)
+
+Sem roteador, toda pergunta paga uma chamada ao LLM no fast path so para
+descobrir se ele responde [UNCERTAIN]. Este modulo aprende com essas
+decisoes: cada pedido em que o fast path rodou vira um exemplo rotulado
+(features da tarefa, tamanho do contexto, modo) em RLM_ROUTER_LOG, e uma
+regressao logistica sobre palavras e tamanhos preve a chance de cair no
+pipeline completo. Acima do limiar, o SmartRLM vai direto para o _full_rlm.
+
+O log nao guarda o texto da tarefa: palavras e bigramas entram como hash
+(w:<hash>), junto com os tamanhos. RLM_ROUTER_LOG_TAREFA=1 grava tambem
+o texto (para inspecionar). O arquivo roda ao passar de
+RLM_ROUTER_LOG_MAX_MB (o anterior fica em <log>.1 e tambem entra no treino).
+
+    python rlm/roteador.py treinar                 # log -> modelo + relatorio
+    python rlm/roteador.py avaliar --log outro.jsonl
+
+Uma fracao (RLM_ROUTER_EXPLORAR) dos pedidos previstos como dificeis
+ainda passa pelo fast path, para o log continuar tendo rotulos dos dois
+lados.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from bm25_index import tokenizar
+
+
+# ============= CONFIGURACAO =============
+roteador_habilitado = os.environ.get('RLM_ROUTER', '1').lower() not in ('0', 'false', 'off')
+roteador_path_padrao = os.environ.get('RLM_ROUTER_MODEL', 'rlm/cache/roteador.json')
+roteador_log_padrao = os.environ.get('RLM_ROUTER_LOG', 'rlm/cache/rotas.jsonl')
+limiar_padrao = float(os.environ.get('RLM_ROUTER_LIMIAR', '0.7'))
+explorar_padrao = float(os.environ.get('RLM_ROUTER_EXPLORAR', '0.05'))
+log_tarefa_padrao = os.environ.get('RLM_ROUTER_LOG_TAREFA', '0').lower() in ('1', 'true', 'on')
+log_max_bytes_padrao = int(float(os.environ.get('RLM_ROUTER_LOG_MAX_MB', '20')) * 1024 * 1024)
+
+# Chamadas de um pipeline completo tipico (split + 2 sub-tarefas + agregacao)
+chamadas_full_padrao = 4
+
+_log_lock = threading.Lock()
+
+
+def _hash(texto: str) -> str:
+    return hashlib.blake2b(texto.encode('utf-8'), digest_size=6).hexdigest()
+
+
+def caracteristicas(tarefa: str, contexto_chars: int) -> dict:
+    """Features esparsas (nome -> valor) de um pedido; palavras como hash."""
+    palavras = tokenizar(tarefa)
+    feats = {
+        'len:tarefa': math.log1p(len(tarefa)) / 5,
+        'len:palavras': math.log1p(len(palavras)) / 3,
+        'len:contexto': math.log1p(contexto_chars) / 10,
+        'sem_contexto': 1.0 if not contexto_chars else 0.0,
+        'interrogacoes': min(tarefa.count('?'), 3) / 3,
+        'virgulas': min(tarefa.count(','), 5) / 5,
+        'numeros': 1.0 if any(c.isdigit() for c in tarefa) else 0.0,
+    }
+    for palavra in set(palavras):
+        feats['w:' + _hash(palavra)] = 1.0
+    for a, b in zip(palavras, palavras[1:]):
+        feats['b:' + _hash(f'{a}_{b}')] = 1.0
+    return feats
+
+
+def _pesos_com_hash(pesos: dict) -> dict:
+    """Modelo treinado antes do hash (w:palavra, b:a_b) -> nomes com hash."""
+    return {
+        (n[:2] + _hash(n[2:]) if n.startswith(('w:', 'b:')) else n): w
+        for n, w in pesos.items()
+    }
+
+
+def _sigmoide(z: float) -> float:
+    if z < -30:
+        return 0.0
+    if z > 30:
+        return 1.0
+    return 1.0 / (1.0 + math.exp(-z))
+
+
+class Roteador:
+    """
+    Regressao logistica: P(pipeline completo | tarefa, contexto).
+
+    Uso:
+        roteador = Roteador.carregar('rlm/cache/roteador.json')
+        rota, prob = roteador.decidir(tarefa, len(contexto))  # 'fast' ou 'full'
+    """
+
+    def __init__(self, pesos: dict = None, bias: float = 0.0, limiar: float = None,
+                 explorar: float = None, meta: dict = None):
+        self.pesos = pesos or {}
+        self.bias = bias
+        self.limiar = limiar_padrao if limiar is None else limiar
+        self.explorar = explorar_padrao if explorar is None else explorar
+        self.meta = meta or {}
+        self._sorteio = random.Random()
+
+    def prob_full(self, tarefa: str, contexto_chars: int) -> float:
+        return self.prob_feats(caracteristicas(tarefa, contexto_chars))
+
+    def prob_feats(self, feats: dict) -> float:
+        z = self.bias
+        for nome, valor in feats.items():
+            z += self.pesos.get(nome, 0.0) * valor
+        return _sigmoide(z)
+
+    def decidir(self, tarefa: str, contexto_chars: int) -> tuple:
+        """(rota, prob_full). rota = 'full' pula o fast path."""
+        prob = self.prob_full(tarefa, contexto_chars)
+        if prob >= self.limiar and self._sorteio.random() >= self.explorar:
+            return 'full', prob
+        return 'fast', prob
+
+    def salvar(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({
+                'bias': self.bias,
+                'limiar': self.limiar,
+                'meta': self.meta,
+                'pesos': self.pesos,
+            }, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def carregar(cls, path: str, limiar: float = None):
+        with open(path, 'r', encoding='utf-8') as f:
+            dados = json.load(f)
+        meta = dados.get('meta') or {}
+        pesos = dados.get('pesos', {})
+        if meta.get('features') != 'hash':
+            pesos = _pesos_com_hash(pesos)
+        return cls(
+            pesos, dados.get('bias', 0.0),
+            limiar if limiar is not None else dados.get('limiar'),
+            meta=dados.get('meta'),
+        )
+
+
+def roteador_padrao():
+    """Roteador treinado em RLM_ROUTER_MODEL, ou None se nao houver modelo."""
+    if not roteador_habilitado or not os.path.exists(roteador_path_padrao):
+        return None
+    try:
+        return Roteador.carregar(roteador_path_padrao)
+    except (OSError, ValueError) as e:
+        print(f"[Roteador] Modelo ignorado ({roteador_path_padrao}): {e}", file=sys.stderr)
+        return None
+
+
+# ============= LOG DE ROTAS =============
+
+def registrar_rota(path: str, tarefa: str, contexto_chars: int, modo: str,
+                   com_tarefa: bool = None, max_bytes: int = None):
+    """
+    Anexa um exemplo rotulado (so quando o fast path rodou de fato): id
+    (hash da tarefa), features e modo; o texto so com com_tarefa
+    (RLM_ROUTER_LOG_TAREFA). Passando de max_bytes, o log vira <path>.1.
+    """
+    registro = {
+        'ts': round(time.time(), 3),
+        'id': _hash(tarefa),
+        'contexto_chars': contexto_chars,
+        'feats': caracteristicas(tarefa, contexto_chars),
+        'modo': modo,
+    }
+    if log_tarefa_padrao if com_tarefa is None else com_tarefa:
+        registro['tarefa'] = tarefa
+    linha = json.dumps(registro, ensure_ascii=False) + '\n'
+    max_bytes = log_max_bytes_padrao if max_bytes is None else max_bytes
+    with _log_lock:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        try:
+            if max_bytes and os.path.getsize(path) + len(linha) > max_bytes:
+                os.replace(path, f"{path}.1")
+        except FileNotFoundError:
+            pass
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(linha)
+
+
+def ler_exemplos(path: str) -> list:
+    """
+    [(id, features, rotulo)] com rotulo 1 = full, de <path>.1 (se houver)
+    e <path>. Linhas antigas com o texto da tarefa viram features aqui.
+    """
+    exemplos = []
+    rotacionado = f"{path}.1"
+    for arquivo in ([rotacionado] if os.path.exists(rotacionado) else []) + [path]:
+        with open(arquivo, 'r', encoding='utf-8') as f:
+            for linha in f:
+                try:
+                    r = json.loads(linha)
+                except ValueError:
+                    continue  # linha cortada
+                if r.get('modo') not in ('fast', 'full'):
+                    continue
+                feats = r.get('feats')
+                if feats is None:
+                    tarefa = r.get('tarefa', '')
+                    feats = caracteristicas(tarefa, int(r.get('contexto_chars') or 0))
+                    r['id'] = _hash(tarefa)
+                exemplos.append((r.get('id', ''), feats, 1 if r['modo'] == 'full' else 0))
+    return exemplos
+
+
+def separar_validacao(exemplos: list, fracao: float) -> tuple:
+    """Split deterministico pelo id da tarefa (repeticoes ficam do mesmo lado)."""
+    treino, validacao = [], []
+    for ex in exemplos:
+        h = int(hashlib.sha1(ex[0].encode('utf-8')).hexdigest()[:8], 16) / 0xFFFFFFFF
+        (validacao if h < fracao else treino).append(ex)
+    return treino, validacao
+
+
+# ============= TREINO / AVALIACAO =============
+
+def treinar(exemplos: list, epocas: int = 30, taxa: float = 0.1, l2: float = 1e-4,
+            limiar: float = None, seed: int = 0) -> Roteador:
+    """
+    SGD com pesos de classe balanceados (o log costuma ter muito mais
+    fast que full, ou o contrario).
+    """
+    if not exemplos:
+        raise ValueError("nenhum exemplo para treinar")
+    dados = [(feats, y) for _, feats, y in exemplos]
+    positivos = sum(y for _, y in dados)
+    negativos = len(dados) - positivos
+    peso_classe = {
+        1: len(dados) / (2 * positivos) if positivos else 1.0,
+        0: len(dados) / (2 * negativos) if negativos else 1.0,
+    }
+
+    pesos, bias = {}, 0.0
+    sorteio = random.Random(seed)
+    ordem = list(range(len(dados)))
+    for epoca in range(epocas):
+        sorteio.shuffle(ordem)
+        passo = taxa / (1 + epoca * 0.1)
+        for i in ordem:
+            feats, y = dados[i]
+            z = bias + sum(pesos.get(n, 0.0) * v for n, v in feats.items())
+            erro = (_sigmoide(z) - y) * peso_classe[y]
+            bias -= passo * erro
+            for n, v in feats.items():
+                w = pesos.get(n, 0.0)
+                pesos[n] = w - passo * (erro * v + l2 * w)
+
+    pesos = {n: round(w, 5) for n, w in pesos.items() if abs(w) >= 1e-3}
+    return Roteador(pesos, round(bias, 5), limiar, meta={
+        'treinado_em': datetime.now().isoformat(timespec='seconds'),
+        'exemplos': len(dados),
+        'full': positivos,
+        'features': 'hash',
+    })
+
+
+def avaliar(roteador: Roteador, exemplos: list, chamadas_full: int = None) -> dict:
+    """
+    Acuracia do roteamento e chamadas economizadas em relacao a sempre
+    tentar o fast path (positivo = pipeline completo).
+    """
+    chamadas_full = chamadas_full or chamadas_full_padrao
+    vp = fp = vn = fn = 0
+    for _, feats, y in exemplos:
+        previsto = roteador.prob_feats(feats) >= roteador.limiar
+        if previsto and y:
+            vp += 1
+        elif previsto:
+            fp += 1
+        elif y:
+            fn += 1
+        else:
+            vn += 1
+    total = len(exemplos)
+    return {
+        'exemplos': total,
+        'acuracia': round((vp + vn) / total, 4) if total else 0.0,
+        'precisao_full': round(vp / (vp + fp), 4) if vp + fp else 0.0,
+        'recall_full': round(vp / (vp + fn), 4) if vp + fn else 0.0,
+        'matriz': {'vp': vp, 'fp': fp, 'vn': vn, 'fn': fn},
+        # vp: fast path pulado certo (1 chamada a menos cada)
+        'chamadas_economizadas': vp,
+        # fp: pergunta facil mandada para o pipeline completo
+        'chamadas_extras': fp * (chamadas_full - 1),
+        'saldo_chamadas': vp - fp * (chamadas_full - 1),
+        'chamadas_sem_roteador': total + (vp + fn) * chamadas_full,
+    }
+
+
+def imprimir_relatorio(relatorio: dict, titulo: str):
+    m = relatorio['matriz']
+    print(f"\n[Roteador] {titulo}: {relatorio['exemplos']} exemplo(s)")
+    print(f"  acuracia {relatorio['acuracia']:.1%} | precisao(full) {relatorio['precisao_full']:.1%} "
+          f"| recall(full) {relatorio['recall_full']:.1%}")
+    print(f"  previsto full: {m['vp']} certo(s), {m['fp']} errado(s) | previsto fast: {m['vn']} certo(s), {m['fn']} errado(s)")
+    base = relatorio['chamadas_sem_roteador']
+    print(f"  chamadas: -{relatorio['chamadas_economizadas']} fast path, +{relatorio['chamadas_extras']} pipelines "
+          f"desnecessarios, saldo {relatorio['saldo_chamadas']:+d}"
+          + (f" ({relatorio['saldo_chamadas'] / base:+.1%} de {base})" if base else ""))
+
+
+# ============= CLI =============
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Treina e avalia o roteador fast/full do SmartRLM"
+    )
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    p_treinar = subparsers.add_parser("treinar", help="Treina a partir do log de rotas")
+    p_treinar.add_argument("--log", default=roteador_log_padrao, help="JSONL de rotas (padrao: RLM_ROUTER_LOG)")
+    p_treinar.add_argument("--modelo", default=roteador_path_padrao, help="Onde gravar (padrao: RLM_ROUTER_MODEL)")
+    p_treinar.add_argument("--validacao", type=float, default=0.2, help="Fracao separada para o relatorio")
+    p_treinar.add_argument("--epocas", type=int, default=30)
+    p_treinar.add_argument("--limiar", type=float, default=None, help="P(full) para pular o fast path (padrao: RLM_ROUTER_LIMIAR ou 0.7)")
+    p_treinar.add_argument("--chamadas-full", type=int, default=chamadas_full_padrao, help="Chamadas de um pipeline completo")
+
+    p_avaliar = subparsers.add_parser("avaliar", help="Relatorio de um modelo sobre um log")
+    p_avaliar.add_argument("--log", default=roteador_log_padrao)
+    p_avaliar.add_argument("--modelo", default=roteador_path_padrao)
+    p_avaliar.add_argument("--limiar", type=float, default=None)
+    p_avaliar.add_argument("--chamadas-full", type=int, default=chamadas_full_padrao)
+
+    args = parser.parse_args()
+
+    try:
+        exemplos = ler_exemplos(args.log)
+    except OSError as e:
+        print(f"[-] Log de rotas nao encontrado: {e}")
+        sys.exit(1)
+
+    if args.comando == "treinar":
+        treino, validacao = separar_validacao(exemplos, args.validacao)
+        if not treino:
+            print("[-] Sem exemplos de treino (rode o SmartRLM com RLM_ROUTER_LOG ligado)")
+            sys.exit(1)
+        roteador = treinar(treino, epocas=args.epocas, limiar=args.limiar)
+        imprimir_relatorio(avaliar(roteador, treino, args.chamadas_full), "treino")
+        if validacao:
+            relatorio = avaliar(roteador, validacao, args.chamadas_full)
+            roteador.meta['validacao'] = relatorio
+            imprimir_relatorio(relatorio, "validacao")
+        roteador.salvar(args.modelo)
+        print(f"\n[+] Modelo salvo em {args.modelo} ({len(roteador.pesos)} pesos)")
+
+    elif args.comando == "avaliar":
+        try:
+            roteador = Roteador.carregar(args.modelo, args.limiar)
+        except OSError as e:
+            print(f"[-] Modelo nao encontrado: {e}")
+            sys.exit(1)
+        imprimir_relatorio(avaliar(roteador, exemplos, args.chamadas_full), args.log)
@@ -7,67 +7,213 @@ RLM por default, mas com ability de detectar quando a resposta
 eh simples/obvia e retornar rapidamente sem processar full pipeline.
 """
 
-import re
 import sys
-import io
 import os
-import argparse
 import json
-from ollama import Client
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from context_source import ContextSource
+from rlm_base import RLMBase, Cancelado
+from prazo import (Prazo, PrazoEsgotado, PULADA, deadline_padrao, opcoes_com_prazo,
+                   iterar_com_prazo, registrar_vazao, concatenar_parciais)
+from ollama_pool import criar_cliente
+from modelos import aquecer_padrao
+from telemetria import configurar as configurar_telemetria
+from roteador import roteador_padrao, registrar_rota, roteador_habilitado, roteador_log_padrao
+from batch_runner import abrir_contexto, processar_jsonl
 
 
 # ============= CONFIGURACAO =============
 ollama_host = os.environ.get('OLLAMA_HOST', 'http://ollama:11434')
-cliente_ollama = Client(host=ollama_host)
+# Varios hosts: RLM_OLLAMA_HOSTS=url1,url2 (ver ollama_pool.py)
+cliente_ollama = criar_cliente(ollama_host)
 
+# Modo especulativo: split + sub-tarefas comecam junto com o fast path
+especulativo_padrao = os.environ.get('RLM_SPECULATIVE', '0').lower() in ('1', 'true', 'on')
+
+# Sinal de cancelamento do ramo especulativo (checado antes de cada generate)
+_cancelamento = contextvars.ContextVar('rlm_cancelamento', default=None)
+# Tokens gastos pelo ramo atual (fast ou especulativo), para o desperdicio
+_conta_ramo = contextvars.ContextVar('rlm_conta_ramo', default=None)
+# Prazo do pedido (chat_completion com deadline_ms), ver prazo.py
+_prazo = contextvars.ContextVar('rlm_prazo', default=None)
+# Modelo/threshold de um pedido (servidor): sobrepoem os da instancia so nele
+_pedido = contextvars.ContextVar('rlm_pedido', default=None)
+
+
+def _checar_cancelamento():
+    evento = _cancelamento.get()
+    if evento is not None and evento.is_set():
+        raise Cancelado()
 
-# ============= CLASSES =============
 
-class LocalREPL:
-    """Environment local para capturar outputs Python."""
-    def __init__(self):
-        self.locals = {}
-        self.output = io.StringIO()
+def _interrompivel(stream, segundos: float, prazo: Prazo):
+    """Chunks do stream ate o timeout; PrazoEsgotado conta como chamada interrompida."""
+    try:
+        yield from iterar_com_prazo(stream, segundos)
+    except PrazoEsgotado:
+        prazo.degradar('chamadas_interrompidas')
+        raise
+
 
-    def execute(self, code: str) -> str:
-        """Executa codigo Python e retorna o output."""
+@contextmanager
+def _contando(conta: dict):
+    """Soma em `conta` os tokens das chamadas feitas dentro do bloco."""
+    token = _conta_ramo.set(conta)
+    try:
+        yield conta
+    finally:
         try:
-            old_stdout = sys.stdout
-            sys.stdout = self.output
-            exec(code, self.locals)
-            sys.stdout = old_stdout
-            return self.output.getvalue()
-        except Exception as e:
-            sys.stdout = old_stdout
-            return f"[ERROR] {type(e).__name__}: {str(e)}"
+            _conta_ramo.reset(token)
+        except ValueError:
+            pass  # generator consumido em outro contexto
 
-    def clear(self):
-        """Limpa o buffer de output."""
-        self.output = io.StringIO()
 
+# ============= CLASSES =============
 
-class SmartRLM:
+class SmartRLM(RLMBase):
     """
     Smart Recursive Language Model com Early Exit.
     
     Processo:
     1. Tenta responder direto (FAST PATH)
     2. Se confiante 100%, retorna imediatamente
-    3. Se nao confiante, vai pra SLOW PATH (RLM completo)
+    3. Se nao confiante, vai pra SLOW PATH (RLM completo, em rlm_base.py)
+
+    Daqui sao so o fast path, o prazo (prazo.py), o modo especulativo e o
+    roteador; entram no pipeline pelos ganchos do RLMBase.
     """
     
-    def __init__(self, model: str = "qwen3:4b"):
-        self.model = model
-        self.repl = LocalREPL()
-        self.max_depth = 3
-        self.call_count = 0
+    def __init__(self, model: str = "qwen3:4b", max_concurrency: int = None,
+                 usar_cache: bool = True, recursivo: bool = None,
+                 bm25: bool = None, num_ctx: int = None, keep_alive: str = None,
+                 especulativo: bool = None, usar_roteador: bool = True,
+                 modelos: dict = None, repl: bool = None):
+        super().__init__(model, max_concurrency, usar_cache, recursivo, bm25,
+                         num_ctx, keep_alive, modelos, repl)
         self.confidence_threshold = 0.90  # 90% de confianca pra early exit
+        self.especulativo = especulativo_padrao if especulativo is None else especulativo
+        # Roteador aprendido (rlm/roteador.py) + log de rotas para treina-lo
+        self.roteador = roteador_padrao() if usar_roteador else None
+        self.rotas_log = roteador_log_padrao if usar_roteador and roteador_habilitado else None
+        self.metricas['tokens_desperdicados'] = 0
+
+    # ----- ganchos do RLMBase: cancelamento e prazo -----
+
+    def _cliente(self):
+        return cliente_ollama
+
+    def _modelo(self, etapa: str) -> str:
+        """Como no RLMBase, com o modelo do pedido (se houver) no lugar de self.model."""
+        pedido = _pedido.get()
+        principal = (pedido and pedido.get('modelo')) or self.model
+        return self.gerenciador.escolher(etapa, self.modelos.get(etapa, principal), principal)
+
+    def _limiar(self) -> float:
+        """Threshold do early exit: o do pedido ou o da instancia."""
+        pedido = _pedido.get()
+        confianca = pedido.get('confianca') if pedido else None
+        return self.confidence_threshold if confianca is None else confianca
+
+    def _antes_de_chamar(self, etapa: str):
+        _checar_cancelamento()
+        prazo = _prazo.get()
+        if prazo is not None:
+            prazo.verificar(etapa)
+
+    def _checar_cancelamento(self):
+        _checar_cancelamento()
+
+    def _sem_tempo(self, etapa: str) -> bool:
+        prazo = _prazo.get()
+        return prazo is not None and prazo.sem_tempo(etapa)
+
+    def _degradar(self, motivo: str):
+        prazo = _prazo.get()
+        if prazo is not None:
+            prazo.degradar(motivo)
+
+    def _timeout_repl(self, timeout: float) -> float:
+        prazo = _prazo.get()
+        if prazo is not None:
+            timeout = min(timeout, max(0.1, prazo.restante_ms('repl') / 1000))
+        return timeout
+
+    def _registrar_metricas(self, resposta, modelo: str):
+        """Metricas do RLMBase + tokens do ramo atual (desperdicio) e vazao (prazo)."""
+        super()._registrar_metricas(resposta, modelo)
+        registrar_vazao(modelo, resposta)
+        conta = _conta_ramo.get()
+        if conta is not None:
+            with self._metricas_lock:
+                conta['chamadas'] += 1
+                conta['tokens'] += (resposta.get('prompt_eval_count') or 0) + (resposta.get('eval_count') or 0)
+
+    def _chamar(self, prompt: str, opcoes: dict, etapa: str, inicio: float, modelo: str) -> tuple:
+        prazo = _prazo.get()
+        if prazo is None:
+            return super()._chamar(prompt, opcoes, etapa, inicio, modelo)
+        return self._chamar_ollama_com_prazo(prompt, opcoes, etapa, inicio, modelo, prazo)
+
+    def _chamar_ollama_com_prazo(self, prompt: str, opcoes: dict, etapa: str, inicio: float,
+                                 modelo: str, prazo: Prazo) -> tuple:
+        """
+        Com prazo: gera em stream (da para interromper no timeout) com
+        num_predict do tempo restante. Retorna (texto, completa); resposta
+        cortada pelo num_predict nao e completa (nao vai para o cache).
+        """
+        segundos = prazo.verificar(etapa)
+        kwargs, limitou = opcoes_com_prazo(
+            {**self.prompts.opcoes(self.keep_alive), **opcoes}, segundos, modelo
+        )
+        partes = []
+        final = None
+        try:
+            stream = cliente_ollama.generate(model=modelo, prompt=prompt, stream=True, **kwargs)
+            for chunk in iterar_com_prazo(stream, segundos):
+                if chunk.get('done'):
+                    final = chunk
+                partes.append(chunk.get('response', ''))
+        except PrazoEsgotado:
+            prazo.degradar('chamadas_interrompidas')
+            self.telemetria.registrar(etapa, modelo, inicio, cancelado=True, prompt_chars=len(prompt))
+            raise
+        except Exception as e:
+            self.telemetria.registrar(etapa, modelo, inicio, erro=str(e))
+            raise
+        if final is not None:
+            self._registrar_metricas(final, modelo)
+        self.telemetria.registrar(etapa, modelo, inicio, final, prompt_chars=len(prompt))
+        return ''.join(partes), not self._cortada(final, limitou)
+
+    def _abrir_stream(self, modelo: str, prompt: str, kwargs: dict, etapa: str) -> tuple:
+        prazo = _prazo.get()
+        if prazo is None:
+            return super()._abrir_stream(modelo, prompt, kwargs, etapa)
+        segundos = prazo.verificar(etapa)
+        kwargs, limitou = opcoes_com_prazo(kwargs, segundos, modelo)
+        stream = cliente_ollama.generate(model=modelo, prompt=prompt, stream=True, **kwargs)
+        return _interrompivel(stream, segundos, prazo), limitou
+
+    # ----- fast path -----
+
+    def _fast_path_prompt(self, tarefa: str, contexto: str) -> str:
+        """
+        Prompt do fast path (compartilhado pela versao streaming).
+        Usa o mesmo prefixo de contexto do split e das sub-tarefas, entao
+        se cair no RLM completo o contexto ja esta no KV cache do Ollama.
+        """
+        return f"""{self.prompts.prefixo(contexto)}Responda esta pergunta RAPIDAMENTE e com CONFIANCA.
+Se voce tem CERTEZA ABSOLUTA (100%) que sabe a resposta, responda direto.
+Se tem duvida, responda com [UNCERTAIN] no inicio.
+
+PERGUNTA: {tarefa}
 
-    def _sanitize_response(self, text: str) -> str:
-        """Remove markdown code blocks e caracteres especiais."""
-        text = re.sub(r'```(?:python|json|yaml|plaintext|)?\n?', '', text)
-        text = re.sub(r'```', '', text)
-        return text.strip()
+Responda CONCISO:"""
 
     def _try_fast_path(self, tarefa: str, contexto: str) -> tuple:
         """
@@ -76,24 +222,10 @@ class SmartRLM:
         Returns:
             (resposta, confianca) - confianca entre 0.0 e 1.0
         """
-        prompt = f"""Responda esta pergunta RAPIDAMENTE e com CONFIANCA.
-Se voce tem CERTEZA ABSOLUTA (100%) que sabe a resposta, responda direto.
-Se tem duvida, responda com [UNCERTAIN] no inicio.
-
-PERGUNTA: {tarefa}
-
-CONTEXTO: {contexto[:500]}
-
-Responda CONCISO:"""
+        prompt = self._fast_path_prompt(tarefa, contexto)
 
         try:
-            response = cliente_ollama.generate(
-                model=self.model,
-                prompt=prompt,
-                stream=False
-            )
-            
-            resposta = response.get('response', '').strip()
+            resposta = self._generate(prompt, etapa='fast').strip()
             resposta = self._sanitize_response(resposta)
             
             # Detecta se modelo tem certeza
@@ -111,199 +243,474 @@ Responda CONCISO:"""
             print(f"[!] Erro no fast path: {e}")
             return (None, 0.0)
 
-    def _split_task(self, tarefa: str, contexto: str) -> list:
-        """Quebra a tarefa em sub-tarefas."""
-        prompt = f"""Analise esta tarefa e quebre-a em 2-3 sub-tarefas.
-Retorne APENAS JSON com chave "subtasks".
+    def _try_fast_path_stream(self, tarefa: str, contexto: str):
+        """
+        Versao streaming do fast path.
 
-TAREFA: {tarefa}
-CONTEXTO (primeiros 500 chars): {contexto[:500]}...
+        Segura os primeiros tokens ate saber se a resposta comeca com
+        [UNCERTAIN]. Se sim, interrompe a geracao sem mostrar nada;
+        se nao, faz yield dos eventos token conforme chegam.
+
+        Returns (via yield from):
+            (resposta, confianca) - mesmo contrato de _try_fast_path
+        """
+        marcador = '[UNCERTAIN]'
+        partes = []
+        confiante = None
 
-JSON:"""
         try:
-            response = cliente_ollama.generate(
-                model=self.model,
-                prompt=prompt,
-                stream=False
-            )
-            
-            text = response.get('response', '{}')
-            text = self._sanitize_response(text)
-            
-            match = re.search(r'\{.*\}', text, re.DOTALL)
-            if match:
-                data = json.loads(match.group())
-                return data.get('subtasks', [tarefa])
-            return [tarefa]
+            prompt = self._fast_path_prompt(tarefa, contexto)
+            for texto in self._generate_stream(prompt, etapa='fast'):
+                if not texto:
+                    continue
+                partes.append(texto)
+
+                if confiante is None:
+                    inicio = ''.join(partes).lstrip()
+                    if marcador.startswith(inicio):
+                        continue  # ainda nao da pra decidir
+                    confiante = not inicio.startswith(marcador)
+                    if not confiante:
+                        break  # fecha o stream, Ollama para de gerar
+                    print("[FastPath] High confidence (95%) -> streaming da resposta!")
+                    yield {'evento': 'token', 'etapa': 'fast', 'texto': ''.join(partes)}
+                else:
+                    yield {'evento': 'token', 'etapa': 'fast', 'texto': texto}
         except Exception as e:
-            print(f"[!] Erro ao quebrar: {e}")
-            return [tarefa]
-
-    def _process_subtask(self, subtarefa: str, contexto: str) -> str:
-        """Processa uma sub-tarefa individual."""
-        prompt = f"""Resolva esta sub-tarefa de forma concisa.
+            print(f"[!] Erro no fast path: {e}")
+            return (None, 0.0)
 
-TAREFA: {subtarefa}
+        resposta = self._sanitize_response(''.join(partes))
+        if not confiante:
+            print("[FastPath] Low confidence -> vai pro RLM completo")
+            return (resposta.replace(marcador, '').strip(), 0.5)
+        return (resposta, 0.95)
 
-CONTEXTO:
-{contexto[:2000]}
+    def _full_rlm(self, tarefa: str, contexto: str, preparado: tuple = None,
+                  rascunho: str = None) -> str:
+        """
+        Executa o pipeline RLM COMPLETO.
+        Eh chamado quando fast path nao teve confianca suficiente.
+        `preparado` = (subtarefas, resultados) ja calculados pelo ramo
+        especulativo; nesse caso so falta a agregacao.
+        """
+        print("\n[RLM-Full] Iniciando pipeline completo...")
+        if self.modo_repl and preparado is None:
+            return self._repl_rlm(tarefa, contexto)
+        subtarefas, resultados = preparado or self._split_e_subtarefas(tarefa, contexto)
+
+        prazo = _prazo.get()
+        if prazo is not None:
+            # Sub-tarefas puladas no prazo ficam de fora; sem nenhuma, o chamador usa o fast path
+            pares = [(sub, res) for sub, res in zip(subtarefas, resultados) if res != PULADA]
+            if not pares:
+                raise PrazoEsgotado("nenhuma sub-tarefa terminou no prazo")
+            subtarefas, resultados = [sub for sub, _ in pares], [res for _, res in pares]
 
-Resposta:"""
+        # Step 3: Aggregate
+        print("[RLM] Agregando resultados...")
         try:
-            response = cliente_ollama.generate(
-                model=self.model,
-                prompt=prompt,
-                stream=False
-            )
-            return response.get('response', '').strip()
-        except Exception as e:
-            return f"[ERROR] {str(e)}"
+            resposta_final = self._aggregate_results(subtarefas, resultados, tarefa, rascunho)
+        except PrazoEsgotado:
+            print("[Prazo] Sem tempo para agregar, devolvendo os resultados parciais")
+            prazo.degradar('sem_agregacao')
+            resposta_final = concatenar_parciais(subtarefas, resultados)
+
+        return resposta_final
 
-    def _aggregate_results(self, subtarefas: list, resultados: list, tarefa_original: str) -> str:
-        """Agrega resultados das sub-tarefas."""
-        aggregation_prompt = f"""Agregue estes resultados em uma resposta coerente.
+    def _full_rlm_stream(self, tarefa: str, contexto: str, preparado: tuple = None,
+                         rascunho: str = None):
+        """
+        Pipeline completo com a agregacao em streaming.
+        Faz yield dos eventos token da agregacao e retorna a resposta final.
+        """
+        print("\n[RLM-Full] Iniciando pipeline completo (streaming)...")
+        if self.modo_repl and preparado is None:
+            resposta = self._repl_rlm(tarefa, contexto)
+            yield {'evento': 'token', 'etapa': 'repl', 'texto': resposta}
+            return resposta
+        subtarefas, resultados = preparado or self._split_e_subtarefas(tarefa, contexto)
 
-TAREFA ORIGINAL: {tarefa_original}
+        print("[RLM] Agregando resultados...")
+        return (yield from self._aggregate_results_stream(subtarefas, resultados, tarefa, rascunho))
 
-RESULTADOS:
-"""
-        for i, (sub, res) in enumerate(zip(subtarefas, resultados)):
-            aggregation_prompt += f"\n[{i+1}] {sub}\n    -> {res[:500]}\n"
+    # ----- roteador -----
 
-        aggregation_prompt += "\nResposta final clara:"
+    def _rotear(self, tarefa: str, contexto: str) -> tuple:
+        """('fast' ou 'full', P(full)). Sem modelo treinado, sempre fast."""
+        if self.roteador is None:
+            return 'fast', None
+        return self.roteador.decidir(tarefa, len(contexto))
 
+    def _registrar_rota(self, tarefa: str, contexto: str, resultado: dict,
+                        confianca: float, prob_full: float):
+        """
+        Anexa o pedido ao log de treino do roteador (so se o fast path
+        rodou e respondeu: erro no fast path nao e rotulo) e poe a
+        previsao no resultado.
+        """
+        if prob_full is not None:
+            resultado['roteador'] = {'prob_full': round(prob_full, 3), 'fast_path': confianca is not None}
+        if not self.rotas_log or not confianca:
+            return
         try:
-            response = cliente_ollama.generate(
-                model=self.model,
-                prompt=aggregation_prompt,
-                stream=False
-            )
-            return response.get('response', '').strip()
-        except Exception as e:
-            return f"[ERROR] {str(e)}"
+            registrar_rota(self.rotas_log, tarefa, len(contexto), resultado['modo'])
+        except OSError as e:
+            print(f"[!] Erro ao gravar log de rotas: {e}")
 
-    def _full_rlm(self, tarefa: str, contexto: str) -> str:
+    # ----- modo especulativo -----
+
+    def _especular(self, tarefa: str, contexto: str) -> dict:
         """
-        Executa o pipeline RLM COMPLETO.
-        Eh chamado quando fast path nao teve confianca suficiente.
+        Dispara split + sub-tarefas numa thread enquanto o fast path roda.
+        Cada generate do ramo checa o sinal de cancelamento antes de sair;
+        uma chamada que ja esta no Ollama termina e o resultado vai para o
+        cache (proxima pergunta igual aproveita).
         """
-        print("\n[RLM-Full] Iniciando pipeline completo...")
-        
-        # Step 1: Split
-        subtarefas = self._split_task(tarefa, contexto)
-        print(f"[RLM] Split em {len(subtarefas)} sub-tarefas")
+        especulacao = {'cancelar': threading.Event(), 'conta': {'chamadas': 0, 'tokens': 0}}
 
-        # Step 2: Process
-        resultados = []
-        for i, subtarefa in enumerate(subtarefas, 1):
-            print(f"  [{i}/{len(subtarefas)}] {subtarefa[:60]}...")
-            resultado = self._process_subtask(subtarefa, contexto)
-            resultados.append(resultado)
+        def _rodar():
+            _cancelamento.set(especulacao['cancelar'])
+            _conta_ramo.set(especulacao['conta'])
+            return self._split_e_subtarefas(tarefa, contexto)
 
-        # Step 3: Aggregate
-        print("[RLM] Agregando resultados...")
-        resposta_final = self._aggregate_results(subtarefas, resultados, tarefa)
+        executor = ThreadPoolExecutor(max_workers=1)
+        especulacao['futuro'] = executor.submit(contextvars.copy_context().run, _rodar)
+        executor.shutdown(wait=False)
+        return especulacao
 
-        return resposta_final
+    def _descartar_especulacao(self, especulacao: dict) -> dict:
+        """
+        Fast path venceu: cancela o ramo especulativo. O relatorio tem o
+        que ja foi gasto; chamadas ainda no Ollama entram em
+        metricas['tokens_desperdicados'] quando terminarem.
+        """
+        especulacao['cancelar'].set()
+        conta = especulacao['conta']
+        relatorio = {
+            'vencedor': 'fast',
+            'tokens_desperdicados': conta['tokens'],
+            'chamadas_descartadas': conta['chamadas'],
+            'em_andamento': not especulacao['futuro'].done(),
+        }
 
-    def chat_completion(self, tarefa: str, contexto: str = "") -> dict:
+        def _contabilizar(_):
+            with self._metricas_lock:
+                self.metricas['tokens_desperdicados'] += conta['tokens']
+
+        especulacao['futuro'].add_done_callback(_contabilizar)
+        print(f"[Especulativo] Fast path venceu, ramo completo cancelado "
+              f"({relatorio['tokens_desperdicados']} tokens descartados ate agora)")
+        return relatorio
+
+    def _aguardar_especulacao(self, especulacao: dict):
+        """Fast path incerto: espera split + sub-tarefas do ramo especulativo."""
+        if especulacao is None:
+            return None
+        try:
+            return especulacao['futuro'].result()
+        except Exception as e:
+            print(f"[!] Erro no ramo especulativo, refazendo sem especular: {e}")
+            return None
+
+    def _relatorio_full(self, conta_fast: dict, rascunho: str) -> dict:
+        """
+        Pipeline completo venceu: a resposta do fast path entra na agregacao
+        como rascunho; so e desperdicio se nao sobrou texto para reaproveitar.
+        """
+        desperdicio = 0 if rascunho else conta_fast['tokens']
+        with self._metricas_lock:
+            self.metricas['tokens_desperdicados'] += desperdicio
+        return {
+            'vencedor': 'full',
+            'tokens_desperdicados': desperdicio,
+            'chamadas_descartadas': 0 if rascunho else conta_fast['chamadas'],
+            'rascunho_reaproveitado': bool(rascunho),
+        }
+
+    def chat_completion(self, tarefa: str, contexto: str = "", deadline_ms: int = None,
+                        confianca: float = None, modelo: str = None) -> dict:
         """
         Executa Smart RLM com Early Exit.
+
+        deadline_ms: prazo do pedido (padrao: RLM_DEADLINE_MS; 0 = sem
+        prazo). Cada chamada ao Ollama recebe timeout e num_predict do
+        tempo restante, e o pipeline degrada em vez de estourar (prazo.py).
+        confianca / modelo: threshold e modelo principal so deste pedido
+        (padrao: confidence_threshold e self.model); a cascata continua.
         
         Returns:
             {
                 'resposta': str,
                 'confianca': float,
-                'modo': 'fast' ou 'full',
-                'tempo_ms': int
+                'modo': 'fast' ou 'full' ('prazo' se o prazo acabou sem resposta),
+                'tempo_ms': int,
+                'ttft_ms': int,  # sem streaming, igual a tempo_ms
+                'especulacao': {...}  # so no modo especulativo: vencedor,
+                                      # tokens_desperdicados, chamadas_descartadas
+                'roteador': {...}     # so com modelo treinado: prob_full, fast_path
+                'degradacoes': [...]  # so com prazo: subtarefas_puladas,
+                                      # sem_agregacao, resposta_fast...
+                'prazo': {...}        # so com prazo: deadline_ms, restante_ms, contagens
             }
         """
-        import time
+        if confianca is not None or modelo:
+            token = _pedido.set({'confianca': confianca, 'modelo': modelo})
+            try:
+                return self.chat_completion(tarefa, contexto, deadline_ms)
+            finally:
+                _pedido.reset(token)
+
+        deadline_ms = deadline_padrao if deadline_ms is None else deadline_ms
+        if not deadline_ms:
+            return self._chat_completion(tarefa, contexto)
+
+        prazo = Prazo(deadline_ms)
+        token = _prazo.set(prazo)
+        try:
+            resultado = self._chat_completion(tarefa, contexto)
+        finally:
+            _prazo.reset(token)
+        resultado.update(prazo.relatorio())
+        if resultado['degradacoes']:
+            print(f"[Prazo] {deadline_ms}ms | degradacoes: {', '.join(resultado['degradacoes'])}")
+        return resultado
+
+    def _chat_completion(self, tarefa: str, contexto: str) -> dict:
+        """Corpo do chat_completion (o prazo, se houver, ja esta em _prazo)."""
         start_time = time.time()
+        trace = self.telemetria.iniciar('chat_completion')
         
         self.call_count += 1
         print(f"\n[SmartRLM-{self.call_count}] Processando: {tarefa[:80]}...")
 
-        # STEP 1: FAST PATH
-        print("[*] Tentando resposta rápida...")
-        resposta_fast, confianca = self._try_fast_path(tarefa, contexto)
-
-        # DECISION POINT
-        if confianca >= self.confidence_threshold and resposta_fast:
-            print(f"[+] EARLY EXIT! Confianca: {confianca:.0%}")
-            elapsed = (time.time() - start_time) * 1000
-            return {
-                'resposta': resposta_fast,
-                'confianca': confianca,
-                'modo': 'fast',
-                'tempo_ms': int(elapsed)
-            }
-
-        # STEP 2: FULL RLM (se nao teve confianca)
-        print(f"[-] Confianca insuficiente ({confianca:.0%}), ativando RLM completo...")
-        resposta_full = self._full_rlm(tarefa, contexto)
+        # STEP 0: ROTEADOR (pergunta prevista como dificil pula o fast path)
+        rota, prob_full = self._rotear(tarefa, contexto)
+        especulacao = resposta_fast = None
+        if rota == 'fast':
+            # STEP 1: FAST PATH (no modo especulativo, split + sub-tarefas ja rodam junto)
+            especulacao = self._especular(tarefa, contexto) if self.especulativo and not self.modo_repl else None
+            print("[*] Tentando resposta rápida...")
+            with _contando({'chamadas': 0, 'tokens': 0}) as conta_fast:
+                resposta_fast, confianca = self._try_fast_path(tarefa, contexto)
+
+            # DECISION POINT
+            if confianca >= self._limiar() and resposta_fast:
+                print(f"[+] EARLY EXIT! Confianca: {confianca:.0%}")
+                elapsed = (time.time() - start_time) * 1000
+                resultado = {
+                    'resposta': resposta_fast,
+                    'confianca': confianca,
+                    'modo': 'fast',
+                    'tempo_ms': int(elapsed),
+                    'ttft_ms': int(elapsed)
+                }
+                if especulacao is not None:
+                    resultado['especulacao'] = self._descartar_especulacao(especulacao)
+                self._registrar_rota(tarefa, contexto, resultado, confianca, prob_full)
+                self.telemetria.finalizar(trace, modo='fast', **resultado.get('especulacao', {}))
+                return resultado
+
+            # STEP 2: FULL RLM (se nao teve confianca)
+            print(f"[-] Confianca insuficiente ({confianca:.0%}), ativando RLM completo...")
+        else:
+            confianca = None  # fast path nao rodou, nao ha rotulo para o log
+            print(f"[Roteador] P(full) = {prob_full:.0%}, pulando o fast path")
+
+        rascunho = resposta_fast if especulacao is not None else None
+        try:
+            resposta_full = self._full_rlm(
+                tarefa, contexto, self._aguardar_especulacao(especulacao), rascunho
+            )
+        except PrazoEsgotado:
+            return self._resultado_sem_full(tarefa, contexto, start_time, trace,
+                                            resposta_fast, confianca, prob_full)
         
         elapsed = (time.time() - start_time) * 1000
-        return {
+        resultado = {
             'resposta': resposta_full,
             'confianca': 0.95,  # RLM completo tem alta confianca
             'modo': 'full',
-            'tempo_ms': int(elapsed)
+            'tempo_ms': int(elapsed),
+            'ttft_ms': int(elapsed)
+        }
+        if especulacao is not None:
+            resultado['especulacao'] = self._relatorio_full(conta_fast, rascunho)
+        self._registrar_rota(tarefa, contexto, resultado, confianca, prob_full)
+        self.telemetria.finalizar(trace, modo='full', **resultado.get('especulacao', {}))
+        return resultado
+
+    def _resultado_sem_full(self, tarefa: str, contexto: str, start_time: float, trace,
+                            resposta_fast: str, confianca: float, prob_full: float) -> dict:
+        """
+        Prazo acabou sem nenhuma sub-tarefa: fica a resposta do fast path
+        (modo 'fast'); sem ela, modo 'prazo' com a mensagem de erro.
+        """
+        prazo = _prazo.get()
+        if resposta_fast:
+            print("[Prazo] Sem tempo para o RLM completo, usando a resposta do fast path")
+            prazo.degradar('resposta_fast')
+        else:
+            print("[Prazo] Sem tempo para o RLM completo e sem resposta do fast path")
+            prazo.degradar('sem_resposta')
+        elapsed = (time.time() - start_time) * 1000
+        resultado = {
+            'resposta': resposta_fast or "[ERROR] prazo esgotado antes de qualquer resposta",
+            'confianca': confianca or 0.0,
+            'modo': 'fast' if resposta_fast else 'prazo',
+            'tempo_ms': int(elapsed),
+            'ttft_ms': int(elapsed)
+        }
+        # Nao e rotulo para o roteador: o fast path nao foi suficiente, so nao deu tempo
+        self._registrar_rota(tarefa, contexto, resultado, None, prob_full)
+        self.telemetria.finalizar(trace, modo=resultado['modo'])
+        return resultado
+
+    def _processar_pedido(self, pedido: dict) -> dict:
+        with abrir_contexto(pedido) as contexto:
+            return self.chat_completion(pedido.get('tarefa', ''), contexto)
+
+    def _chat_completion_events(self, tarefa: str, contexto: str):
+        """Fluxo do chat_completion_stream, sem a medicao de tempo."""
+        self.call_count += 1
+        print(f"\n[SmartRLM-{self.call_count}] Processando (streaming): {tarefa[:80]}...")
+
+        # STEP 0: ROTEADOR
+        rota, prob_full = self._rotear(tarefa, contexto)
+        especulacao = resposta_fast = None
+        if rota == 'fast':
+            # STEP 1: FAST PATH (no modo especulativo, split + sub-tarefas ja rodam junto)
+            especulacao = self._especular(tarefa, contexto) if self.especulativo and not self.modo_repl else None
+            print("[*] Tentando resposta rápida...")
+            try:
+                with _contando({'chamadas': 0, 'tokens': 0}) as conta_fast:
+                    resposta_fast, confianca = yield from self._try_fast_path_stream(tarefa, contexto)
+            except GeneratorExit:
+                # Cliente desistiu no meio do fast path
+                if especulacao is not None:
+                    self._descartar_especulacao(especulacao)
+                raise
+
+            if confianca >= self._limiar() and resposta_fast:
+                print(f"\n[+] EARLY EXIT! Confianca: {confianca:.0%}")
+                resultado = {'resposta': resposta_fast, 'confianca': confianca, 'modo': 'fast'}
+                if especulacao is not None:
+                    resultado['especulacao'] = self._descartar_especulacao(especulacao)
+                self._registrar_rota(tarefa, contexto, resultado, confianca, prob_full)
+                return resultado
+
+            # STEP 2: FULL RLM
+            print(f"[-] Confianca insuficiente ({confianca:.0%}), ativando RLM completo...")
+        else:
+            confianca = None
+            print(f"[Roteador] P(full) = {prob_full:.0%}, pulando o fast path")
+
+        rascunho = resposta_fast if especulacao is not None else None
+        resposta_full = yield from self._full_rlm_stream(
+            tarefa, contexto, self._aguardar_especulacao(especulacao), rascunho
+        )
+        resultado = {'resposta': resposta_full, 'confianca': 0.95, 'modo': 'full'}
+        if especulacao is not None:
+            resultado['especulacao'] = self._relatorio_full(conta_fast, rascunho)
+        self._registrar_rota(tarefa, contexto, resultado, confianca, prob_full)
+        return resultado
+
+    def chat_completion_stream(self, tarefa: str, contexto: str = "",
+                               confianca: float = None, modelo: str = None):
+        """
+        Versao streaming do chat_completion (confianca / modelo idem).
+
+        Faz yield de eventos (dicts), nesta ordem:
+            {'evento': 'token', 'etapa': 'fast' ou 'aggregate', 'texto': str}
+            ...
+            {'evento': 'resultado', 'resposta', 'confianca', 'modo',
+             'tempo_ms', 'ttft_ms'}
+
+        ttft_ms = tempo ate o primeiro token entregue (latencia percebida).
+        """
+        start_time = time.time()
+        ttft_ms = None
+        trace = self.telemetria.iniciar('chat_completion_stream')
+
+        # O pedido vive num contexto proprio: o gerador e retomado a cada next()
+        contexto_pedido = contextvars.copy_context()
+        if confianca is not None or modelo:
+            contexto_pedido.run(_pedido.set, {'confianca': confianca, 'modelo': modelo})
+        eventos = self._chat_completion_events(tarefa, contexto)
+        while True:
+            try:
+                evento = contexto_pedido.run(next, eventos)
+            except StopIteration as fim:
+                resultado = fim.value
+                break
+            if ttft_ms is None:
+                ttft_ms = int((time.time() - start_time) * 1000)
+            yield evento
+
+        elapsed = int((time.time() - start_time) * 1000)
+        self.telemetria.finalizar(
+            trace, modo=resultado['modo'], ttft_ms=ttft_ms, **resultado.get('especulacao', {})
+        )
+        yield {
+            'evento': 'resultado',
+            **resultado,
+            'tempo_ms': elapsed,
+            'ttft_ms': ttft_ms if ttft_ms is not None else elapsed
         }
 
 
 # ============= MODO GENERICO =============
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description="Smart RLM com Early Exit - RLM Default com skip inteligente"
-    )
-    
-    parser.add_argument(
-        "--tarefa",
-        type=str,
-        required=True,
-        help="Instrucao principal"
-    )
-    
-    parser.add_argument(
-        "--contexto",
-        type=str,
-        default="",
-        help="Texto ou caminho de arquivo"
-    )
-    
-    parser.add_argument(
-        "--modelo",
-        type=str,
-        default="qwen3:4b",
-        help="Modelo Ollama"
-    )
-    
-    parser.add_argument(
-        "--confianca",
-        type=float,
-        default=0.90,
-        help="Threshold de confianca para early exit (0.0-1.0)"
-    )
-    
-    parser.add_argument(
-        "--verbose",
-        action="store_true",
-        help="Modo verboso"
+def executar_cli(args, modelos: dict = None):
+    """Corpo da CLI; argumentos ja validados por cli.main."""
+    if args.trace or args.metricas:
+        configurar_telemetria(args.trace, args.metricas)
+
+    # Initialize
+    print(f"[*] Starting SmartRLM (confidence threshold: {args.confianca:.0%})", file=sys.stderr if args.batch_jsonl else sys.stdout)
+    rlm = SmartRLM(
+        model=args.modelo,
+        max_concurrency=args.concorrencia,
+        usar_cache=not args.no_cache,
+        recursivo=args.recursivo or None,
+        repl=args.repl or None,
+        bm25=args.bm25 or None,
+        num_ctx=args.num_ctx,
+        keep_alive=args.keep_alive,
+        especulativo=args.especulativo or None,
+        usar_roteador=not args.sem_roteador,
+        modelos=modelos
     )
+    rlm.confidence_threshold = args.confianca
+    if args.modelos_na_gpu is not None:
+        rlm.gerenciador.capacidade = args.modelos_na_gpu
+    if args.aquecer or aquecer_padrao:
+        rlm.aquecer()
 
-    args = parser.parse_args()
+    # Modo lote: varias tarefas, resultados em JSONL (logs vao para stderr)
+    if args.batch_jsonl:
+        try:
+            processar_jsonl(rlm, args.batch_jsonl, args.saida, args.batch_workers, args.retomar)
+        except KeyboardInterrupt:
+            print("\n[!] Interrupted", file=sys.stderr)
+            sys.exit(130)
+        sys.exit(0)
 
     # Load context
     contexto_final = args.contexto
     
+    if args.contexto:
+        # Historico com entradas ainda no segmento .log: compacta antes do mmap
+        from context_manager import compactar_pendente
+        if compactar_pendente(args.contexto):
+            print("[+] Pending history entries compacted")
+
     if args.contexto and os.path.isfile(args.contexto):
         print(f"[*] Loading context from file: {args.contexto}")
         try:
-            with open(args.contexto, 'r', encoding='utf-8') as f:
-                contexto_final = f.read()
-                print(f"[+] Loaded {len(contexto_final)} characters")
+            # mmap: o pipeline fatia o arquivo sob demanda, sem f.read()
+            contexto_final = ContextSource(args.contexto)
+            print(f"[+] Mapped {len(contexto_final)} bytes")
         except Exception as e:
             print(f"[-] Error reading file: {e}")
             sys.exit(1)
@@ -312,32 +719,63 @@ if __name__ == "__main__":
     else:
         print("[!] No context provided")
 
-    # Initialize
-    print(f"\n[*] Starting SmartRLM (confidence threshold: {args.confianca:.0%})")
-    rlm = SmartRLM(model=args.modelo)
-    rlm.confidence_threshold = args.confianca
-
     # Execute
     print("\n" + "="*60)
     print(f"[TASK] {args.tarefa}")
     print("="*60)
 
     try:
-        resultado = rlm.chat_completion(args.tarefa, contexto_final)
+        if args.stream:
+            resultado = None
+            for evento in rlm.chat_completion_stream(args.tarefa, contexto_final):
+                if evento['evento'] == 'token':
+                    sys.stdout.write(evento['texto'])
+                    sys.stdout.flush()
+                else:
+                    resultado = evento
+            print()
+        else:
+            resultado = rlm.chat_completion(args.tarefa, contexto_final, args.deadline_ms)
         
         print("\n" + "="*60)
-        print(f"[RESULT] Modo: {resultado['modo'].upper()} | Confianca: {resultado['confianca']:.0%} | Tempo: {resultado['tempo_ms']}ms")
-        print("="*60)
-        print(resultado['resposta'])
+        print(f"[RESULT] Modo: {resultado['modo'].upper()} | Confianca: {resultado['confianca']:.0%} | Tempo: {resultado['tempo_ms']}ms | TTFT: {resultado['ttft_ms']}ms")
         print("="*60)
+        if not args.stream:
+            print(resultado['resposta'])
+            print("="*60)
         
         # Output estruturado para integrar com PopeBot
         output = {
             'resposta': resultado['resposta'],
             'confianca': resultado['confianca'],
             'modo': resultado['modo'],
-            'tempo_ms': resultado['tempo_ms']
+            'tempo_ms': resultado['tempo_ms'],
+            'ttft_ms': resultado['ttft_ms']
         }
+        if 'roteador' in resultado:
+            output['roteador'] = resultado['roteador']
+        if 'especulacao' in resultado:
+            output['especulacao'] = resultado['especulacao']
+            esp = resultado['especulacao']
+            print(f"[Especulativo] Vencedor: {esp['vencedor'].upper()} | desperdicio: "
+                  f"{esp['tokens_desperdicados']} tokens em {esp['chamadas_descartadas']} chamada(s)")
+        if 'prazo' in resultado:
+            output['degradacoes'] = resultado['degradacoes']
+            output['prazo'] = resultado['prazo']
+        if rlm.cache is not None:
+            stats = rlm.cache.stats()
+            print(f"[Cache] Hits: {stats['hits_memoria']} memoria + {stats['hits_disco']} disco | Misses: {stats['misses']}")
+        if rlm.memo is not None:
+            stats = rlm.memo.stats()
+            print(f"[Memo] Sub-tarefas: {stats['hits']} hit(s) | {stats['misses']} miss(es) | "
+                  f"{stats['invalidados']} invalidada(s)")
+        metricas = rlm.metricas
+        if metricas['chamadas']:
+            print(f"[Prompt] {metricas['chamadas']} chamada(s) | prompt eval: {metricas['prompt_eval_count']} tokens, "
+                  f"{metricas['prompt_eval_ms']:.0f}ms ({metricas['prompt_eval_ms'] / metricas['chamadas']:.0f}ms/chamada) | "
+                  f"gerados: {metricas['eval_count']} tokens")
+        if metricas['load_ms']:
+            print(f"[Modelos] carga: {metricas['load_ms']:.0f}ms | {rlm.gerenciador.resumo()}")
         print("\n[JSON]", json.dumps(output, ensure_ascii=False))
         
     except KeyboardInterrupt:
@@ -349,3 +787,8 @@ if __name__ == "__main__":
         if args.verbose:
             traceback.print_exc()
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    from cli import main
+    main('smart', executar_cli)
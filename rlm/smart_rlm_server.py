@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Smart RLM Server - Processo persistente do SmartRLM
+
+Mantem UMA instancia de SmartRLM e um pool de conexoes keep-alive com o
+Ollama, e atende requests JSON via HTTP local ou Unix socket. Tira o
+spawn de interpretador (e o dispatch de workflow) do caminho de cada
+mensagem.
+
+Endpoints:
+    GET  /health  -> {"status": "ok", ...}
+    GET  /metrics -> metricas por etapa no formato texto do Prometheus
+    POST /chat    -> {"tarefa": str, "contexto": str, "stream": bool, "deadline_ms": int,
+                      "confianca": float, "modelo": str}
+                     Sem stream: o dict de SmartRLM.chat_completion
+                     (deadline_ms conta a partir da chegada, incluindo a fila;
+                     confianca/modelo valem so para o pedido, padrao: --confianca/--modelo)
+                     Com stream: NDJSON com os eventos de chat_completion_stream
+
+Uso:
+    python rlm/smart_rlm_server.py --porta 8765
+    python rlm/smart_rlm_server.py --socket /tmp/smart_rlm.sock
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import smart_rlm
+from smart_rlm import SmartRLM
+from telemetria import configurar as configurar_telemetria
+from modelos import parse_modelos
+from ollama_pool import OllamaPool, criar_cliente
+
+
+# ============= CONFIGURACAO =============
+server_workers_padrao = int(os.environ.get('RLM_SERVER_WORKERS', '4'))
+
+
+def criar_cliente_pool(host: str, max_conexoes: int) -> OllamaPool:
+    """
+    Client Ollama com pool keep-alive, compartilhado entre as threads.
+    As conexoes ficam abertas entre requests (sem handshake por chamada).
+    Com RLM_OLLAMA_HOSTS, um pool de conexoes por host.
+    """
+    import httpx
+    limites = httpx.Limits(
+        max_connections=max_conexoes,
+        max_keepalive_connections=max_conexoes,
+        keepalive_expiry=300
+    )
+    return criar_cliente(host, limits=limites)
+
+
+# ============= HTTP =============
+
+class SmartRLMHandler(BaseHTTPRequestHandler):
+    """Handler JSON do servidor SmartRLM."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        print(f"[Server] {self.command} {self.path} - {format % args}")
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, payload: dict):
+        linha = (json.dumps(payload, ensure_ascii=False) + '\n').encode('utf-8')
+        self.wfile.write(f'{len(linha):x}\r\n'.encode('ascii') + linha + b'\r\n')
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            texto = self.server.rlm.telemetria.prometheus()
+            if isinstance(smart_rlm.cliente_ollama, OllamaPool):
+                texto += smart_rlm.cliente_ollama.prometheus()
+            body = texto.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path != '/health':
+            self._send_json(404, {'error': 'not found'})
+            return
+        rlm = self.server.rlm
+        self._send_json(200, {
+            'status': 'ok',
+            'modelo': rlm.model,
+            'requests': rlm.call_count,
+            'cache': rlm.cache.stats() if rlm.cache is not None else None,
+            'memo': rlm.memo.stats() if rlm.memo is not None else None,
+            'hosts': smart_rlm.cliente_ollama.estado() if isinstance(smart_rlm.cliente_ollama, OllamaPool) else None
+        })
+
+    def do_POST(self):
+        if self.path != '/chat':
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        try:
+            tamanho = int(self.headers.get('Content-Length', 0))
+            req = json.loads(self.rfile.read(tamanho) or b'{}')
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {'error': f'JSON invalido: {e}'})
+            return
+
+        tarefa = req.get('tarefa') if isinstance(req, dict) else None
+        if not tarefa or not isinstance(tarefa, str):
+            self._send_json(400, {'error': 'campo "tarefa" obrigatorio'})
+            return
+        contexto = req.get('contexto') or ''
+        deadline_ms = req.get('deadline_ms')
+        if deadline_ms is not None and (isinstance(deadline_ms, bool) or not isinstance(deadline_ms, (int, float))
+                                        or deadline_ms <= 0):
+            self._send_json(400, {'error': 'campo "deadline_ms" deve ser um numero positivo'})
+            return
+        confianca = req.get('confianca')
+        if confianca is not None and (isinstance(confianca, bool) or not isinstance(confianca, (int, float))
+                                      or not 0 <= confianca <= 1):
+            self._send_json(400, {'error': 'campo "confianca" deve ser um numero entre 0 e 1'})
+            return
+        modelo = req.get('modelo')
+        if modelo is not None and (not isinstance(modelo, str) or not modelo.strip()):
+            self._send_json(400, {'error': 'campo "modelo" deve ser um nome de modelo'})
+            return
+        chegada = time.monotonic()
+
+        # Limita pipelines simultaneos; o resto espera na fila
+        with self.server.slots:
+            if req.get('stream'):
+                self._chat_stream(tarefa, contexto, confianca, modelo)
+                return
+            if deadline_ms is not None:
+                # O tempo na fila sai do prazo do pedido
+                deadline_ms = max(1, deadline_ms - (time.monotonic() - chegada) * 1000)
+            try:
+                resultado = self.server.rlm.chat_completion(tarefa, contexto, deadline_ms, confianca, modelo)
+            except Exception as e:
+                self._send_json(500, {'error': str(e), 'modo': 'error'})
+                return
+        self._send_json(200, resultado)
+
+    def _chat_stream(self, tarefa: str, contexto: str, confianca: float = None, modelo: str = None):
+        """Responde com NDJSON (chunked), um evento por linha."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        eventos = self.server.rlm.chat_completion_stream(tarefa, contexto, confianca, modelo)
+        try:
+            for evento in eventos:
+                self._write_chunk(evento)
+        except (BrokenPipeError, ConnectionResetError):
+            print("[Server] Cliente desconectou durante o stream")
+            return
+        except Exception as e:
+            self._write_chunk({'evento': 'erro', 'error': str(e), 'modo': 'error'})
+        finally:
+            eventos.close()
+        self.wfile.write(b'0\r\n\r\n')
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Mesmo servidor HTTP, mas escutando num Unix socket."""
+    daemon_threads = True
+
+
+def criar_servidor(rlm: SmartRLM, host: str = '127.0.0.1', porta: int = 8765,
+                   socket_path: str = None, workers: int = None):
+    """
+    Cria (sem iniciar) o servidor. Com socket_path usa Unix socket,
+    senao HTTP em host:porta (porta=0 deixa o SO escolher).
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, SmartRLMHandler)
+    else:
+        server = ThreadingHTTPServer((host, porta), SmartRLMHandler)
+        server.daemon_threads = True
+
+    server.rlm = rlm
+    server.slots = threading.BoundedSemaphore(workers or server_workers_padrao)
+    return server
+
+
+# ============= CLI =============
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Servidor persistente do SmartRLM (HTTP local ou Unix socket)"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Interface HTTP")
+    parser.add_argument("--porta", type=int, default=8765, help="Porta HTTP")
+    parser.add_argument("--socket", default=None, help="Caminho de Unix socket (substitui host/porta)")
+    parser.add_argument("--modelo", default="qwen3:4b", help="Modelo Ollama")
+    parser.add_argument(
+        "--confianca",
+        type=float,
+        default=0.90,
+        help="Threshold de confianca para early exit (0.0-1.0)"
+    )
+    parser.add_argument(
+        "--concorrencia",
+        type=int,
+        default=None,
+        help="Max. de sub-tarefas simultaneas por request"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Max. de requests processados ao mesmo tempo (padrao: RLM_SERVER_WORKERS ou 4)"
+    )
+    parser.add_argument(
+        "--modelos",
+        default=None,
+        help="Modelo por etapa, ex: fast=qwen3:0.6b,split=qwen3:0.6b (padrao: RLM_MODELS)"
+    )
+    parser.add_argument(
+        "--modelos-na-gpu",
+        type=int,
+        default=None,
+        help="Modelos que cabem juntos na GPU (padrao: RLM_MAX_LOADED_MODELS)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Desliga o cache de respostas"
+    )
+    args = parser.parse_args()
+    try:
+        modelos = parse_modelos(args.modelos) if args.modelos else None
+    except ValueError as e:
+        parser.error(str(e))
+
+    workers = args.workers or server_workers_padrao
+    # /metrics sempre disponivel; spans em JSONL so com RLM_TRACE
+    configurar_telemetria(ativa=True)
+    rlm = SmartRLM(
+        model=args.modelo,
+        max_concurrency=args.concorrencia,
+        usar_cache=not args.no_cache,
+        modelos=modelos
+    )
+    rlm.confidence_threshold = args.confianca
+    if args.modelos_na_gpu is not None:
+        rlm.gerenciador.capacidade = args.modelos_na_gpu
+
+    # Um pool de conexoes para todas as threads (requests x sub-tarefas)
+    smart_rlm.cliente_ollama = criar_cliente_pool(
+        smart_rlm.ollama_host,
+        max_conexoes=workers * max(1, rlm.max_concurrency)
+    )
+
+    # Processo longo: carrega os modelos da cascata antes do primeiro request
+    rlm.aquecer()
+
+    server = criar_servidor(rlm, args.host, args.porta, args.socket, workers)
+    endereco = args.socket or f"http://{args.host}:{server.server_address[1]}"
+    print(f"[Server] SmartRLM ({args.modelo}) ouvindo em {endereco} | workers: {workers}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[Server] Encerrado")
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
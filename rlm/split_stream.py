@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Split em streaming: plano JSON com schema + parser incremental
+
+A chamada de split pede ao Ollama saida estruturada (`format` com o
+JSON schema abaixo), entao a resposta e sempre
+{"subtasks": [{"tarefa": "...", "depende_de": [1]}, ...]} e nao precisa
+de regex nem de fallback por JSON quebrado. O parser le o stream de
+tokens e entrega cada sub-tarefa assim que o elemento do array fecha: o
+pipeline despacha a sub-tarefa enquanto o modelo ainda escreve as
+proximas (planejamento e execucao em paralelo; dependencias em dag.py).
+
+    parser = ParserSubtarefas()
+    for texto in stream:
+        for subtarefa, depende in parser.alimentar(texto):
+            despachar(subtarefa, depende)
+
+Elementos que sao so strings ("subtasks": ["...", ...]) tambem valem,
+sem dependencias.
+
+Sem schema (modelo/servidor antigo), texto antes do primeiro { (```json,
+explicacoes) e ignorado; um array solto no topo tambem vale como plano.
+"""
+
+import json
+
+
+SCHEMA_SPLIT = {
+    'type': 'object',
+    'properties': {
+        'subtasks': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'tarefa': {'type': 'string'},
+                    # Numeros (base 1) das sub-tarefas cuja resposta esta precisa
+                    'depende_de': {'type': 'array', 'items': {'type': 'integer', 'minimum': 1}},
+                },
+                'required': ['tarefa'],
+            },
+            'minItems': 1,
+        },
+    },
+    'required': ['subtasks'],
+}
+
+CHAVE_SUBTAREFAS = 'subtasks'
+
+
+def _dependencias(valor) -> tuple:
+    """depende_de (numeros base 1) -> indices base 0; o que nao for numero e ignorado."""
+    if not isinstance(valor, list):
+        valor = [valor]
+    indices = []
+    for item in valor:
+        try:
+            numero = int(item)
+        except (TypeError, ValueError):
+            continue
+        if numero >= 1:
+            indices.append(numero - 1)
+    return tuple(indices)
+
+
+def _normalizar(valor) -> tuple:
+    """Elemento do array -> (texto da sub-tarefa, dependencias); texto '' = ignorar."""
+    if isinstance(valor, str):
+        return valor.strip(), ()
+    if isinstance(valor, dict):
+        depende = _dependencias(valor.get('depende_de', []))
+        texto = valor.get('tarefa')
+        if isinstance(texto, str) and texto.strip():
+            return texto.strip(), depende
+        # Modelo sem schema as vezes manda [{"descricao": "..."}]
+        for item in valor.values():
+            if isinstance(item, str) and item.strip():
+                return item.strip(), depende
+        return '', ()
+    return ('' if valor is None else str(valor)), ()
+
+
+class ParserSubtarefas:
+    """
+    Parser JSON incremental que so acompanha o necessario: a pilha de
+    { e [, strings (com escapes) e o array de sub-tarefas.
+    """
+
+    def __init__(self):
+        self._pilha = []
+        self._em_string = False
+        self._escape = False
+        self._string = []          # string sendo lida (para achar a chave)
+        self._ultima_string = None  # ultima string completa no objeto raiz
+        self._nivel_alvo = None    # len(pilha) dentro do array de sub-tarefas
+        self._elemento = []        # texto cru do elemento atual do array
+        self.terminou = False      # array de sub-tarefas fechado
+        self.subtarefas = []
+        self.dependencias = []     # indices base 0, um item por sub-tarefa
+
+    def alimentar(self, texto: str) -> list:
+        """
+        Processa mais um pedaco do stream; retorna as sub-tarefas que
+        fecharam nele, como (texto, dependencias).
+        """
+        novas = []
+        for c in texto:
+            if self.terminou:
+                break
+            self._caractere(c, novas)
+        for subtarefa, depende in novas:
+            self.subtarefas.append(subtarefa)
+            self.dependencias.append(depende)
+        return novas
+
+    def _no_array(self) -> bool:
+        return self._nivel_alvo is not None and len(self._pilha) >= self._nivel_alvo
+
+    def _caractere(self, c: str, novas: list):
+        capturando = self._no_array() and (
+            self._em_string or len(self._pilha) > self._nivel_alvo or c not in ',] \t\r\n'
+        )
+        if capturando:
+            self._elemento.append(c)
+
+        if self._em_string:
+            if self._escape:
+                self._escape = False
+            elif c == '\\':
+                self._escape = True
+            elif c == '"':
+                self._em_string = False
+                if len(self._pilha) == 1 and self._pilha[0] == '{':
+                    self._ultima_string = ''.join(self._string)
+                if self._nivel_alvo is not None and len(self._pilha) == self._nivel_alvo:
+                    self._fechar_elemento(novas)
+                return
+            self._string.append(c)
+            return
+
+        if not self._pilha:
+            # Antes do JSON: ignora tudo ate o primeiro { (ou [ solto)
+            if c == '{':
+                self._pilha.append(c)
+            elif c == '[':
+                self._pilha.append(c)
+                self._nivel_alvo = 1
+            return
+
+        if c == '"':
+            self._em_string = True
+            self._string = []
+        elif c in '{[':
+            if (c == '[' and self._nivel_alvo is None and self._pilha == ['{']
+                    and self._ultima_string == CHAVE_SUBTAREFAS):
+                self._nivel_alvo = 2
+                self._pilha.append(c)
+                return
+            self._pilha.append(c)
+        elif c in '}]':
+            self._pilha.pop()
+            if self._nivel_alvo is None:
+                return
+            if len(self._pilha) == self._nivel_alvo:
+                self._fechar_elemento(novas)  # objeto/array dentro do array fechou
+            elif len(self._pilha) < self._nivel_alvo:
+                self._fechar_elemento(novas)  # escalar antes do ]
+                self.terminou = True
+        elif c == ',' and self._nivel_alvo is not None and len(self._pilha) == self._nivel_alvo:
+            self._fechar_elemento(novas)  # escalar (numero, null...)
+
+    def _fechar_elemento(self, novas: list):
+        bruto = ''.join(self._elemento).strip()
+        self._elemento = []
+        if not bruto:
+            return
+        try:
+            subtarefa, depende = _normalizar(json.loads(bruto))
+        except ValueError:
+            return
+        if subtarefa:
+            novas.append((subtarefa, depende))
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Telemetria por etapa do pipeline RLM
+
+Cada chamada ao Ollama vira um span com a etapa (fast, split, subtask,
+map, reduce, aggregate), o tempo de parede e os contadores que o proprio
+Ollama devolve (prompt_eval_count, eval_count, prompt_eval_duration,
+eval_duration, load_duration). Cada chat_completion vira um span raiz
+com o mesmo trace.
+
+Saidas:
+- RLM_TRACE=arquivo.jsonl      spans em JSONL (um por linha, append)
+- RLM_METRICS_FILE=arquivo.prom metricas no formato texto do Prometheus
+  (para o textfile collector do node_exporter), gravado no fim da execucao
+- GET /metrics no smart_rlm_server
+
+Desligada (sem RLM_TRACE/RLM_METRICS_FILE e fora do servidor), cada
+chamada custa um `if` num atributo booleano.
+"""
+
+import os
+import json
+import atexit
+import time
+import threading
+import contextvars
+from collections import defaultdict
+
+
+# ============= CONFIGURACAO =============
+trace_path_padrao = os.environ.get('RLM_TRACE', '')
+metricas_path_padrao = os.environ.get('RLM_METRICS_FILE', '')
+
+# Limites dos buckets do histograma de tempo (segundos)
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# load_duration a partir do qual a chamada conta como carga de modelo (s)
+LIMIAR_CARGA = 0.05
+
+_trace_atual = contextvars.ContextVar('rlm_trace', default=None)
+
+# Contadores do Ollama (ns para duracoes) -> nome da metrica
+_CONTADORES = (
+    ('prompt_eval_count', 'rlm_prompt_eval_tokens_total', 1),
+    ('eval_count', 'rlm_eval_tokens_total', 1),
+    ('prompt_eval_duration', 'rlm_prompt_eval_seconds_total', 1e-9),
+    ('eval_duration', 'rlm_eval_seconds_total', 1e-9),
+    ('load_duration', 'rlm_load_seconds_total', 1e-9),
+)
+
+
+class _Histograma:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        for i, limite in enumerate(BUCKETS):
+            if valor <= limite:
+                self.buckets[i] += 1
+        self.soma += valor
+        self.total += 1
+
+
+class Telemetria:
+    """
+    Coleta spans e agrega metricas, thread-safe.
+
+    Uso no RLM:
+        trace = tel.iniciar('chat_completion')      # span raiz
+        tel.registrar('subtask', modelo, inicio, resposta_do_ollama)
+        tel.finalizar(trace, modo='full')
+    """
+
+    def __init__(self, trace_path: str = None, metricas_path: str = None, ativa: bool = False):
+        self.trace_path = trace_path or None
+        self.metricas_path = metricas_path or None
+        self.ativa = bool(ativa or self.trace_path or self.metricas_path)
+
+        self._lock = threading.Lock()
+        self._arquivo = open(self.trace_path, 'a', encoding='utf-8') if self.trace_path else None
+        self._chamadas = defaultdict(int)       # (etapa, resultado) -> n
+        self._contadores = defaultdict(float)   # (metrica, etapa) -> valor
+        self._tempos = defaultdict(_Histograma)  # etapa -> histograma
+        self._pedidos = defaultdict(int)        # modo -> n
+        self._cargas = defaultdict(int)         # modelo -> cargas
+        self._tempo_cargas = defaultdict(float)  # modelo -> segundos
+        self._tempo_pedidos = _Histograma()
+
+    # ----- spans -----
+
+    def iniciar(self, nome: str):
+        """Abre um trace (span raiz). Retorna um handle para finalizar()."""
+        if not self.ativa:
+            return None
+        trace_id = os.urandom(8).hex()
+        return {
+            'nome': nome,
+            'trace': trace_id,
+            'inicio': time.time(),
+            'perf': time.perf_counter(),
+            'token': _trace_atual.set(trace_id),
+        }
+
+    def finalizar(self, handle, **atributos):
+        """Fecha o span raiz aberto por iniciar()."""
+        if handle is None:
+            return
+        wall = time.perf_counter() - handle['perf']
+        try:
+            _trace_atual.reset(handle['token'])
+        except ValueError:
+            pass  # finalizado em outro contexto (ex: generator consumido em outra thread)
+        with self._lock:
+            self._pedidos[atributos.get('modo') or 'full'] += 1
+            self._tempo_pedidos.observar(wall)
+        self._emitir({
+            'trace': handle['trace'],
+            'etapa': handle['nome'],
+            'inicio': handle['inicio'],
+            'wall_ms': round(wall * 1000, 2),
+            **atributos,
+        })
+
+    def registrar(self, etapa: str, modelo: str, inicio: float, resposta=None,
+                  cache: str = None, erro: str = None, cancelado: bool = False,
+                  **atributos):
+        """
+        Registra uma chamada de generate. `inicio` = time.perf_counter()
+        antes da chamada; `resposta` = dict do Ollama (ou chunk final do
+        stream). resultado: ollama, hit (cache), memo (memo de sub-tarefas),
+        erro ou cancelado.
+        """
+        if not self.ativa:
+            return
+        wall = time.perf_counter() - inicio
+        if erro:
+            resultado = 'erro'
+        elif cancelado:
+            resultado = 'cancelado'
+        else:
+            resultado = cache or 'ollama'
+        span = {
+            'trace': _trace_atual.get(),
+            'etapa': etapa,
+            'modelo': modelo,
+            'inicio': time.time() - wall,
+            'wall_ms': round(wall * 1000, 2),
+            'resultado': resultado,
+            **atributos,
+        }
+
+        with self._lock:
+            self._chamadas[(etapa, resultado)] += 1
+            self._tempos[etapa].observar(wall)
+            if resposta is not None:
+                for campo, metrica, escala in _CONTADORES:
+                    valor = resposta.get(campo) or 0
+                    span[campo] = valor
+                    self._contadores[(metrica, etapa)] += valor * escala
+                carga = (resposta.get('load_duration') or 0) * 1e-9
+                if carga >= LIMIAR_CARGA:
+                    self._cargas[modelo] += 1
+                    self._tempo_cargas[modelo] += carga
+        if erro:
+            span['erro'] = erro
+        self._emitir(span)
+
+    def _emitir(self, span: dict):
+        if self._arquivo is None:
+            return
+        linha = json.dumps(span, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._arquivo.write(linha)
+            self._arquivo.flush()
+
+    # ----- Prometheus -----
+
+    def prometheus(self) -> str:
+        """Metricas agregadas no formato texto do Prometheus."""
+        linhas = []
+        with self._lock:
+            linhas += [
+                '# HELP rlm_generate_total Chamadas de generate por etapa e resultado (ollama, hit, erro, cancelado).',
+                '# TYPE rlm_generate_total counter',
+            ]
+            for (etapa, resultado), n in sorted(self._chamadas.items()):
+                linhas.append(f'rlm_generate_total{{etapa="{etapa}",resultado="{resultado}"}} {n}')
+
+            for _, metrica, _ in _CONTADORES:
+                linhas.append(f'# TYPE {metrica} counter')
+                for (nome, etapa), valor in sorted(self._contadores.items()):
+                    if nome == metrica:
+                        linhas.append(f'{metrica}{{etapa="{etapa}"}} {valor:g}')
+
+            linhas += [
+                '# HELP rlm_generate_seconds Tempo de parede de cada generate.',
+                '# TYPE rlm_generate_seconds histogram',
+            ]
+            for etapa, hist in sorted(self._tempos.items()):
+                linhas += _linhas_histograma('rlm_generate_seconds', hist, f'etapa="{etapa}",')
+
+            linhas += [
+                '# HELP rlm_model_loads_total Chamadas em que o Ollama teve que carregar o modelo.',
+                '# TYPE rlm_model_loads_total counter',
+            ]
+            for modelo, n in sorted(self._cargas.items()):
+                linhas.append(f'rlm_model_loads_total{{modelo="{modelo}"}} {n}')
+            linhas += ['# TYPE rlm_model_load_seconds_total counter']
+            for modelo, valor in sorted(self._tempo_cargas.items()):
+                linhas.append(f'rlm_model_load_seconds_total{{modelo="{modelo}"}} {valor:g}')
+
+            linhas += ['# TYPE rlm_requests_total counter']
+            for modo, n in sorted(self._pedidos.items()):
+                linhas.append(f'rlm_requests_total{{modo="{modo}"}} {n}')
+            linhas += ['# TYPE rlm_request_seconds histogram']
+            linhas += _linhas_histograma('rlm_request_seconds', self._tempo_pedidos, '')
+        return '\n'.join(linhas) + '\n'
+
+    def salvar_metricas(self, path: str = None):
+        """Grava o texto Prometheus (atomico, para o textfile collector)."""
+        path = path or self.metricas_path
+        if not path:
+            return
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+    def close(self):
+        if self.metricas_path:
+            self.salvar_metricas()
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+
+def _linhas_histograma(nome: str, hist: _Histograma, rotulos: str) -> list:
+    linhas = [
+        f'{nome}_bucket{{{rotulos}le="{limite:g}"}} {n}'
+        for limite, n in zip(BUCKETS, hist.buckets)
+    ]
+    linhas.append(f'{nome}_bucket{{{rotulos}le="+Inf"}} {hist.total}')
+    rotulos = rotulos.rstrip(',')
+    sufixo = f'{{{rotulos}}}' if rotulos else ''
+    linhas.append(f'{nome}_sum{sufixo} {hist.soma:g}')
+    linhas.append(f'{nome}_count{sufixo} {hist.total}')
+    return linhas
+
+
+_telemetria = None
+_telemetria_lock = threading.Lock()
+
+
+@atexit.register
+def _fechar():
+    # Garante o arquivo .prom no fim de qualquer execucao dos CLIs
+    if _telemetria is not None:
+        _telemetria.close()
+
+
+def telemetria_padrao() -> Telemetria:
+    """Telemetria do processo (RLM_TRACE / RLM_METRICS_FILE)."""
+    global _telemetria
+    with _telemetria_lock:
+        if _telemetria is None:
+            _telemetria = Telemetria(trace_path_padrao, metricas_path_padrao)
+        return _telemetria
+
+
+def configurar(trace_path: str = None, metricas_path: str = None, ativa: bool = False) -> Telemetria:
+    """Substitui a telemetria do processo (usado pelas flags dos CLIs e pelo servidor)."""
+    global _telemetria
+    with _telemetria_lock:
+        if _telemetria is not None:
+            _telemetria.close()
+        _telemetria = Telemetria(
+            trace_path or trace_path_padrao, metricas_path or metricas_path_padrao, ativa
+        )
+        return _telemetria
@@ -0,0 +1,106 @@
+#!/bin/bash
+# Test script para o smart_rlm_server (contra o Fake Ollama, sem GPU)
+#
+# Uso (da raiz do repo):
+#   bash rlm/test_server.sh
+#   PYTHON=.venv/bin/python PORTA_SERVIDOR=8799 bash rlm/test_server.sh
+
+PYTHON=${PYTHON:-python}
+PORTA_OLLAMA=${PORTA_OLLAMA:-11499}
+PORTA_SERVIDOR=${PORTA_SERVIDOR:-8799}
+URL="http://127.0.0.1:$PORTA_SERVIDOR"
+LOGS=$(mktemp -d)
+FALHAS=0
+
+encerrar() {
+  kill $PID_SERVIDOR $PID_OLLAMA 2>/dev/null
+  wait $PID_SERVIDOR $PID_OLLAMA 2>/dev/null
+  rm -rf "$LOGS"
+}
+trap encerrar EXIT
+
+# checar <nome> <esperado> <obtido>
+checar() {
+  if [ "$2" == "$3" ]; then
+    echo "  [OK] $1"
+  else
+    echo "  [FALHOU] $1: esperado '$2', obtido '$3'"
+    FALHAS=$((FALHAS + 1))
+  fi
+}
+
+# campo <json> <expressao python sobre d>
+campo() {
+  echo "$1" | $PYTHON -c "import json, sys; d = json.load(sys.stdin); print($2)"
+}
+
+# post <corpo> -> "<status> <corpo da resposta>"
+post() {
+  curl -s -o "$LOGS/resposta" -w '%{http_code}' -X POST "$URL/chat" -d "$1"
+}
+
+echo "=== SmartRLM Server Test Suite ==="
+echo ""
+
+# Sem cache, memo nem log de rotas: cada teste chama o Fake Ollama de verdade
+export RLM_CACHE=0 RLM_MEMO=0 RLM_ROUTER=0
+export OLLAMA_HOST="http://127.0.0.1:$PORTA_OLLAMA"
+
+$PYTHON rlm/fake_ollama.py --porta $PORTA_OLLAMA > "$LOGS/ollama.log" 2>&1 &
+PID_OLLAMA=$!
+$PYTHON rlm/smart_rlm_server.py --porta $PORTA_SERVIDOR --modelo qwen3:4b > "$LOGS/servidor.log" 2>&1 &
+PID_SERVIDOR=$!
+
+for _ in $(seq 50); do
+  curl -s "$URL/health" > /dev/null && break
+  sleep 0.2
+done
+
+echo "[TEST 1] GET /health"
+SAUDE=$(curl -s "$URL/health")
+checar "status" "ok" "$(campo "$SAUDE" "d['status']")"
+checar "modelo" "qwen3:4b" "$(campo "$SAUDE" "d['modelo']")"
+
+echo ""
+echo "[TEST 2] POST /chat (pergunta simples -> fast path)"
+checar "HTTP" "200" "$(post '{"tarefa": "O que e Docker?"}')"
+checar "modo" "fast" "$(campo "$(cat "$LOGS/resposta")" "d['modo']")"
+
+echo ""
+echo "[TEST 3] POST /chat (pergunta complexa -> RLM completo)"
+checar "HTTP" "200" "$(post '{"tarefa": "Analise este log e liste todas as causas provaveis dos erros", "contexto": "ERRO: disco cheio\nERRO: timeout"}')"
+checar "modo" "full" "$(campo "$(cat "$LOGS/resposta")" "d['modo']")"
+
+echo ""
+echo "[TEST 4] POST /chat com confianca e modelo do pedido"
+checar "HTTP" "200" "$(post '{"tarefa": "O que e Docker?", "confianca": 0.99, "modelo": "qwen3:0.6b"}')"
+checar "modo (threshold 0.99 > 0.95 do fast path)" "full" "$(campo "$(cat "$LOGS/resposta")" "d['modo']")"
+
+echo ""
+echo "[TEST 5] POST /chat com stream (NDJSON)"
+curl -s -N -X POST "$URL/chat" -d '{"tarefa": "O que e Kubernetes?", "stream": true}' > "$LOGS/stream"
+checar "tem tokens" "True" "$($PYTHON -c "import json; e = [json.loads(l) for l in open('$LOGS/stream')]; print(any(x['evento'] == 'token' for x in e))")"
+checar "ultimo evento" "resultado" "$($PYTHON -c "import json; print(json.loads(open('$LOGS/stream').read().splitlines()[-1])['evento'])")"
+
+echo ""
+echo "[TEST 6] Pedidos invalidos -> 400"
+checar "JSON invalido" "400" "$(post '{tarefa')"
+checar "sem tarefa" "400" "$(post '{"contexto": "x"}')"
+checar "deadline_ms negativo" "400" "$(post '{"tarefa": "Oi", "deadline_ms": -1}')"
+checar "confianca fora de 0-1" "400" "$(post '{"tarefa": "Oi", "confianca": 2}')"
+checar "modelo vazio" "400" "$(post '{"tarefa": "Oi", "modelo": ""}')"
+checar "rota inexistente" "404" "$(curl -s -o /dev/null -w '%{http_code}' -X POST "$URL/nada" -d '{}')"
+
+echo ""
+echo "[TEST 7] GET /metrics"
+curl -s "$URL/metrics" > "$LOGS/metrics"
+checar "rlm_generate_total" "1" "$(grep -c '^# TYPE rlm_generate_total counter' "$LOGS/metrics")"
+checar "chamadas do fast path" "True" "$(grep -q 'rlm_generate_total{etapa="fast",resultado="ollama"}' "$LOGS/metrics" && echo True)"
+
+echo ""
+if [ $FALHAS -ne 0 ]; then
+  echo "=== $FALHAS teste(s) falharam (fim do log do servidor abaixo) ==="
+  tail -20 "$LOGS/servidor.log"
+  exit 1
+fi
+echo "=== Tests Complete ==="